@@ -0,0 +1,189 @@
+import hashlib
+import os
+import string
+import threading
+from sqlalchemy.exc import IntegrityError
+from models import db, Url, CodeCounter
+from utils import generate_short_code
+
+BASE62 = string.ascii_letters + string.digits
+
+def base62_encode(n, width):
+    """Encode a non-negative integer as exactly `width` base62 characters"""
+    chars = []
+    for _ in range(width):
+        n, digit = divmod(n, 62)
+        chars.append(BASE62[digit])
+    if n:
+        raise ValueError('value does not fit in the requested width')
+    return ''.join(reversed(chars))
+
+def base62_decode(code):
+    n = 0
+    for char in code:
+        n = n * 62 + BASE62.index(char)
+    return n
+
+
+class FeistelScrambler:
+    """Keyed bijection on [0, 62**width) so sequential IDs do not look sequential.
+
+    A balanced Feistel network permutes the smallest even-bit-width range
+    covering the domain, and cycle-walking maps the result back inside it.
+    The key must never change once codes have been issued with it.
+    """
+
+    def __init__(self, key, rounds=4):
+        key = key.encode() if isinstance(key, str) else key
+        self.key = hashlib.sha256(key).digest()
+        self.rounds = rounds
+
+    def _round(self, i, value, half_bits):
+        digest = hashlib.blake2b(value.to_bytes(8, 'big'), digest_size=8, key=self.key, salt=bytes([i]) * 16).digest()
+        return int.from_bytes(digest, 'big') & ((1 << half_bits) - 1)
+
+    def _feistel(self, n, half_bits, reverse=False):
+        mask = (1 << half_bits) - 1
+        left, right = n >> half_bits, n & mask
+        rounds = range(self.rounds - 1, -1, -1) if reverse else range(self.rounds)
+        for i in rounds:
+            if reverse:
+                left, right = right ^ self._round(i, left, half_bits), left
+            else:
+                left, right = right, left ^ self._round(i, right, half_bits)
+        return (left << half_bits) | right
+
+    def permute(self, n, width, reverse=False):
+        domain = 62 ** width
+        half_bits = ((domain - 1).bit_length() + 1) // 2
+        n = self._feistel(n, half_bits, reverse)
+        while n >= domain:
+            n = self._feistel(n, half_bits, reverse)
+        return n
+
+    def unpermute(self, n, width):
+        return self.permute(n, width, reverse=True)
+
+
+class CodeAllocator:
+    """Base class for short code allocation strategies"""
+
+    def allocate(self):
+        return self.allocate_many(1)[0]
+
+    def allocate_many(self, count):
+        raise NotImplementedError
+
+    def reset(self):
+        """Drop any locally reserved state"""
+
+
+class RandomAllocator(CodeAllocator):
+    """Random codes checked against the database, retrying on collision"""
+
+    def __init__(self, length=6):
+        self.length = length
+
+    def allocate_many(self, count):
+        codes = set()
+        while len(codes) < count:
+            candidates = {generate_short_code(self.length) for _ in range(count - len(codes))} - codes
+            taken = {
+                code for code, in db.session.execute(
+                    db.select(Url.short_code).where(Url.short_code.in_(candidates))
+                )
+            }
+            codes |= candidates - taken
+        return list(codes)
+
+
+class BlockAllocator(CodeAllocator):
+    """Collision-free codes from ID blocks leased off a shared counter.
+
+    Each process leases `block_size` IDs at a time with one atomic UPDATE on
+    the CodeCounter row and hands them out locally without touching the
+    database. IDs are base62-encoded at `min_length` characters, growing a
+    character once that width is exhausted, and optionally passed through a
+    FeistelScrambler first.
+    """
+
+    def __init__(self, block_size=1000, min_length=6, scrambler=None, counter_name='short_code'):
+        self.block_size = block_size
+        self.min_length = min_length
+        self.scrambler = scrambler
+        self.counter_name = counter_name
+        self._lock = threading.Lock()
+        self._next = self._end = 0
+        self._pid = None
+
+    def allocate_many(self, count):
+        with self._lock:
+            # A forked worker must not reuse its parent's leased block
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._next = self._end = 0
+            ids = []
+            while len(ids) < count:
+                if self._next >= self._end:
+                    self._next, self._end = self._lease(max(self.block_size, count - len(ids)))
+                take = min(count - len(ids), self._end - self._next)
+                ids.extend(range(self._next, self._next + take))
+                self._next += take
+        return [self.encode(n) for n in ids]
+
+    def reset(self):
+        # Unused IDs of the current block are simply skipped
+        with self._lock:
+            self._next = self._end = 0
+
+    def encode(self, n):
+        width = self.min_length
+        while n >= 62 ** width:
+            width += 1
+        if self.scrambler is not None:
+            n = self.scrambler.permute(n, width)
+        return base62_encode(n, width)
+
+    def _lease(self, size):
+        """Atomically reserve [start, start + size) from the shared counter"""
+        counter = CodeCounter.__table__
+        while True:
+            with db.engine.begin() as conn:
+                stmt = (
+                    db.update(counter)
+                    .where(counter.c.name == self.counter_name)
+                    .values(next_value=counter.c.next_value + size)
+                )
+                if conn.dialect.update_returning:
+                    end = conn.execute(stmt.returning(counter.c.next_value)).scalar()
+                elif conn.execute(stmt).rowcount:
+                    end = conn.execute(
+                        db.select(counter.c.next_value).where(counter.c.name == self.counter_name)
+                    ).scalar()
+                else:
+                    end = None
+                if end is not None:
+                    return end - size, end
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(db.insert(counter).values(name=self.counter_name, next_value=size))
+                return 0, size
+            except IntegrityError:
+                # Another process created the counter first; lease from it
+                continue
+
+
+def make_allocator(config):
+    """Build the allocator selected by CODE_ALLOCATOR ('block' or 'random')"""
+    length = int(config.get('SHORT_CODE_LENGTH', 6))
+    if config.get('CODE_ALLOCATOR', 'block') == 'random':
+        return RandomAllocator(length)
+    scrambler = None
+    if config.get('SHORT_CODE_SCRAMBLE', True):
+        # Falls back to SECRET_KEY, which then must not be rotated either
+        scrambler = FeistelScrambler(config.get('SHORT_CODE_KEY') or config['SECRET_KEY'])
+    return BlockAllocator(
+        block_size=int(config.get('CODE_BLOCK_SIZE', 1000)),
+        min_length=length,
+        scrambler=scrambler
+    )
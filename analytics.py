@@ -0,0 +1,329 @@
+"""Click analytics over arbitrary time ranges.
+
+A query counts a Url's clicks per time bucket (minute, hour, day or week),
+optionally split by a dimension such as referrer. Ranges aligned to hours or
+days without a split are answered from the rollup tables; everything else
+is aggregated by the database with GROUP BY over the raw clicks. Account
+summaries across all of a user's links always read the rollups.
+"""
+from datetime import timedelta
+from sqlalchemy import case, func, literal
+from models import db, Url, Click, ClickRollupHourly, ClickRollupDaily, UserAgent, Referrer
+import interning
+import rollups
+from hll import HyperLogLog
+from utils import parse_time_range
+
+GRANULARITIES = {
+    'minute': timedelta(minutes=1),
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+    'week': timedelta(weeks=1),
+}
+
+# Rollup table able to answer each granularity
+ROLLUP_SOURCES = {
+    'hour': ('hour', ClickRollupHourly),
+    'day': ('day', ClickRollupDaily),
+    'week': ('day', ClickRollupDaily),
+}
+
+# Bucket labels, as produced by strftime on SQLite
+LABEL_FORMATS = {
+    'minute': '%Y-%m-%dT%H:%M',
+    'hour': '%Y-%m-%dT%H:00',
+    'day': '%Y-%m-%d',
+    'week': '%Y-%m-%d',
+}
+
+POSTGRES_LABEL_FORMATS = {
+    'minute': 'YYYY-MM-DD"T"HH24:MI',
+    'hour': 'YYYY-MM-DD"T"HH24:00',
+    'day': 'YYYY-MM-DD',
+    'week': 'YYYY-MM-DD',
+}
+
+# Substrings of the User-Agent header checked in order; the first match
+# names the family. Edge and Opera include "Chrome", Chrome includes "Safari".
+USER_AGENT_FAMILIES = [
+    ('%bot%', 'Bot'),
+    ('%spider%', 'Bot'),
+    ('%Edg/%', 'Edge'),
+    ('%OPR/%', 'Opera'),
+    ('%Chrome/%', 'Chrome'),
+    ('%Firefox/%', 'Firefox'),
+    ('%Safari/%', 'Safari'),
+    ('%MSIE %', 'Internet Explorer'),
+    ('%Trident/%', 'Internet Explorer'),
+    ('curl/%', 'curl'),
+]
+
+DEFAULT_DAYS = 7
+DEFAULT_GROUP_LIMIT = 10
+MAX_GROUP_LIMIT = 100
+
+
+def floor(dt, granularity):
+    """Start of the bucket containing `dt`; weeks start on Monday"""
+    if granularity == 'minute':
+        return dt.replace(second=0, microsecond=0)
+    if granularity == 'hour':
+        return dt.replace(minute=0, second=0, microsecond=0)
+    day = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def bucket_starts(start, end, granularity):
+    step = GRANULARITIES[granularity]
+    current = floor(start, granularity)
+    while current < end:
+        yield current
+        current += step
+
+
+def user_agent_family():
+    """SQL expression mapping a click's User-Agent to a browser family"""
+    return case(
+        (UserAgent.value.is_(None), literal('Unknown')),
+        *((UserAgent.value.ilike(pattern), literal(family)) for pattern, family in USER_AGENT_FAMILIES),
+        else_=literal('Other')
+    )
+
+
+def dimensions():
+    """Dimensions accepted by group_by, as SQL expressions over Click and
+    its lookup tables (interning.join_lookups)"""
+    return {
+        'referrer': func.coalesce(Referrer.value, '(direct)'),
+        'user_agent_family': user_agent_family(),
+        # Columns filled in by the enrichment worker; clicks it has not
+        # reached yet count as unknown (or direct)
+        'country': func.coalesce(Click.country, '(unknown)'),
+        'device': func.coalesce(Click.device, '(unknown)'),
+        'browser': func.coalesce(Click.browser, '(unknown)'),
+        'referrer_domain': func.coalesce(Click.referrer_domain, '(direct)'),
+    }
+
+
+def bucket_label(granularity, session):
+    """SQL expression labelling a click with its bucket, like LABEL_FORMATS"""
+    dialect = session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return func.to_char(func.date_trunc(granularity, Click.clicked_at), POSTGRES_LABEL_FORMATS[granularity])
+    if granularity == 'week':
+        # Move to the following Sunday (or stay on it), then back to Monday
+        return func.strftime('%Y-%m-%d', Click.clicked_at, 'weekday 0', '-6 days')
+    return func.strftime(LABEL_FORMATS[granularity], Click.clicked_at)
+
+
+def parse_params(args, now, max_buckets=1500):
+    """Validate request arguments into keyword arguments for run().
+
+    Raises ValueError with a message for the client on invalid input.
+    """
+    granularity = args.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+    group_by = args.get('group_by') or None
+    if group_by is not None and group_by not in dimensions():
+        raise ValueError(f"group_by must be one of {', '.join(dimensions())}")
+    try:
+        limit = int(args.get('limit', DEFAULT_GROUP_LIMIT))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+
+    start, end = parse_time_range(args.get('from'), args.get('to'))
+    if end is None:
+        end = floor(now, 'day') + timedelta(days=1)
+    if start is None:
+        start = end - timedelta(days=DEFAULT_DAYS)
+    if start >= end:
+        raise ValueError('"from" must be before "to"')
+    if (end - start) / GRANULARITIES[granularity] > max_buckets:
+        raise ValueError(f'range spans more than {max_buckets} {granularity} buckets')
+
+    return {
+        'start': start,
+        'end': end,
+        'granularity': granularity,
+        'group_by': group_by,
+        'limit': max(1, min(limit, MAX_GROUP_LIMIT)),
+    }
+
+
+def run(url_id, start, end, granularity='day', group_by=None, limit=DEFAULT_GROUP_LIMIT, session=None):
+    """Count a Url's clicks per bucket of [start, end).
+
+    Returns a dict with the bucket labels ('dates'), click counts per bucket,
+    total and unique clicks and, when grouped, the top `limit` groups with
+    their own series. Queries run on `session`, by default the Flask app's.
+    """
+    session = session or db.session
+    starts = list(bucket_starts(start, end, granularity))
+    labels = [bucket.strftime(LABEL_FORMATS[granularity]) for bucket in starts]
+    result = {
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'granularity': granularity,
+        'dates': labels,
+    }
+
+    source = ROLLUP_SOURCES.get(granularity)
+    if group_by is None and source and start == floor(start, source[0]) and end == floor(end, source[0]):
+        counts, unique = _from_rollups(session, url_id, start, end, granularity, source[1])
+    else:
+        counts, unique = _from_clicks(session, url_id, start, end, granularity)
+    result['counts'] = [counts.get(label, 0) for label in labels]
+    result['total_clicks'] = sum(result['counts'])
+    result['unique_clicks'] = unique
+
+    if group_by is not None:
+        result['group_by'] = group_by
+        result['groups'] = _groups(session, url_id, start, end, granularity, group_by, limit, labels)
+    return result
+
+
+def _in_range(url_id, start, end):
+    return (Click.url_id == url_id) & (Click.clicked_at >= start) & (Click.clicked_at < end)
+
+
+def _from_rollups(session, url_id, start, end, granularity, model):
+    rows = session.execute(
+        db.select(model.bucket_start, model.clicks, model.visitor_sketch)
+        .where(model.url_id == url_id, model.bucket_start >= start, model.bucket_start < end)
+    ).all()
+    counts = {}
+    for bucket, clicks, _ in rows:
+        label = floor(bucket, granularity).strftime(LABEL_FORMATS[granularity])
+        counts[label] = counts.get(label, 0) + clicks
+    return counts, rollups.merged_sketch(sketch for _, _, sketch in rows).count()
+
+
+def _from_clicks(session, url_id, start, end, granularity):
+    label = bucket_label(granularity, session)
+    counts = dict(session.execute(
+        db.select(label, func.count()).where(_in_range(url_id, start, end)).group_by(label)
+    ).all())
+    unique = session.execute(
+        db.select(func.count(Click.ip_address.distinct())).where(_in_range(url_id, start, end))
+    ).scalar()
+    return counts, unique
+
+
+def _groups(session, url_id, start, end, granularity, group_by, limit, labels):
+    dimension = dimensions()[group_by]
+    top = session.execute(
+        interning.join_lookups(db.select(dimension, func.count(), func.count(Click.ip_address.distinct())))
+        .where(_in_range(url_id, start, end))
+        .group_by(dimension)
+        .order_by(func.count().desc(), dimension)
+        .limit(limit)
+    ).all()
+    if not top:
+        return []
+
+    label = bucket_label(granularity, session)
+    series = {}
+    for key, bucket, clicks in session.execute(
+        interning.join_lookups(db.select(dimension, label, func.count()))
+        .where(_in_range(url_id, start, end), dimension.in_([key for key, _, _ in top]))
+        .group_by(dimension, label)
+    ):
+        series.setdefault(key, {})[bucket] = clicks
+    return [
+        {
+            'key': key,
+            'total_clicks': clicks,
+            'unique_clicks': unique,
+            'counts': [series.get(key, {}).get(bucket, 0) for bucket in labels],
+        }
+        for key, clicks, unique in top
+    ]
+
+
+def account_params(args, now):
+    """parse_params() for account summaries, which have no minute buckets or splits"""
+    if args.get('group_by'):
+        raise ValueError('group_by is not supported for account analytics')
+    params = parse_params(args, now)
+    if params['granularity'] not in ROLLUP_SOURCES:
+        raise ValueError(f"granularity must be one of {', '.join(ROLLUP_SOURCES)}")
+    del params['group_by']
+    return params
+
+
+def account_summary(user_id, start, end, granularity='day', limit=DEFAULT_GROUP_LIMIT, session=None):
+    """Totals, a click series and the top links across all of a user's Urls.
+
+    The range is widened to whole rollup buckets. Series and top links are
+    summed by the database; unique visitors merge the visitor sketches of
+    the rollup rows in the window, so a visitor of several links is counted
+    once. Queries run on `session`, by default the Flask app's.
+    """
+    session = session or db.session
+    unit, model = ROLLUP_SOURCES[granularity]
+    start = floor(start, unit)
+    if end != floor(end, unit):
+        end = floor(end, unit) + GRANULARITIES[unit]
+    labels = [bucket.strftime(LABEL_FORMATS[granularity]) for bucket in bucket_starts(start, end, granularity)]
+    in_window = (
+        (Url.user_id == user_id) & Url.deleted_at.is_(None)
+        & (model.bucket_start >= start) & (model.bucket_start < end)
+    )
+
+    counts = {}
+    for bucket, clicks in session.execute(
+        db.select(model.bucket_start, func.sum(model.clicks))
+        .join(Url, model.url_id == Url.id)
+        .where(in_window)
+        .group_by(model.bucket_start)
+    ):
+        label = floor(bucket, granularity).strftime(LABEL_FORMATS[granularity])
+        counts[label] = counts.get(label, 0) + clicks
+
+    top = session.execute(
+        db.select(Url.id, Url.short_code, Url.original_url, func.sum(model.clicks).label('clicks'))
+        .join(model, model.url_id == Url.id)
+        .where(in_window)
+        .group_by(Url.id, Url.short_code, Url.original_url)
+        .order_by(func.sum(model.clicks).desc(), Url.id)
+        .limit(limit)
+    ).all()
+
+    window = HyperLogLog()
+    per_link = {row.id: HyperLogLog() for row in top}
+    for url_id, sketch in session.execute(
+        db.select(model.url_id, model.visitor_sketch).join(Url, model.url_id == Url.id).where(in_window)
+    ):
+        window.merge_bytes(sketch)
+        if url_id in per_link:
+            per_link[url_id].merge_bytes(sketch)
+
+    links, total_clicks, unique_visitors = rollups.account_totals(user_id, session)
+    series = [counts.get(label, 0) for label in labels]
+    return {
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'granularity': granularity,
+        'totals': {
+            'links': links,
+            'clicks': total_clicks,
+            'unique_visitors': unique_visitors,
+            'window_clicks': sum(series),
+            'window_unique_visitors': window.count(),
+        },
+        'dates': labels,
+        'counts': series,
+        'top_links': [
+            {
+                'id': row.id,
+                'short_code': row.short_code,
+                'original_url': row.original_url,
+                'clicks': row.clicks,
+                'unique_visitors': per_link[row.id].count(),
+            }
+            for row in top
+        ],
+    }
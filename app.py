@@ -3,23 +3,45 @@ import string
 import random
 from datetime import datetime, timedelta
 from functools import wraps
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, abort
+from contextlib import contextmanager
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, session, jsonify, abort, stream_with_context
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from limits import parse_many
 from werkzeug.security import generate_password_hash, check_password_hash
 from dotenv import load_dotenv
-import stripe
 import re
 from urllib.parse import urlparse
-from models import db, User, Url, Click
-from auth import login_required, get_current_user
-from utils import generate_short_code, is_valid_url, get_client_ip
+from models import db, User, Url, bulk_insert
+import json
+import click
+import rollups
+import quota
+import migrations
+import retention
+import exports
+import analytics
+import engines
+import enrichment
+import interning
+import fragments
+import hashlib
+from auth import login_required, get_current_user, get_user_snapshot, invalidate_user
+from utils import is_valid_url, get_client_ip, encode_cursor, decode_cursor, parse_time_range
+from cache import ResultCache, ResolvedUrl, MISSING
+from clicks import ClickIngestor, ClickRecord
+from allocator import make_allocator
+from fastpath import RedirectFastPath, resolution_query, cache_control, hit_redirect_limits, MAX_CACHE_AGE
+from instrumentation import RequestMetrics
+from sqlalchemy.exc import IntegrityError
 
 # Load environment variables
 load_dotenv()
 
 # Initialize Flask app
 app = Flask(__name__)
+# Without SHORT_CODE_KEY (below) the secret key also keys the short code
+# scramble; rotating it then makes new codes collide with issued ones.
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
 # Use DATABASE_URL if provided; otherwise default to an ephemeral writable path
 # in serverless environments (absolute /tmp path). For a file-based SQLite DB
@@ -29,21 +51,106 @@ app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
     'sqlite:////tmp/urlshortener.db'
 )
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Engine profile (DB_PROFILE=auto|sqlite|postgres|none) with its SQLite pragma
+# and pool settings, and DATABASE_REPLICA_URL for lag-tolerant reads
+app.config.update(engines.from_env(os.environ))
+# Short code allocation: 'block' leases collision-free ID ranges, 'random'
+# keeps the legacy generate-and-check loop. SHORT_CODE_KEY keys the code
+# scramble and must not change once codes have been issued.
+app.config['CODE_ALLOCATOR'] = os.environ.get('CODE_ALLOCATOR', 'block')
+app.config['CODE_BLOCK_SIZE'] = int(os.environ.get('CODE_BLOCK_SIZE', 1000))
+app.config['SHORT_CODE_LENGTH'] = int(os.environ.get('SHORT_CODE_LENGTH', 6))
+app.config['SHORT_CODE_SCRAMBLE'] = os.environ.get('SHORT_CODE_SCRAMBLE', '1') == '1'
+app.config['SHORT_CODE_KEY'] = os.environ.get('SHORT_CODE_KEY')
+if app.config['CODE_ALLOCATOR'] == 'block' and app.config['SHORT_CODE_SCRAMBLE'] and not app.config['SHORT_CODE_KEY']:
+    app.logger.warning('SHORT_CODE_KEY is not set; short codes are scrambled with SECRET_KEY, so do not rotate it')
+app.config['DASHBOARD_PAGE_SIZE'] = int(os.environ.get('DASHBOARD_PAGE_SIZE', 25))
+app.config['DASHBOARD_MAX_PAGE_SIZE'] = int(os.environ.get('DASHBOARD_MAX_PAGE_SIZE', 100))
+app.config['BULK_SHORTEN_MAX'] = int(os.environ.get('BULK_SHORTEN_MAX', 50000))
+# Requests slower than this many milliseconds are logged (0 disables the log).
+# /metrics is only served when METRICS_TOKEN is set, to requests that send
+# 'Authorization: Bearer <token>'.
+app.config['SLOW_REQUEST_MS'] = float(os.environ.get('SLOW_REQUEST_MS', 0))
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+# Cache the user's plan and quota in the session for read-only pages. Changes
+# bump a per-user version in shared storage; snapshots also expire after
+# USER_SNAPSHOT_TTL seconds in case the storage is not shared by all workers.
+app.config['USER_SNAPSHOT'] = os.environ.get('USER_SNAPSHOT', '1') == '1'
+app.config['USER_SNAPSHOT_TTL'] = int(os.environ.get('USER_SNAPSHOT_TTL', 300))
+# Raw clicks are kept for CLICK_RETENTION_DAYS (0 keeps them forever), then
+# archived to CLICK_ARCHIVE_DIR if set and purged by 'flask purge-clicks'
+app.config['CLICK_RETENTION_DAYS'] = int(os.environ.get('CLICK_RETENTION_DAYS', 0))
+app.config['CLICK_ARCHIVE_DIR'] = os.environ.get('CLICK_ARCHIVE_DIR')
+# Click enrichment ('flask enrich-clicks'): country resolver (stub://,
+# file:///path/ranges.csv or ipapi://) and its per-IP/User-Agent LRU size
+app.config['GEOIP_RESOLVER'] = os.environ.get('GEOIP_RESOLVER', 'stub://')
+app.config['ENRICH_CACHE_SIZE'] = int(os.environ.get('ENRICH_CACHE_SIZE', 10000))
+# Redirects are served by a WSGI fast path ahead of Flask routing (set
+# REDIRECT_FAST_PATH=0 to route them like any other page) with this status
+app.config['REDIRECT_FAST_PATH'] = os.environ.get('REDIRECT_FAST_PATH', '1') == '1'
+app.config['REDIRECT_STATUS'] = int(os.environ.get('REDIRECT_STATUS', 302))
+# Rendered dashboard fragments are cached per user and data version (see
+# fragments.py), only when STORAGE_URL is shared by all workers.
+# PRERENDER_PAGES=1 renders the anonymous marketing pages at startup.
+app.config['FRAGMENT_CACHE_SIZE'] = int(os.environ.get('FRAGMENT_CACHE_SIZE', 1000))
+app.config['FRAGMENT_CACHE_TTL'] = int(os.environ.get('FRAGMENT_CACHE_TTL', 60))
+app.config['PRERENDER_PAGES'] = os.environ.get('PRERENDER_PAGES', '1') == '1'
 
 # Initialize database
+engines.configure(app)
 db.init_app(app)
+engines.init_app(app, db)
 
-# Initialize Stripe
-stripe.api_key = os.environ.get('STRIPE_SECRET_KEY', 'sk_test_placeholder')
+# Stripe is the slowest import of the app, so it is loaded on first checkout
+STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY', 'sk_test_placeholder')
 STRIPE_PUBLISHABLE_KEY = os.environ.get('STRIPE_PUBLISHABLE_KEY', 'pk_test_placeholder')
 STRIPE_PRICE_ID = os.environ.get('STRIPE_PRICE_ID', 'price_placeholder')
 
-# Initialize rate limiter
+# Key/value storage shared by the rate limiter and the resolution cache, and
+# the short code resolution cache itself. Both are the instances of the
+# redirect entry point (redirects.py), so invalidations made here reach the
+# redirects it serves. memory:// is per process; use sqlite:///path to share
+# them between the workers of one host, or redis://host:port/db everywhere.
+# Imported after load_dotenv() so redirects.py sees the .env settings.
+from redirects import shared_storage, resolution_cache  # noqa: E402
+app.extensions['shared_storage'] = shared_storage
+
+# Recent analytics query results, so dashboard refreshes skip the database
+analytics_cache = ResultCache(
+    maxsize=int(os.environ.get('ANALYTICS_CACHE_SIZE', 1000)),
+    ttl=int(os.environ.get('ANALYTICS_CACHE_TTL', 30))
+)
+
+# Rendered dashboard fragments, keyed by user and data version
+fragment_cache = ResultCache(
+    maxsize=app.config['FRAGMENT_CACHE_SIZE'],
+    ttl=app.config['FRAGMENT_CACHE_TTL']
+)
+
+# Allocates short codes for new URLs
+code_allocator = make_allocator(app.config)
+
+# Clicks are written in batches off the redirect path
+click_ingestor = ClickIngestor(app)
+
+# Request timing and SQL statistics, registered ahead of the rate limiter so
+# rejected requests are measured too
+request_metrics = RequestMetrics(app, db)
+request_metrics.register_stats('resolution_cache', resolution_cache.stats)
+request_metrics.register_stats('click_ingest', click_ingestor.stats)
+request_metrics.register_stats('intern_cache', interning.stats)
+request_metrics.register_stats('fragment_cache', fragment_cache.stats)
+
+# Initialize rate limiter. RATELIMIT_ENABLED=0 turns it off (e.g. for load
+# tests); DEFAULT_RATE_LIMITS is a ';'-separated list of limits per client.
+app.config['RATELIMIT_ENABLED'] = os.environ.get('RATELIMIT_ENABLED', '1') == '1'
+DEFAULT_RATE_LIMITS = os.environ.get('DEFAULT_RATE_LIMITS', '200 per day;50 per hour')
 limiter = Limiter(
     app=app,
     key_func=get_remote_address,
-    default_limits=["200 per day", "50 per hour"],
-    storage_uri="memory://"
+    default_limits=DEFAULT_RATE_LIMITS.split(';'),
+    storage_uri="backend://",
+    storage_options={'backend': shared_storage}
 )
 
 # Create tables only when explicitly requested (or in development).
@@ -55,6 +162,7 @@ try:
         with app.app_context():
             try:
                 db.create_all()
+                migrations.upgrade(db.engine)
                 app.logger.info('Database tables created via INIT_DB/FLASK_ENV')
             except Exception:
                 app.logger.exception('Database initialization failed; skipping create_all()')
@@ -63,9 +171,17 @@ except Exception:
     # function startup; log and continue.
     app.logger.exception('Unexpected error while checking INIT_DB')
 
+# Marketing pages served to anonymous visitors without rendering
+static_pages = fragments.PrerenderedPages(app)
+static_pages.register('index', 'index.html')
+static_pages.register('pricing', 'pricing.html', stripe_key=STRIPE_PUBLISHABLE_KEY)
+
 @app.route('/')
 def index():
-    user = get_current_user()
+    page = static_pages.get('index')
+    if page is not None:
+        return page
+    user = get_user_snapshot()
     return render_template('index.html', user=user)
 
 @app.route('/signup', methods=['GET', 'POST'])
@@ -109,6 +225,7 @@ def signup():
         db.session.commit()
         
         session['user_id'] = new_user.id
+        session.pop('user_snapshot', None)
         flash('Account created successfully!', 'success')
         return redirect(url_for('dashboard'))
     
@@ -125,6 +242,7 @@ def login():
         
         if user and check_password_hash(user.password, password):
             session['user_id'] = user.id
+            session.pop('user_snapshot', None)
             flash('Logged in successfully!', 'success')
             return redirect(url_for('dashboard'))
         else:
@@ -136,6 +254,7 @@ def login():
 @app.route('/logout')
 def logout():
     session.pop('user_id', None)
+    session.pop('user_snapshot', None)
     flash('Logged out successfully!', 'info')
     return redirect(url_for('index'))
 
@@ -144,25 +263,50 @@ def logout():
 def dashboard():
     user = get_current_user()
     
-    # Reset quota if needed
-    if datetime.utcnow() > user.quota_reset_date:
-        user.used_quota = 0
-        user.quota_reset_date = datetime.utcnow() + timedelta(days=30)
-        db.session.commit()
+    # Start a new quota period if the current one has ended
+    quota.rollover(user)
     
-    # Get user's URLs
-    urls = Url.query.filter_by(user_id=user.id).order_by(Url.created_at.desc()).all()
+    per_page = request.args.get('per_page', app.config['DASHBOARD_PAGE_SIZE'], type=int)
+    per_page = max(1, min(per_page, app.config['DASHBOARD_MAX_PAGE_SIZE']))
+    before = request.args.get('before')
     
-    # Prepare analytics data
-    for url in urls:
-        url.total_clicks = Click.query.filter_by(url_id=url.id).count()
-        url.unique_clicks = db.session.query(Click.ip_address).filter_by(url_id=url.id).distinct().count()
+    # The stats and links only change with the user's data version
+    links = fragments.cached_fragment(
+        fragment_cache,
+        ('dashboard', user.id, request.url_root, per_page, before),
+        fragments.data_version(user.id),
+        lambda: render_links(user, per_page, decode_cursor(before))
+    )
     
     return render_template('dashboard.html', 
                          user=user, 
-                         urls=urls,
+                         links=links,
                          stripe_key=STRIPE_PUBLISHABLE_KEY)
 
+def render_links(user, per_page, before):
+    """Render one page of the user's URLs with their click totals"""
+    rows, has_more = rollups.link_page(user.id, per_page, before)
+    
+    urls = []
+    for url, total_clicks, unique_clicks in rows:
+        url.total_clicks = total_clicks
+        url.unique_clicks = unique_clicks
+        urls.append(url)
+    
+    next_cursor = encode_cursor(urls[-1].created_at, urls[-1].id) if has_more else None
+    total_links, total_clicks, unique_visitors = rollups.account_totals(user.id)
+    
+    return render_template('dashboard_links.html',
+                         urls=urls,
+                         stats={
+                             'total_links': total_links,
+                             'total_clicks': total_clicks,
+                             'unique_visitors': unique_visitors
+                         },
+                         per_page=per_page,
+                         is_first_page=before is None,
+                         next_cursor=next_cursor)
+
 @app.route('/shorten', methods=['POST'])
 @login_required
 def shorten_url():
@@ -174,99 +318,255 @@ def shorten_url():
         flash('Invalid URL format', 'danger')
         return redirect(request.referrer or url_for('index'))
     
-    # Check quota for free users
-    if not user.is_premium and user.used_quota >= user.monthly_quota:
+    # Reserve a link from the quota of free users
+    if not quota.reserve(user):
         flash('Monthly quota exceeded. Upgrade to premium for unlimited links!', 'warning')
         return redirect(url_for('pricing'))
     
-    # Generate short code
-    short_code = generate_short_code()
-    while Url.query.filter_by(short_code=short_code).first():
-        short_code = generate_short_code()
-    
-    # Create new URL
-    new_url = Url(
-        original_url=original_url,
-        short_code=short_code,
-        user_id=user.id,
-        created_at=datetime.utcnow()
-    )
-    
-    # Update quota for free users
-    if not user.is_premium:
-        user.used_quota += 1
-    
-    db.session.add(new_url)
-    db.session.commit()
+    # Allocate a short code. The unique constraint only trips when a
+    # legacy random code is hit, in which case the next code is tried.
+    for attempt in range(3):
+        short_code = code_allocator.allocate()
+        
+        # A previous lookup may have cached this code as missing
+        resolution_cache.invalidate(short_code)
+        
+        # Create new URL
+        new_url = Url(
+            original_url=original_url,
+            short_code=short_code,
+            user_id=user.id,
+            created_at=datetime.utcnow()
+        )
+        
+        db.session.add(new_url)
+        try:
+            db.session.commit()
+            break
+        except IntegrityError:
+            db.session.rollback()
+    else:
+        quota.release(user)
+        flash('Could not create a short link. Please try again.', 'danger')
+        return redirect(url_for('dashboard'))
     
+    fragments.bump_data_version([user.id])
     flash('URL shortened successfully!', 'success')
     return redirect(url_for('dashboard'))
 
+@app.route('/api/shorten/bulk', methods=['POST'])
+@login_required
+def shorten_bulk():
+    user = get_current_user()
+    payload = request.get_json(silent=True) or {}
+    urls = payload.get('urls')
+    
+    if not isinstance(urls, list) or not urls:
+        return jsonify({'error': 'Expected a JSON body with a non-empty "urls" list'}), 400
+    if len(urls) > app.config['BULK_SHORTEN_MAX']:
+        return jsonify({'error': f"At most {app.config['BULK_SHORTEN_MAX']} URLs per batch"}), 413
+    
+    # Validate URLs, reporting the invalid ones by position
+    valid = []
+    errors = []
+    for index, original_url in enumerate(urls):
+        original_url = original_url.strip() if isinstance(original_url, str) else ''
+        if is_valid_url(original_url):
+            valid.append((index, original_url))
+        else:
+            errors.append({'index': index, 'url': urls[index], 'error': 'Invalid URL format'})
+    
+    # Reserve quota for the whole batch in one statement
+    if not quota.reserve(user, len(valid)):
+        return jsonify({
+            'error': 'Monthly quota exceeded. Upgrade to premium for unlimited links!',
+            'remaining': quota.remaining(user)
+        }), 403
+    
+    # Allocate all codes up front and insert with multi-row statements
+    for attempt in range(3):
+        codes = code_allocator.allocate_many(len(valid))
+        created_at = datetime.utcnow()
+        try:
+            bulk_insert(Url, [
+                {'original_url': original_url, 'short_code': code, 'user_id': user.id, 'created_at': created_at}
+                for (index, original_url), code in zip(valid, codes)
+            ])
+            db.session.commit()
+            break
+        except IntegrityError:
+            db.session.rollback()
+    else:
+        quota.release(user, len(valid))
+        return jsonify({'error': 'Could not allocate short codes. Please try again.'}), 503
+    
+    resolution_cache.invalidate_many(codes)
+    fragments.bump_data_version([user.id])
+    
+    results = [
+        {'index': index, 'url': original_url, 'short_code': code, 'short_url': request.url_root + code}
+        for (index, original_url), code in zip(valid, codes)
+    ]
+    
+    # Stream one JSON object per line for large batches
+    if request.args.get('format') == 'ndjson' or 'application/x-ndjson' in request.headers.get('Accept', ''):
+        def generate():
+            for item in results:
+                yield json.dumps(item) + '\n'
+            for item in errors:
+                yield json.dumps(item) + '\n'
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    
+    return jsonify({'created': results, 'errors': errors})
+
+def resolve_short_code(short_code):
+    """Resolve a short code through the cache, falling back to the database"""
+    resolved = resolution_cache.get(short_code)
+    if resolved is None:
+        query = resolution_query(short_code)
+        row = engines.read_session(db).execute(query).first()
+        if row is None and engines.has_replica(db):
+            # A link created moments ago may not have reached the replica yet
+            row = db.session.execute(query).first()
+        resolved = ResolvedUrl(*row) if row else MISSING
+        resolution_cache.set(short_code, resolved)
+    return None if resolved is MISSING else resolved
+
 @app.route('/<short_code>')
 def redirect_url(short_code):
-    url = Url.query.filter_by(short_code=short_code).first()
+    url = resolve_short_code(short_code)
     
     if not url:
         abort(404)
     
     # Track click
-    click = Click(
+    click_ingestor.record(ClickRecord(
         url_id=url.id,
         ip_address=get_client_ip(),
         clicked_at=datetime.utcnow(),
         user_agent=request.headers.get('User-Agent', '')[:500],
         referrer=request.referrer[:500] if request.referrer else None
-    )
+    ))
     
-    db.session.add(click)
-    db.session.commit()
-    
-    return redirect(url.original_url)
+    response = redirect(url.original_url, code=url.redirect_status or app.config['REDIRECT_STATUS'])
+    response.headers['Cache-Control'] = cache_control(url.cache_max_age, url.edge_cacheable)
+    return response
+
+redirect_limits = parse_many(DEFAULT_RATE_LIMITS)
+
+def redirect_rate_limited(environ):
+    """Count a fast-path redirect in Flask-Limiter's counters for redirect_url"""
+    # limiter.enabled is what Flask-Limiter itself checks, e.g. for benchmarks
+    if not app.config['RATELIMIT_ENABLED'] or not limiter.enabled:
+        return False
+    return hit_redirect_limits(limiter.limiter, redirect_limits, environ)
+
+def render_not_found():
+    """The anonymous 404 page, served from memory by the fast path"""
+    with app.test_request_context('/'):
+        return render_template('base.html').encode()
+
+@contextmanager
+def fast_path_request(environ):
+    # Fast-path requests resolve codes and report metrics in an app context
+    with app.app_context(), request_metrics.measure(environ) as answered:
+        yield answered
+
+if app.config['REDIRECT_FAST_PATH']:
+    app.wsgi_app = RedirectFastPath(
+        app.wsgi_app,
+        resolve=resolve_short_code,
+        record=click_ingestor.record,
+        rate_limited=redirect_rate_limited,
+        url_map=app.url_map,
+        not_found_page=render_not_found,
+        status=app.config['REDIRECT_STATUS'],
+        session_cookie=app.config['SESSION_COOKIE_NAME'],
+        measure=fast_path_request
+    )
 
 @app.route('/api/analytics/<int:url_id>')
 @login_required
 def get_analytics(url_id):
     user = get_current_user()
-    url = Url.query.filter_by(id=url_id, user_id=user.id).first()
+    url = Url.query.filter_by(id=url_id, user_id=user.id, deleted_at=None).first()
     
     if not url:
         return jsonify({'error': 'URL not found'}), 404
     
-    # Get click data for the last 7 days
-    seven_days_ago = datetime.utcnow() - timedelta(days=7)
-    clicks = Click.query.filter(
-        Click.url_id == url_id,
-        Click.clicked_at >= seven_days_ago
-    ).all()
-    
-    # Group clicks by day
-    click_data = {}
-    for click in clicks:
-        date = click.clicked_at.strftime('%Y-%m-%d')
-        if date not in click_data:
-            click_data[date] = 0
-        click_data[date] += 1
-    
-    # Fill in missing days with 0
-    dates = []
-    counts = []
-    for i in range(7):
-        date = (datetime.utcnow() - timedelta(days=6-i)).strftime('%Y-%m-%d')
-        dates.append(date)
-        counts.append(click_data.get(date, 0))
+    # Defaults to the last 7 days (including today) at daily granularity
+    try:
+        params = analytics.parse_params(request.args, datetime.utcnow())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    return jsonify({
-        'dates': dates,
-        'counts': counts,
-        'total_clicks': len(clicks),
-        'unique_clicks': len(set(click.ip_address for click in clicks))
-    })
+    return cached_analytics(('url', url.id, params), lambda: analytics.run(url.id, session=engines.read_session(db), **params))
+
+@app.route('/api/analytics/account')
+@login_required
+def account_analytics():
+    user = get_current_user()
+    try:
+        params = analytics.account_params(request.args, datetime.utcnow())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return cached_analytics(('account', user.id, params), lambda: analytics.account_summary(user.id, session=engines.read_session(db), **params))
+
+def cached_analytics(key, compute):
+    """Serve an analytics result from the short-lived cache, with an ETag"""
+    key = key[:2] + tuple(sorted(key[2].items()))
+    cached = analytics_cache.get(key)
+    if cached is None:
+        payload = json.dumps(compute())
+        cached = (hashlib.sha1(payload.encode()).hexdigest(), payload)
+        analytics_cache.set(key, cached)
+    etag, payload = cached
+    
+    response = Response(payload, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'private, max-age={analytics_cache.ttl}'
+    return response.make_conditional(request)
+
+@app.route('/api/analytics/<int:url_id>/export')
+@login_required
+def export_analytics(url_id):
+    user = get_current_user()
+    url = Url.query.filter_by(id=url_id, user_id=user.id, deleted_at=None).first()
+    
+    if not url:
+        return jsonify({'error': 'URL not found'}), 404
+    
+    fmt = request.args.get('format', 'csv')
+    if fmt not in exports.FORMATS:
+        return jsonify({'error': f"Unsupported format; use one of {', '.join(exports.FORMATS)}"}), 400
+    try:
+        start, end = parse_time_range(request.args.get('from'), request.args.get('to'))
+    except ValueError as e:
+        return jsonify({'error': f'Invalid date range: {e}'}), 400
+    
+    # Rows are streamed from a server-side cursor as they are read
+    response = Response(
+        stream_with_context(exports.stream_clicks(url.id, fmt, start, end)),
+        mimetype=exports.FORMATS[fmt]
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename=clicks-{url.short_code}.{fmt}'
+    return response
 
 @app.route('/pricing')
 def pricing():
-    user = get_current_user()
+    page = static_pages.get('pricing')
+    if page is not None:
+        return page
+    user = get_user_snapshot()
     return render_template('pricing.html', user=user, stripe_key=STRIPE_PUBLISHABLE_KEY)
 
+def stripe_api():
+    """The stripe module, imported and configured on first use"""
+    import stripe
+    stripe.api_key = STRIPE_SECRET_KEY
+    return stripe
+
 @app.route('/subscribe', methods=['POST'])
 @login_required
 def subscribe():
@@ -274,7 +574,7 @@ def subscribe():
     
     try:
         # Create Stripe checkout session
-        checkout_session = stripe.checkout.Session.create(
+        checkout_session = stripe_api().checkout.Session.create(
             payment_method_types=['card'],
             line_items=[{
                 'price': STRIPE_PRICE_ID,
@@ -299,6 +599,7 @@ def subscription_success():
     user.is_premium = True
     user.subscription_date = datetime.utcnow()
     db.session.commit()
+    invalidate_user(user.id)
     
     flash('Premium subscription activated successfully!', 'success')
     return redirect(url_for('dashboard'))
@@ -307,19 +608,139 @@ def subscription_success():
 @login_required
 def delete_url(url_id):
     user = get_current_user()
-    url = Url.query.filter_by(id=url_id, user_id=user.id).first()
+    url = Url.query.filter_by(id=url_id, user_id=user.id, deleted_at=None).first()
     
     if url:
-        # Delete related clicks first
-        Click.query.filter_by(url_id=url.id).delete()
-        db.session.delete(url)
+        # Only mark the link deleted; 'flask reclaim-urls' removes it and
+        # its clicks in small chunks later
+        url.deleted_at = datetime.utcnow()
         db.session.commit()
+        resolution_cache.invalidate(url.short_code)
+        fragments.bump_data_version([user.id])
         flash('URL deleted successfully!', 'success')
     else:
         flash('URL not found', 'danger')
     
     return redirect(url_for('dashboard'))
 
+def redirect_policy(values, url):
+    """Validate redirect policy fields and return the link's resulting policy.
+
+    `values` may hold any of redirect_status (301, 302, 307, 308, or empty
+    for the default), cache_max_age (seconds) and edge_cacheable. Raises
+    ValueError with a message for the user.
+    """
+    policy = {
+        'redirect_status': url.redirect_status,
+        'cache_max_age': url.cache_max_age,
+        'edge_cacheable': url.edge_cacheable,
+    }
+    if 'redirect_status' in values:
+        status = values['redirect_status']
+        try:
+            status = int(status) if status not in (None, '') else None
+        except (TypeError, ValueError):
+            status = 0
+        if status is not None and status not in (301, 302, 307, 308):
+            raise ValueError('redirect_status must be 301, 302, 307 or 308')
+        policy['redirect_status'] = status
+    if 'cache_max_age' in values:
+        max_age = values['cache_max_age']
+        try:
+            max_age = int(max_age) if not isinstance(max_age, bool) else -1
+        except (TypeError, ValueError):
+            max_age = -1
+        if not 0 <= max_age <= MAX_CACHE_AGE:
+            raise ValueError(f'cache_max_age must be between 0 and {MAX_CACHE_AGE} seconds')
+        policy['cache_max_age'] = max_age
+    if 'edge_cacheable' in values:
+        edge_cacheable = values['edge_cacheable']
+        if not isinstance(edge_cacheable, bool):
+            raise ValueError('edge_cacheable must be true or false')
+        policy['edge_cacheable'] = edge_cacheable
+    if policy['edge_cacheable'] and not policy['cache_max_age']:
+        raise ValueError('edge caching needs a cache_max_age')
+    return policy
+
+def update_redirect_policy(url, values):
+    """Apply a redirect policy update; returns an error message or None"""
+    try:
+        policy = redirect_policy(values, url)
+    except ValueError as e:
+        return str(e)
+    for name, value in policy.items():
+        setattr(url, name, value)
+    db.session.commit()
+    resolution_cache.invalidate(url.short_code)
+    fragments.bump_data_version([url.user_id])
+    return None
+
+@app.route('/url-policy/<int:url_id>', methods=['POST'])
+@login_required
+def url_policy(url_id):
+    user = get_current_user()
+    url = Url.query.filter_by(id=url_id, user_id=user.id, deleted_at=None).first()
+    
+    if not url:
+        flash('URL not found', 'danger')
+        return redirect(url_for('dashboard'))
+    
+    # An unchecked checkbox is not submitted at all
+    error = update_redirect_policy(url, {
+        'redirect_status': request.form.get('redirect_status'),
+        'cache_max_age': request.form.get('cache_max_age') or 0,
+        'edge_cacheable': 'edge_cacheable' in request.form,
+    })
+    if error:
+        flash(error, 'danger')
+    else:
+        flash('Redirect settings saved. Visits served from a cache are not counted as clicks.', 'success')
+    return redirect(url_for('dashboard'))
+
+@app.route('/api/urls/<int:url_id>', methods=['PATCH'])
+@login_required
+def update_url(url_id):
+    user = get_current_user()
+    url = Url.query.filter_by(id=url_id, user_id=user.id, deleted_at=None).first()
+    
+    if not url:
+        return jsonify({'error': 'URL not found'}), 404
+    
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    error = update_redirect_policy(url, payload)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    return jsonify({
+        'id': url.id,
+        'short_code': url.short_code,
+        'redirect_status': url.redirect_status,
+        'cache_max_age': url.cache_max_age,
+        'edge_cacheable': url.edge_cacheable,
+    })
+
+@app.route('/api/stats/cache')
+@login_required
+def cache_stats():
+    return jsonify(resolution_cache.stats())
+
+@app.route('/api/stats/clicks')
+@login_required
+def click_stats():
+    return jsonify(click_ingestor.stats())
+
+@app.route('/metrics')
+@limiter.exempt
+def metrics():
+    token = app.config['METRICS_TOKEN']
+    if not token:
+        abort(404)
+    if request.headers.get('Authorization') != f'Bearer {token}':
+        abort(401)
+    return Response(request_metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 @app.errorhandler(404)
 def not_found(e):
     return render_template('base.html'), 404
@@ -329,5 +750,69 @@ def ratelimit_handler(e):
     flash('Too many requests. Please try again later.', 'warning')
     return redirect(url_for('index'))
 
+@app.cli.command('backfill-rollups')
+@click.option('--url-id', type=int, multiple=True, help='Only rebuild these URLs')
+@click.option('--since', type=click.DateTime(), help='Only rebuild buckets from this day on')
+def backfill_rollups_command(url_id, since):
+    """Rebuild hourly and daily click rollups from the Click table"""
+    if since is None and app.config['CLICK_RETENTION_DAYS']:
+        # Keep the rollups of months whose clicks were already purged
+        since = retention.month_start(datetime.utcnow() - timedelta(days=app.config['CLICK_RETENTION_DAYS']))
+    processed = rollups.backfill(list(url_id) or None, since=since)
+    click.echo(f'Rolled up {processed} clicks')
+
+@app.cli.command('purge-clicks')
+@click.option('--batch-size', type=int, default=1000, help='Clicks deleted per transaction')
+def purge_clicks_command(batch_size):
+    """Archive and delete the months of clicks past CLICK_RETENTION_DAYS"""
+    if not app.config['CLICK_RETENTION_DAYS']:
+        click.echo('CLICK_RETENTION_DAYS is not set; keeping all clicks')
+        return
+    purged = retention.enforce_retention(
+        app.config['CLICK_RETENTION_DAYS'],
+        archive_dir=app.config['CLICK_ARCHIVE_DIR'],
+        batch_size=batch_size
+    )
+    for month, archived, deleted in purged:
+        click.echo(f'{month}: archived {archived}, deleted {deleted} clicks')
+
+@app.cli.command('reclaim-urls')
+@click.option('--batch-size', type=int, default=1000, help='Clicks deleted per transaction')
+@click.option('--limit', type=int, help='Reclaim at most this many URLs')
+def reclaim_urls_command(batch_size, limit):
+    """Remove deleted URLs along with their clicks and rollups"""
+    reclaimed = retention.reclaim_deleted(batch_size=batch_size, limit=limit)
+    click.echo(f'Reclaimed {reclaimed} URLs')
+
+@app.cli.command('enrich-clicks')
+@click.option('--batch-size', type=int, default=1000, help='Clicks enriched per transaction')
+@click.option('--limit', type=int, help='Enrich at most this many clicks')
+@click.option('--follow', is_flag=True, help='Keep running and enrich new clicks as they arrive')
+@click.option('--interval', type=float, default=5.0, help='Seconds to wait for new clicks with --follow')
+def enrich_clicks_command(batch_size, limit, follow, interval):
+    """Resolve country, device, browser and referrer domain of new clicks"""
+    enricher = enrichment.Enricher(
+        enrichment.resolver_from_url(app.config['GEOIP_RESOLVER']),
+        cache_size=app.config['ENRICH_CACHE_SIZE']
+    )
+    enriched = enricher.run(batch_size=batch_size, limit=limit, follow=follow, interval=interval)
+    click.echo(f'Enriched {enriched} clicks')
+
+@app.cli.command('migrate')
+@click.option('--status', is_flag=True, help='Only list pending migrations')
+def migrate_command(status):
+    """Create missing tables and apply pending schema migrations"""
+    if status:
+        for version, description, _ in migrations.pending(db.engine):
+            click.echo(f'Pending {version}: {description}')
+        return
+    db.create_all()
+    applied = migrations.upgrade(db.engine, log=click.echo)
+    click.echo(f'Applied {len(applied)} migrations')
+
+# Render the anonymous marketing pages now that every route is registered
+if app.config['PRERENDER_PAGES']:
+    static_pages.prerender()
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,244 @@
+"""Async (ASGI) serving mode for the redirect and analytics read paths.
+
+    uvicorn asgi:application --workers 4
+
+GET /<short_code> and GET /api/analytics/<url_id> run on asyncio with
+SQLAlchemy's async engine (aiosqlite for SQLite, asyncpg for PostgreSQL) and
+its connection pool, so a slow database call only suspends the request that
+made it. The resolution cache, rate limits and click ingestor are those of
+the redirect-only entry point (redirects.py), which app.py shares as well.
+Every other request, including unknown short codes, is handed to the Flask
+app, which is imported on first use and run in a thread pool.
+
+Configuration is read from the same environment variables as app.py.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+from datetime import datetime, timedelta
+from functools import lru_cache
+from urllib.parse import parse_qsl
+from flask.sessions import SecureCookieSessionInterface
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from werkzeug.http import parse_etags
+from models import db, Url
+from cache import ResultCache, ResolvedUrl, MISSING
+from fastpath import click_from, resolution_query, redirect_headers
+from redirects import (
+    DATABASE_URL, REDIRECT_PATH, REDIRECT_STATUS, settings, core, click_ingestor, shared_storage, resolution_cache
+)
+import redirects
+import analytics
+import engines
+
+# Async DBAPI used for each database; asyncpg must be installed for PostgreSQL
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgres': 'postgresql+asyncpg',
+    'postgresql': 'postgresql+asyncpg',
+}
+
+ANALYTICS_PATH = re.compile(r'^/api/analytics/(\d+)$')
+
+# Flask keeps sessions for a month (permanent_session_lifetime)
+SESSION_MAX_AGE = timedelta(days=31).total_seconds()
+
+
+def async_database_url(url):
+    scheme, rest = url.split('://', 1)
+    return f"{ASYNC_DRIVERS.get(scheme.split('+')[0], scheme)}://{rest}"
+
+
+# This side only reads, so it uses the replica when one is configured
+READ_URL = settings['DATABASE_REPLICA_URL'] or DATABASE_URL
+profile = engines.profile_for(READ_URL, settings['DB_PROFILE'])
+
+engine = create_async_engine(
+    async_database_url(READ_URL),
+    **dict(
+        engines.engine_options(profile, settings),
+        pool_size=int(os.environ.get('ASYNC_POOL_SIZE', 10)),
+        max_overflow=int(os.environ.get('ASYNC_MAX_OVERFLOW', 20)),
+    )
+)
+if profile == 'sqlite':
+    engines.apply_pragmas(engine.sync_engine, engines.sqlite_pragmas(settings))
+Session = async_sessionmaker(engine, expire_on_commit=False)
+
+analytics_cache = ResultCache(
+    maxsize=int(os.environ.get('ANALYTICS_CACHE_SIZE', 1000)),
+    ttl=int(os.environ.get('ANALYTICS_CACHE_TTL', 30))
+)
+
+# Writing clicks inline would block the event loop
+core.config['CLICK_INGEST_ASYNC'] = True
+
+# Reads the session cookies issued by the Flask app
+session_serializer = SecureCookieSessionInterface().get_signing_serializer(core)
+
+_flask_app = None
+
+
+def flask_app():
+    """The Flask app wrapped for ASGI, imported on first use"""
+    global _flask_app
+    if _flask_app is None:
+        from uvicorn.middleware.wsgi import WSGIMiddleware
+        from app import app
+        _flask_app = WSGIMiddleware(app)
+    return _flask_app
+
+
+async def offload(function, *args):
+    """Call into a storage-backed object without blocking the event loop.
+
+    Process-local storage answers immediately; shared backends do network or
+    file I/O, which runs on a worker thread.
+    """
+    if shared_storage.shared:
+        return await asyncio.to_thread(function, *args)
+    return function(*args)
+
+
+def environ_of(scope):
+    """The WSGI-style header mapping the shared helpers in utils expect"""
+    environ = {'REMOTE_ADDR': scope['client'][0] if scope.get('client') else None}
+    for name, value in scope['headers']:
+        environ['HTTP_' + name.decode('latin-1').upper().replace('-', '_')] = value.decode('latin-1')
+    return environ
+
+
+def session_user_id(environ):
+    """User id from the Flask session cookie, or None"""
+    for part in environ.get('HTTP_COOKIE', '').split(';'):
+        name, _, value = part.strip().partition('=')
+        if name == 'session' and value:
+            try:
+                return session_serializer.loads(value, max_age=SESSION_MAX_AGE).get('user_id')
+            except Exception:
+                return None
+    return None
+
+
+async def respond(send, status, body=b'', content_type=None, headers=()):
+    response_headers = [(b'content-length', str(len(body)).encode())]
+    if content_type:
+        response_headers.append((b'content-type', content_type.encode()))
+    response_headers.extend((name.encode(), value.encode()) for name, value in headers)
+    await send({'type': 'http.response.start', 'status': status, 'headers': response_headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+@lru_cache(maxsize=10000)
+def asgi_redirect_headers(location, max_age=0, edge_cacheable=False):
+    """redirect_headers() as ASGI header pairs, encoded once per URL and policy"""
+    return [
+        (name.lower().encode('latin-1'), value.encode('latin-1'))
+        for name, value in redirect_headers(location, max_age, edge_cacheable)
+    ]
+
+
+async def respond_json(send, status, data):
+    await respond(send, status, json.dumps(data).encode(), 'application/json')
+
+
+async def rate_limited(environ, endpoint):
+    """redirects.rate_limited() under the Flask endpoint's own counters"""
+    return await offload(redirects.rate_limited, environ, endpoint)
+
+
+async def resolve_short_code(short_code):
+    resolved = await offload(resolution_cache.get, short_code)
+    if resolved is None:
+        async with Session() as session:
+            row = (await session.execute(resolution_query(short_code))).first()
+        if row is None and settings['DATABASE_REPLICA_URL']:
+            # Possibly not replicated yet; the Flask app checks the primary
+            return None
+        resolved = ResolvedUrl(*row) if row else MISSING
+        await offload(resolution_cache.set, short_code, resolved)
+    return None if resolved is MISSING else resolved
+
+
+async def redirect_url(scope, send, short_code, environ):
+    url = await resolve_short_code(short_code)
+    if url is None:
+        return False
+    if await rate_limited(environ, 'redirect_url'):
+        await respond(send, 429, b'Too many requests', 'text/plain')
+        return True
+
+    click_ingestor.record(click_from(url.id, environ))
+    headers = asgi_redirect_headers(url.original_url, url.cache_max_age, url.edge_cacheable)
+    await send({'type': 'http.response.start', 'status': url.redirect_status or REDIRECT_STATUS, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': b''})
+    return True
+
+
+async def get_analytics(scope, send, url_id, environ):
+    user_id = session_user_id(environ)
+    if user_id is None:
+        await respond(send, 302, headers=[('location', '/login')])
+        return
+    if await rate_limited(environ, 'get_analytics'):
+        await respond_json(send, 429, {'error': 'Too many requests'})
+        return
+    try:
+        params = analytics.parse_params(dict(parse_qsl(scope['query_string'].decode())), datetime.utcnow())
+    except ValueError as e:
+        await respond_json(send, 400, {'error': str(e)})
+        return
+
+    async with Session() as session:
+        owned = await session.scalar(
+            db.select(Url.id).where(Url.id == url_id, Url.user_id == user_id, Url.deleted_at.is_(None))
+        )
+        if owned is None:
+            await respond_json(send, 404, {'error': 'URL not found'})
+            return
+
+        key = ('url', url_id) + tuple(sorted(params.items()))
+        cached = analytics_cache.get(key)
+        if cached is None:
+            payload = await session.run_sync(
+                lambda sync_session: json.dumps(analytics.run(url_id, session=sync_session, **params))
+            )
+            cached = (hashlib.sha1(payload.encode()).hexdigest(), payload)
+            analytics_cache.set(key, cached)
+    etag, payload = cached
+
+    headers = [('etag', f'"{etag}"'), ('cache-control', f'private, max-age={analytics_cache.ttl}')]
+    if parse_etags(environ.get('HTTP_IF_NONE_MATCH')).contains(etag):
+        await respond(send, 304, headers=headers)
+    else:
+        await respond(send, 200, payload.encode(), 'application/json', headers)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await asyncio.to_thread(click_ingestor.stop)
+            await engine.dispose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+
+    if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD'):
+        environ = environ_of(scope)
+        match = ANALYTICS_PATH.match(scope['path'])
+        if match:
+            return await get_analytics(scope, send, int(match.group(1)), environ)
+        match = REDIRECT_PATH.match(scope['path'])
+        if match and await redirect_url(scope, send, match.group(1), environ):
+            return
+
+    await flask_app()(scope, receive, send)
@@ -1,7 +1,14 @@
+import time
+from collections import namedtuple
 from functools import wraps
-from flask import session, redirect, url_for, flash
+from flask import current_app, g, session, redirect, url_for, flash
+from storage import StorageError
 from models import User
 
+# Hot user fields kept in the (signed) session cookie so read-only pages can
+# render the navbar and plan state without touching the database
+UserSnapshot = namedtuple('UserSnapshot', ['id', 'email', 'is_premium', 'monthly_quota', 'used_quota'])
+
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -12,6 +19,59 @@ def login_required(f):
     return decorated_function
 
 def get_current_user():
-    if 'user_id' in session:
-        return User.query.get(session['user_id'])
-    return None
\ No newline at end of file
+    """Load the logged in user once per request"""
+    if '_current_user' not in g:
+        g._current_user = User.query.get(session['user_id']) if 'user_id' in session else None
+    return g._current_user
+
+def _version_key(user_id):
+    return f'user:{user_id}:ver'
+
+def user_version(user_id):
+    """Current snapshot version of a user, or None if it cannot be read"""
+    storage = current_app.extensions.get('shared_storage')
+    if storage is None:
+        return None
+    try:
+        value = storage.get(_version_key(user_id))
+    except StorageError:
+        return None
+    return int(value) if value else 0
+
+def invalidate_user(user_id):
+    """Mark every session snapshot of the user as stale after a change"""
+    storage = current_app.extensions.get('shared_storage')
+    if storage is not None:
+        try:
+            storage.incr(_version_key(user_id))
+        except StorageError:
+            current_app.logger.warning('Could not bump snapshot version of user %s', user_id)
+    if session.get('user_id') == user_id:
+        session.pop('user_snapshot', None)
+
+def get_user_snapshot():
+    """Return a UserSnapshot of the logged in user, or None.
+
+    The snapshot is served from the session while its version matches the
+    user's version in shared storage and it is younger than
+    USER_SNAPSHOT_TTL; otherwise the user is loaded and the snapshot rebuilt.
+    """
+    if 'user_id' not in session:
+        return None
+    user_id = session['user_id']
+    enabled = current_app.config.get('USER_SNAPSHOT', True)
+    version = user_version(user_id) if enabled else None
+
+    cached = session.get('user_snapshot')
+    if (version is not None and cached and cached['id'] == user_id and cached['version'] == version
+            and time.time() - cached['loaded_at'] < current_app.config.get('USER_SNAPSHOT_TTL', 300)):
+        return UserSnapshot(*(cached[field] for field in UserSnapshot._fields))
+
+    user = get_current_user()
+    if user is None:
+        session.pop('user_snapshot', None)
+        return None
+    snapshot = UserSnapshot(user.id, user.email, bool(user.is_premium), user.monthly_quota, user.used_quota)
+    if version is not None:
+        session['user_snapshot'] = dict(snapshot._asdict(), version=version, loaded_at=time.time())
+    return snapshot
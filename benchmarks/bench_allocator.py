@@ -0,0 +1,47 @@
+"""Benchmark short code allocation strategies in codes per second.
+
+Usage: python benchmarks/bench_allocator.py [--count 20000] [--block-size 1000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+from app import app, db  # noqa: E402
+from allocator import BlockAllocator, FeistelScrambler, RandomAllocator  # noqa: E402
+
+
+def bench(name, allocator, count, batch):
+    start = time.perf_counter()
+    allocated = 0
+    while allocated < count:
+        n = min(batch, count - allocated)
+        if n == 1:
+            allocator.allocate()
+        else:
+            allocator.allocate_many(n)
+        allocated += n
+    elapsed = time.perf_counter() - start
+    print(f'{name:<32} {count / elapsed:>12,.0f} codes/s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=20000)
+    parser.add_argument('--block-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        bench('random (one at a time)', RandomAllocator(), args.count // 10, 1)
+        bench('block', BlockAllocator(args.block_size), args.count, 1)
+        bench('block + scramble', BlockAllocator(args.block_size, scrambler=FeistelScrambler('bench')), args.count, 1)
+        bench('block + scramble (bulk 1000)', BlockAllocator(args.block_size, scrambler=FeistelScrambler('bench')), args.count, 1000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""Compare redirect throughput of the WSGI and ASGI serving modes under load.
+
+Seeds a scratch SQLite database, starts each server on a local port (gunicorn
+sync workers for app:app, uvicorn for asgi:application) and drives it with N
+concurrent keep-alive connections issuing GET /<short_code>. Reports requests
+per second, p50/p99 latency and failed requests per concurrency level.
+
+Usage:
+    python benchmarks/bench_async.py --concurrency 10 --concurrency 100 \\
+        --concurrency 1000 --requests 5000 --workers 2 [--output async.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SERVERS = {
+    'wsgi': ['gunicorn', '--workers', '{workers}', '--bind', '127.0.0.1:{port}', '--backlog', '4096', 'app:app'],
+    'asgi': ['uvicorn', '--workers', '{workers}', '--port', '{port}', '--backlog', '4096',
+             '--log-level', 'warning', 'asgi:application'],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def seed_database(path, urls):
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    from app import app, db
+    from benchmarks.bench_endpoints import seed
+
+    with app.app_context():
+        db.create_all()
+        return seed(users=10, urls=urls, clicks=0)
+
+
+def start_server(mode, workers, env):
+    port = free_port()
+    command = [part.format(workers=workers, port=port) for part in SERVERS[mode]]
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return process, port
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f'{mode} server did not start')
+
+
+async def read_response(reader):
+    """Read one response; returns (status, keep_alive)"""
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    if length:
+        await reader.readexactly(length)
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+async def connection(port, codes, counter, samples, errors, rng):
+    reader = writer = None
+    while counter[0] > 0:
+        counter[0] -= 1
+        request = f'GET /{rng.choice(codes)} HTTP/1.1\r\nHost: bench\r\nConnection: keep-alive\r\n\r\n'.encode()
+        began = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(request)
+            status, keep_alive = await asyncio.wait_for(read_response(reader), 30)
+            if status != 302:
+                errors.append(status)
+            samples.append(time.perf_counter() - began)
+            if not keep_alive:
+                writer.close()
+                writer = None
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+            errors.append(type(e).__name__)
+            if writer is not None:
+                writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def drive(port, codes, concurrency, requests, seed_value=0):
+    counter = [requests]
+    samples, errors = [], []
+    rng = random.Random(seed_value)
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        connection(port, codes, counter, samples, errors, rng) for _ in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - started
+    samples.sort()
+    pick = lambda q: samples[min(len(samples) - 1, int(q * (len(samples) - 1)))] * 1000 if samples else None
+    return {
+        'concurrency': concurrency,
+        'requests': requests,
+        'rps': round(len(samples) / elapsed, 1),
+        'p50_ms': round(pick(0.50), 2) if samples else None,
+        'p99_ms': round(pick(0.99), 2) if samples else None,
+        'errors': len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, action='append', help='concurrent connections (repeatable)')
+    parser.add_argument('--requests', type=int, default=5000, help='requests per concurrency level')
+    parser.add_argument('--workers', type=int, default=2, help='server worker processes')
+    parser.add_argument('--urls', type=int, default=1000, help='short links to seed')
+    parser.add_argument('--mode', choices=sorted(SERVERS), action='append', help='servers to test (default: both)')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    # Every connection needs a descriptor on both ends
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    codes = seed_database(path, args.urls)
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{path}', RATELIMIT_ENABLED='0', PYTHONPATH=ROOT)
+
+    report = {}
+    for mode in args.mode or sorted(SERVERS):
+        process, port = start_server(mode, args.workers, env)
+        try:
+            asyncio.run(drive(port, codes, 10, 200))  # warm up caches and pools
+            report[mode] = []
+            for concurrency in args.concurrency or [10, 100, 1000]:
+                stats = asyncio.run(drive(port, codes, concurrency, max(args.requests, concurrency)))
+                report[mode].append(stats)
+                print(f"{mode}  c={concurrency:<5} {stats['rps']:>9.1f} req/s  p50 {stats['p50_ms']} ms  "
+                      f"p99 {stats['p99_ms']} ms  errors {stats['errors']}")
+        finally:
+            process.terminate()
+            process.wait(10)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+"""Benchmark the main endpoints through the WSGI app at several data sizes.
+
+Seeds N users, M URLs and K clicks into a scratch SQLite database, then
+measures p50/p99 latency and requests per second of redirect_url,
+shorten_url, dashboard and get_analytics with the Flask test client.
+
+Usage:
+    python benchmarks/bench_endpoints.py --size 10:100:10000 --size 100:1000:100000 \\
+        --requests 500 --output bench.json [--compare baseline.json --threshold 0.25]
+
+With --compare the run exits non-zero if any endpoint's p50 or p99 latency
+grew, or its throughput dropped, by more than the threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ENDPOINTS = ['redirect_url', 'shorten_url', 'dashboard', 'get_analytics']
+
+
+def parse_size(spec):
+    users, urls, clicks = (int(part) for part in spec.split(':'))
+    return users, urls, clicks
+
+
+def seed(users, urls, clicks, seed_value=0):
+    """Fill the (empty) database and return the seeded short codes"""
+    from werkzeug.security import generate_password_hash
+    from app import db, code_allocator
+    from models import User, Url, Click, bulk_insert
+    from clicks import ClickRecord
+    import interning
+    import rollups
+
+    rng = random.Random(seed_value)
+    now = datetime.utcnow()
+    # Codes are leased on a separate connection, before this session writes
+    codes = code_allocator.allocate_many(urls)
+    password = generate_password_hash('benchmark-password')
+    bulk_insert(User, [
+        {
+            'id': i + 1,
+            'email': f'user{i}@bench.example',
+            'password': password,
+            'created_at': now,
+            'is_premium': True,
+            'monthly_quota': 5,
+            'used_quota': 0,
+            'quota_reset_date': now + timedelta(days=30),
+        }
+        for i in range(users)
+    ])
+
+    bulk_insert(Url, [
+        {
+            'id': i + 1,
+            'original_url': f'https://example.com/page/{i}',
+            'short_code': code,
+            'user_id': i % users + 1,
+            'created_at': now - timedelta(minutes=urls - i),
+        }
+        for i, code in enumerate(codes)
+    ])
+    db.session.commit()
+
+    batch = []
+    for i in range(clicks):
+        batch.append(ClickRecord(
+            url_id=rng.randint(1, urls),
+            ip_address=f'10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}',
+            clicked_at=now - timedelta(seconds=rng.randint(0, 7 * 24 * 3600)),
+            user_agent='Mozilla/5.0 (benchmark)',
+            referrer=None,
+        ))
+        if len(batch) == 1000 or i == clicks - 1:
+            bulk_insert(Click, interning.click_rows(batch))
+            rollups.apply_clicks(batch)
+            db.session.commit()
+            batch = []
+    return codes
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def measure(request, count, expected=200):
+    """Time `count` calls of request(i), which must return `expected`, and summarize them"""
+    samples = []
+    started = time.perf_counter()
+    for i in range(count):
+        begin = time.perf_counter()
+        result = request(i)
+        samples.append(time.perf_counter() - begin)
+        if result != expected:
+            # E.g. 429s would measure the rate limiter, not the endpoint
+            raise RuntimeError(f'request returned {result!r} instead of {expected!r}')
+    elapsed = time.perf_counter() - started
+    return {
+        'requests': count,
+        'p50_ms': round(percentile(samples, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(samples, 0.99) * 1000, 3),
+        'rps': round(count / elapsed, 1),
+    }
+
+
+def run_size(users, urls, clicks, requests, seed_value=0):
+    from app import app, db, limiter, click_ingestor, code_allocator, resolution_cache
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        code_allocator.reset()
+        codes = seed(users, urls, clicks, seed_value)
+    resolution_cache.clear()
+
+    rng = random.Random(seed_value)
+    # Most redirect traffic goes to a few hot links
+    hot = codes[:max(1, len(codes) // 100)]
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+    owned = list(range(1, urls + 1, users))
+
+    limiter.enabled = False
+    try:
+        results = run_endpoints(client, codes, hot, owned, requests, rng)
+    finally:
+        limiter.enabled = True
+        click_ingestor.stop()
+    return results
+
+
+def run_endpoints(client, codes, hot, owned, requests, rng):
+    def shorten(i):
+        # Rejected links are redirected elsewhere with a flash, also with 302
+        response = client.post('/shorten', data={'url': f'https://example.org/new/{i}'})
+        return response.status_code, response.location
+
+    return {
+        'redirect_url': measure(
+            lambda i: client.get('/' + (rng.choice(hot) if rng.random() < 0.9 else rng.choice(codes))).status_code,
+            requests, expected=302
+        ),
+        'shorten_url': measure(shorten, max(1, requests // 5), expected=(302, '/dashboard')),
+        'dashboard': measure(lambda i: client.get('/dashboard').status_code, max(1, requests // 5)),
+        'get_analytics': measure(
+            lambda i: client.get(f'/api/analytics/{owned[i % len(owned)]}').status_code,
+            requests
+        ),
+    }
+
+
+def compare(current, baseline, threshold):
+    """List the endpoints of `current` that regressed against `baseline`"""
+    regressions = []
+    for size, endpoints in current['results'].items():
+        for endpoint, stats in endpoints.items():
+            base = baseline.get('results', {}).get(size, {}).get(endpoint)
+            if not base:
+                continue
+            for metric in ('p50_ms', 'p99_ms'):
+                if stats[metric] > base[metric] * (1 + threshold):
+                    regressions.append(f'{size} {endpoint} {metric}: {base[metric]} -> {stats[metric]}')
+            if stats['rps'] < base['rps'] * (1 - threshold):
+                regressions.append(f"{size} {endpoint} rps: {base['rps']} -> {stats['rps']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', action='append', help='users:urls:clicks (repeatable)')
+    parser.add_argument('--requests', type=int, default=300, help='requests per endpoint and size')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='baseline JSON file to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed relative slowdown')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ['RATELIMIT_ENABLED'] = '0'
+    sizes = args.size or ['10:100:10000', '50:1000:100000']
+
+    report = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'requests': args.requests,
+        },
+        'results': {},
+    }
+    for spec in sizes:
+        users, urls, clicks = parse_size(spec)
+        report['results'][spec] = run_size(users, urls, clicks, args.requests)
+        for endpoint in ENDPOINTS:
+            stats = report['results'][spec][endpoint]
+            print(f"{spec:<18} {endpoint:<14} p50 {stats['p50_ms']:>8.2f} ms  "
+                  f"p99 {stats['p99_ms']:>8.2f} ms  {stats['rps']:>9.1f} req/s")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for line in regressions:
+            print('REGRESSION', line)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""Measure cold-start import time of the serverless entry points.
+
+Imports each entry point (app for the full Flask app, redirects for the
+redirect-only function) in a fresh interpreter with `python -X importtime`,
+repeats that R times and reports the median total import time and the
+slowest top-level modules. The first-party modules of the repository are
+always listed so their cost can be tracked from run to run.
+
+Usage:
+    python benchmarks/bench_startup.py --repeat 5 --top 10 --output startup.json \\
+        [--compare baseline.json --threshold 0.25]
+
+With --compare the run exits non-zero if an entry point's total import time
+grew by more than the threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_POINTS = ['app', 'redirects']
+
+
+def first_party_modules():
+    return sorted(name[:-3] for name in os.listdir(ROOT) if name.endswith('.py'))
+
+
+def parse_importtime(output, module):
+    """Import times (microseconds) from `python -X importtime -c 'import module'`.
+
+    Returns the cumulative time of `module` itself and of each module it
+    imported directly. importtime prints a module after the imports it
+    triggered, indented one level (two spaces) deeper.
+    """
+    times, children = {}, {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children[name.strip()] = int(cumulative)
+        elif depth == 0:
+            if name.strip() == module:
+                times = dict(children, **{module: int(cumulative)})
+            children = {}
+    return times
+
+
+def import_times(module):
+    """Per-module import times (microseconds) of one cold import"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+        env=dict(os.environ, PYTHONPATH=ROOT),
+    )
+    return parse_importtime(result.stderr, module)
+
+
+def measure(module, repeat):
+    """Median import time of `module` and of each module it loads, in ms"""
+    import_times(module)  # writes the bytecode caches, like a deployed build
+    runs = [import_times(module) for _ in range(repeat)]
+    names = set().union(*runs)
+    per_module = {
+        name: round(statistics.median(run.get(name, 0) for run in runs) / 1000, 2)
+        for name in names
+    }
+    return {
+        'total_ms': per_module.pop(module, 0.0),
+        'modules': dict(sorted(per_module.items(), key=lambda item: -item[1])),
+    }
+
+
+def compare(current, baseline, threshold):
+    """Describe entry points whose import time grew by more than `threshold`"""
+    regressions = []
+    for module, stats in current['results'].items():
+        before = baseline.get('results', {}).get(module)
+        if before and stats['total_ms'] > before['total_ms'] * (1 + threshold):
+            regressions.append(f"{module} total_ms {before['total_ms']} -> {stats['total_ms']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--module', action='append', help='entry point to import (repeatable)')
+    parser.add_argument('--repeat', type=int, default=5, help='cold imports per entry point')
+    parser.add_argument('--top', type=int, default=10, help='slowest modules to print')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='baseline JSON file to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed relative slowdown')
+    args = parser.parse_args()
+
+    report = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+        },
+        'results': {},
+    }
+    local = set(first_party_modules())
+    for module in args.module or ENTRY_POINTS:
+        stats = report['results'][module] = measure(module, args.repeat)
+        print(f"{module:<12} {stats['total_ms']:>8.1f} ms")
+        shown = list(stats['modules'].items())[:args.top]
+        shown += [(name, ms) for name, ms in stats['modules'].items() if name in local and (name, ms) not in shown]
+        for name, ms in shown:
+            print(f"    {name:<24} {ms:>8.1f} ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for line in regressions:
+            print('REGRESSION', line)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Benchmark page render times with and without cached fragments.
+
+Compares the dashboard with its links fragment rendered on every request
+against the cached fragment, and the pricing page rendered per request
+against the prerendered one.
+
+Usage: python benchmarks/bench_templates.py [--links 25] [--requests 200]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+scratch = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(scratch, 'bench.db')
+# Fragments are only cached with shared storage
+os.environ['STORAGE_URL'] = 'sqlite:///' + os.path.join(scratch, 'storage.db')
+os.environ['RATELIMIT_ENABLED'] = '0'
+
+from app import app, db, fragment_cache, static_pages  # noqa: E402
+from models import User, Url, bulk_insert  # noqa: E402
+
+
+def seed(links):
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(id=1, email='bench@example.com', password='x'))
+        db.session.commit()
+        now = datetime.utcnow()
+        bulk_insert(Url, [
+            {'original_url': f'https://example.com/{i}', 'short_code': f'b{i}', 'user_id': 1,
+             'created_at': now - timedelta(minutes=i)}
+            for i in range(links)
+        ])
+        db.session.commit()
+
+
+def bench(name, client, path, requests, before=None):
+    samples = []
+    for _ in range(requests):
+        if before is not None:
+            before()
+        start = time.perf_counter()
+        response = client.get(path)
+        samples.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.status_code
+    median = statistics.median(samples) * 1000
+    print(f'{name:<32} {median:>8.2f} ms median')
+    return median
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--links', type=int, default=25, help='Links owned by the benchmark user')
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    seed(args.links)
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+
+    rendered = bench('dashboard (rendered)', client, '/dashboard', args.requests, fragment_cache.clear)
+    cached = bench('dashboard (cached fragment)', client, '/dashboard', args.requests)
+    print(f'{"":<32} {1 - cached / rendered:>8.0%} faster')
+
+    anonymous = app.test_client()
+    rendered = bench('pricing (rendered)', anonymous, '/pricing', args.requests, static_pages.clear)
+    prerendered = bench('pricing (prerendered)', anonymous, '/pricing', args.requests)
+    print(f'{"":<32} {1 - prerendered / rendered:>8.0%} faster')
+
+
+if __name__ == '__main__':
+    main()
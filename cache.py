@@ -0,0 +1,231 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from storage import StorageError
+
+# Cached resolution of a short code with the link's redirect policy (see
+# Url). Only plain values are stored so entries stay valid outside the
+# SQLAlchemy session that loaded them.
+ResolvedUrl = namedtuple(
+    'ResolvedUrl', ['id', 'original_url', 'redirect_status', 'cache_max_age', 'edge_cacheable'],
+    defaults=(None, 0, False)
+)
+
+# Marker stored for short codes that do not exist (negative caching)
+MISSING = object()
+
+
+class ResolutionCache:
+    """Bounded LRU cache of short_code -> ResolvedUrl with per-entry TTL.
+
+    An optional shared StorageBackend acts as a second tier, so a code
+    resolved by one worker is seen by the others. Invalidating a code also
+    gives it a new random version in the backend; local entries remember the
+    version they were cached at and are dropped on a mismatch, so an
+    invalidation reaches every worker on its next lookup. Backend failures degrade to a
+    cache miss, or to the local tier alone.
+    """
+
+    def __init__(self, maxsize=10000, ttl=300, negative_ttl=30, backend=None, prefix='resolve:'):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.backend = backend
+        self.prefix = prefix
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Version read by this thread's last miss, for the set() that follows
+        self._miss = threading.local()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.backend_errors = 0
+
+    def get(self, short_code):
+        """Return the cached value, MISSING for a cached miss, or None if unknown"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(short_code)
+            if entry is not None and entry[1] <= now:
+                del self._entries[short_code]
+                self.expirations += 1
+                entry = None
+
+        version = None
+        if self.backend is not None:
+            version = self._version(short_code)
+            # While the backend is unreachable local entries are served as is
+            if entry is not None and version is not None and version != entry[2]:
+                # Invalidated by another worker
+                with self._lock:
+                    if self._entries.get(short_code) is entry:
+                        del self._entries[short_code]
+                        self.invalidations += 1
+                entry = None
+        if entry is not None:
+            with self._lock:
+                if short_code in self._entries:
+                    self._entries.move_to_end(short_code)
+                if entry[0] is MISSING:
+                    self.negative_hits += 1
+                else:
+                    self.hits += 1
+            return entry[0]
+
+        value = self._get_shared(short_code)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                self._miss.entry = (short_code, version)
+                return None
+            self.shared_hits += 1
+        self._set_local(short_code, value, version)
+        return value
+
+    def set(self, short_code, value):
+        """Cache a resolved URL, or MISSING to remember an unknown code"""
+        version = None
+        if self.backend is not None:
+            # Use the version seen before the value was loaded, so an
+            # invalidation that happened meanwhile is not masked
+            miss = getattr(self._miss, 'entry', None)
+            self._miss.entry = None
+            version = miss[1] if miss is not None and miss[0] == short_code else self._version(short_code)
+        self._set_local(short_code, value, version)
+        ttl = self.negative_ttl if value is MISSING else self.ttl
+        if self.backend is not None and ttl > 0:
+            payload = b'' if value is MISSING else json.dumps(list(value))
+            self._call_backend(self.backend.set, self.prefix + short_code, payload, ttl)
+
+    def invalidate(self, short_code):
+        """Forget a code here and, through the backend, in every other worker"""
+        self.invalidate_many([short_code])
+
+    def invalidate_many(self, short_codes):
+        """invalidate() several codes with one batched backend call per step"""
+        short_codes = list(short_codes)
+        with self._lock:
+            for short_code in short_codes:
+                if self._entries.pop(short_code, None) is not None:
+                    self.invalidations += 1
+        if self.backend is not None and short_codes:
+            # A fresh token rather than a counter: a counter restarting after
+            # its key expired could repeat a version another worker cached at
+            self._call_backend(
+                self.backend.set_many,
+                [(self._version_key(short_code), os.urandom(8).hex()) for short_code in short_codes],
+                2 * max(self.ttl, self.negative_ttl)
+            )
+            self._call_backend(self.backend.delete_many, [self.prefix + short_code for short_code in short_codes])
+
+    def _version_key(self, short_code):
+        return f'{self.prefix}v:{short_code}'
+
+    def _version(self, short_code):
+        """Version token of a code in the backend (b'' if never invalidated), or None if unreadable"""
+        try:
+            payload = self.backend.get(self._version_key(short_code))
+        except StorageError:
+            with self._lock:
+                self.backend_errors += 1
+            return None
+        return payload or b''
+
+    def _set_local(self, short_code, value, version=None):
+        ttl = self.negative_ttl if value is MISSING else self.ttl
+        if self.maxsize <= 0 or ttl <= 0:
+            return
+        with self._lock:
+            self._entries[short_code] = (value, time.monotonic() + ttl, version)
+            self._entries.move_to_end(short_code)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _get_shared(self, short_code):
+        if self.backend is None:
+            return None
+        payload = self._call_backend(self.backend.get, self.prefix + short_code)
+        if payload is None:
+            return None
+        return ResolvedUrl(*json.loads(payload)) if payload else MISSING
+
+    def _call_backend(self, method, *args):
+        try:
+            return method(*args)
+        except StorageError:
+            with self._lock:
+                self.backend_errors += 1
+            return None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.shared_hits = self.misses = self.negative_hits = 0
+            self.evictions = self.expirations = self.invalidations = 0
+            self.backend_errors = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'negative_hits': self.negative_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'backend_errors': self.backend_errors,
+            }
+
+
+class ResultCache:
+    """Small LRU cache of computed results that expire after `ttl` seconds"""
+
+    def __init__(self, maxsize=1000, ttl=30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= now:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,181 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+from sqlalchemy.exc import DataError, IntegrityError
+from models import db, Click, bulk_insert
+import interning
+import rollups
+import fragments
+
+# Compact click record queued by the redirect path
+ClickRecord = namedtuple('ClickRecord', ['url_id', 'ip_address', 'clicked_at', 'user_agent', 'referrer'])
+
+
+class ClickIngestor:
+    """Buffers clicks in a bounded queue and writes them in batches.
+
+    A background thread flushes the queue with multi-row inserts whenever
+    CLICK_BATCH_SIZE records are pending or CLICK_FLUSH_INTERVAL seconds have
+    passed. When the queue is full new clicks wait up to CLICK_ENQUEUE_TIMEOUT
+    seconds and are then dropped and counted. Set CLICK_INGEST_ASYNC to False
+    to write every click inline instead.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._stopping = threading.Event()
+        self._start_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CLICK_INGEST_ASYNC', os.environ.get('CLICK_INGEST_ASYNC', '1') == '1')
+        app.config.setdefault('CLICK_QUEUE_SIZE', int(os.environ.get('CLICK_QUEUE_SIZE', 10000)))
+        app.config.setdefault('CLICK_BATCH_SIZE', int(os.environ.get('CLICK_BATCH_SIZE', 500)))
+        app.config.setdefault('CLICK_FLUSH_INTERVAL', float(os.environ.get('CLICK_FLUSH_INTERVAL', 1.0)))
+        app.config.setdefault('CLICK_ENQUEUE_TIMEOUT', float(os.environ.get('CLICK_ENQUEUE_TIMEOUT', 0.0)))
+        self.app = app
+        self._queue = queue.Queue(maxsize=app.config['CLICK_QUEUE_SIZE'])
+        app.extensions['click_ingestor'] = self
+        atexit.register(self.stop)
+
+    def record(self, click):
+        """Queue a ClickRecord. Returns False if it had to be dropped."""
+        if not self.app.config['CLICK_INGEST_ASYNC']:
+            self._write([click])
+            return True
+
+        self._ensure_worker()
+        timeout = self.app.config['CLICK_ENQUEUE_TIMEOUT']
+        try:
+            if timeout > 0:
+                self._queue.put(click, timeout=timeout)
+            else:
+                self._queue.put_nowait(click)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    def flush(self):
+        """Write everything currently queued from the calling thread"""
+        written = 0
+        batch_size = self.app.config['CLICK_BATCH_SIZE']
+        while True:
+            batch = self._drain(batch_size)
+            if not batch:
+                return written
+            written += self._write(batch)
+
+    def stop(self, timeout=5.0):
+        """Stop the background writer and flush pending clicks"""
+        self._stopping.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout)
+        self._thread = None
+        if self._queue is not None:
+            self.flush()
+        self._stopping.clear()
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+            'capacity': self._queue.maxsize if self._queue is not None else 0,
+            'enqueued': self.enqueued,
+            'dropped': self.dropped,
+            'written': self.written,
+            'failed': self.failed,
+            'batches': self.batches,
+        }
+
+    def _ensure_worker(self):
+        # Threads do not survive a fork, so prefork servers such as gunicorn
+        # start a fresh writer in each worker process.
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='click-ingestor', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch_size = self.app.config['CLICK_BATCH_SIZE']
+            deadline = time.monotonic() + self.app.config['CLICK_FLUSH_INTERVAL']
+            batch = []
+            while len(batch) < batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._stopping.is_set():
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=min(remaining, 0.1)))
+                except queue.Empty:
+                    continue
+            if batch:
+                self._write(batch)
+
+    def _drain(self, limit):
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        """Write a batch of clicks; returns how many were written"""
+        with self._write_lock, self.app.app_context():
+            written = self._insert(batch)
+            if not written:
+                return 0
+            # Dashboards show the new totals once the rollups are committed
+            try:
+                fragments.bump_for_urls({click.url_id for click in written})
+            except Exception:
+                self.app.logger.exception('Failed to bump data versions after writing clicks')
+        self.written += len(written)
+        self.batches += 1
+        return len(written)
+
+    def _insert(self, batch):
+        """Insert and roll up `batch` in one transaction.
+
+        A batch rejected for its data is split in halves and retried, so one
+        bad record costs only itself. Any other failure (database down, lock
+        timeout) fails the whole batch at once rather than retrying every
+        part of it. Returns the records that were written.
+        """
+        try:
+            bulk_insert(Click, interning.click_rows(batch))
+            rollups.apply_clicks(batch)
+            db.session.commit()
+            return batch
+        except (IntegrityError, DataError):
+            db.session.rollback()
+            if len(batch) == 1:
+                self.failed += 1
+                self.app.logger.exception('Failed to write click for url %s', batch[0].url_id)
+                return []
+        except Exception:
+            db.session.rollback()
+            self.failed += len(batch)
+            self.app.logger.exception('Failed to write %d clicks', len(batch))
+            return []
+        middle = len(batch) // 2
+        return self._insert(batch[:middle]) + self._insert(batch[middle:])
@@ -0,0 +1,138 @@
+"""Database engine profiles and read-replica routing.
+
+A profile names the engine options and per-connection settings for one kind
+of database. 'sqlite' switches every connection to WAL with a busy timeout,
+so readers do not block the writer and concurrent writers wait for the lock
+instead of failing with "database is locked". 'postgres' sizes and recycles
+the connection pool. DB_PROFILE=auto picks the profile from the database URL.
+
+With DATABASE_REPLICA_URL set, read_session() returns a session on the
+replica for queries that tolerate replication lag (redirect lookups and
+analytics); everything else keeps using db.session on the primary.
+"""
+from flask import g
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Settings read from the environment, with their defaults
+DEFAULTS = {
+    'DB_PROFILE': 'auto',
+    'DATABASE_REPLICA_URL': None,
+    'SQLITE_JOURNAL_MODE': 'WAL',
+    'SQLITE_SYNCHRONOUS': 'NORMAL',
+    'SQLITE_MMAP_SIZE': 256 * 1024 * 1024,
+    'SQLITE_BUSY_TIMEOUT_MS': 5000,
+    'DB_POOL_SIZE': 10,
+    'DB_MAX_OVERFLOW': 20,
+    'DB_POOL_RECYCLE': 1800,
+    'DB_POOL_PRE_PING': True,
+}
+
+PROFILES = ('sqlite', 'postgres', 'none')
+
+REPLICA = 'replica'
+
+
+def from_env(environ):
+    """DEFAULTS overridden by the environment, converted to their types"""
+    settings = {}
+    for name, default in DEFAULTS.items():
+        value = environ.get(name)
+        if value is None or value == '':
+            settings[name] = default
+        elif isinstance(default, bool):
+            settings[name] = value == '1'
+        elif isinstance(default, int):
+            settings[name] = int(value)
+        else:
+            settings[name] = value
+    return settings
+
+
+def profile_for(url, name='auto'):
+    """Profile to use for a database URL"""
+    if name != 'auto':
+        if name not in PROFILES:
+            raise ValueError(f"DB_PROFILE must be auto or one of {', '.join(PROFILES)}")
+        return name
+    scheme = url.split(':', 1)[0].split('+')[0]
+    if scheme == 'sqlite':
+        return 'sqlite'
+    if scheme in ('postgres', 'postgresql'):
+        return 'postgres'
+    return 'none'
+
+
+def engine_options(profile, settings):
+    """Keyword arguments for create_engine() (SQLALCHEMY_ENGINE_OPTIONS)"""
+    if profile == 'postgres':
+        return {
+            'pool_size': settings['DB_POOL_SIZE'],
+            'max_overflow': settings['DB_MAX_OVERFLOW'],
+            'pool_recycle': settings['DB_POOL_RECYCLE'],
+            'pool_pre_ping': settings['DB_POOL_PRE_PING'],
+        }
+    return {}
+
+
+def sqlite_pragmas(settings):
+    """(pragma, value) pairs run on every new SQLite connection"""
+    return [
+        ('journal_mode', settings['SQLITE_JOURNAL_MODE']),
+        ('synchronous', settings['SQLITE_SYNCHRONOUS']),
+        ('mmap_size', settings['SQLITE_MMAP_SIZE']),
+        ('busy_timeout', settings['SQLITE_BUSY_TIMEOUT_MS']),
+    ]
+
+
+def apply_pragmas(engine, pragmas):
+    """Run the pragmas on each connection the engine opens"""
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma, value in pragmas:
+            cursor.execute(f'PRAGMA {pragma}={value}')
+        cursor.close()
+
+    event.listen(engine, 'connect', on_connect)
+
+
+def configure(app):
+    """Set the engine options and replica bind from the app's settings.
+
+    Call before db.init_app(app).
+    """
+    url = app.config['SQLALCHEMY_DATABASE_URI']
+    profile = profile_for(url, app.config['DB_PROFILE'])
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {}).update(engine_options(profile, app.config))
+    if app.config['DATABASE_REPLICA_URL']:
+        app.config.setdefault('SQLALCHEMY_BINDS', {})[REPLICA] = app.config['DATABASE_REPLICA_URL']
+
+
+def init_app(app, db):
+    """Apply the SQLite profile to the app's engines and close read sessions.
+
+    Call after db.init_app(app).
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite' and profile_for(str(engine.url), app.config['DB_PROFILE']) == 'sqlite':
+                apply_pragmas(engine, sqlite_pragmas(app.config))
+
+    @app.teardown_appcontext
+    def close_read_session(exc):
+        session = g.pop('_read_session', None)
+        if session is not None:
+            session.close()
+
+
+def has_replica(db):
+    return REPLICA in db.engines
+
+
+def read_session(db):
+    """Session for reads that tolerate replication lag; db.session without a replica"""
+    if not has_replica(db):
+        return db.session
+    if '_read_session' not in g:
+        g._read_session = Session(db.engines[REPLICA])
+    return g._read_session
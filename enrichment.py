@@ -0,0 +1,205 @@
+"""Offline click enrichment.
+
+The redirect path stores the raw client IP, User-Agent and Referer of each
+click. The enrichment worker (flask enrich-clicks) later resolves them in
+batches into short normalized columns on Click: country (ISO 3166 alpha-2),
+device (desktop, mobile, tablet, bot or other), browser family and referrer
+domain, so analytics can group by them without parsing strings per query.
+
+Countries come from a pluggable resolver chosen by GEOIP_RESOLVER:
+
+    stub://                     no lookups; country stays NULL
+    file:///path/ranges.csv     local IP range file, rows of start,end,country
+    ipapi://                    the ipapi.co web API (needs IPAPI_KEY)
+
+Lookups and User-Agent parsing go through per-worker LRU caches, since a
+batch of clicks repeats the same few IPs and browsers many times.
+"""
+import bisect
+import csv
+import ipaddress
+import time
+from datetime import datetime
+from functools import lru_cache
+from urllib.parse import urlparse, unquote
+from models import db, Click, UserAgent, Referrer
+from interning import join_lookups
+from analytics import USER_AGENT_FAMILIES
+from utils import get_ip_location
+
+
+class StubResolver:
+    """Resolves nothing; for development and when no IP data is available"""
+
+    def country(self, ip_address):
+        return None
+
+
+class RangeFileResolver:
+    """Country lookups in a local CSV of IP ranges: start,end,country.
+
+    IPv4 and IPv6 ranges may be mixed; lines starting with '#' are skipped.
+    The ranges must not overlap. Lookups are a binary search.
+    """
+
+    def __init__(self, path):
+        ranges = {4: [], 6: []}
+        with open(path, newline='') as f:
+            for row in csv.reader(f):
+                if not row or row[0].startswith('#'):
+                    continue
+                start, end = ipaddress.ip_address(row[0].strip()), ipaddress.ip_address(row[1].strip())
+                ranges[start.version].append((int(start), int(end), row[2].strip().upper() or None))
+        self._starts, self._ranges = {}, {}
+        for version, rows in ranges.items():
+            rows.sort()
+            self._starts[version] = [start for start, _, _ in rows]
+            self._ranges[version] = rows
+
+    def country(self, ip_address):
+        address = ipaddress.ip_address(ip_address)
+        index = bisect.bisect_right(self._starts[address.version], int(address)) - 1
+        if index < 0:
+            return None
+        _, end, country = self._ranges[address.version][index]
+        return country if int(address) <= end else None
+
+
+class IpapiResolver:
+    """Country lookups through the ipapi.co API, one request per IP"""
+
+    def country(self, ip_address):
+        location = get_ip_location(ip_address)
+        return location.get('country_code') if location else None
+
+
+def resolver_from_url(url):
+    """Build a resolver from stub://, file:///path or ipapi://"""
+    parsed = urlparse(url)
+    if parsed.scheme == 'stub':
+        return StubResolver()
+    if parsed.scheme == 'file':
+        return RangeFileResolver(unquote(parsed.path))
+    if parsed.scheme == 'ipapi':
+        return IpapiResolver()
+    raise ValueError(f'unsupported resolver URL: {url}')
+
+
+def _matcher(pattern):
+    """Python test for a case-insensitive LIKE pattern '%text%' or 'text%'"""
+    text = pattern.strip('%').lower()
+    if pattern.startswith('%'):
+        return lambda value: text in value
+    return lambda value: value.startswith(text)
+
+
+# Same families, in the same order, as analytics.user_agent_family()
+BROWSER_MATCHERS = [(_matcher(pattern), family) for pattern, family in USER_AGENT_FAMILIES]
+
+# Checked in order; the first substring found names the device type
+DEVICE_MARKERS = [
+    ('ipad', 'tablet'),
+    ('tablet', 'tablet'),
+    ('mobi', 'mobile'),
+    ('iphone', 'mobile'),
+    ('android', 'tablet'),  # Android without "Mobile" is a tablet
+]
+
+
+def parse_user_agent(user_agent):
+    """(device, browser) of a User-Agent header"""
+    if not user_agent:
+        return None, 'Unknown'
+    value = user_agent.lower()
+    browser = next((family for matches, family in BROWSER_MATCHERS if matches(value)), 'Other')
+    if browser == 'Bot':
+        return 'bot', browser
+    if browser == 'curl':
+        return 'other', browser
+    device = next((device for marker, device in DEVICE_MARKERS if marker in value), 'desktop')
+    return device, browser
+
+
+def referrer_domain(referrer):
+    """Host name of a Referer URL without a leading 'www.', or None"""
+    if not referrer:
+        return None
+    try:
+        host = urlparse(referrer).hostname
+    except ValueError:
+        return None
+    if not host:
+        return None
+    return (host[4:] if host.startswith('www.') else host)[:255]
+
+
+def _public(ip_address):
+    try:
+        return ipaddress.ip_address(ip_address).is_global
+    except ValueError:
+        return False
+
+
+class Enricher:
+    """Fills in the enrichment columns of clicks that have none yet"""
+
+    def __init__(self, resolver, cache_size=10000):
+        self.resolver = resolver
+        self.country = lru_cache(maxsize=cache_size)(self._country)
+        self.user_agent = lru_cache(maxsize=cache_size)(parse_user_agent)
+
+    def _country(self, ip_address):
+        # Private and malformed addresses have no country; skip the lookup
+        return self.resolver.country(ip_address) if _public(ip_address) else None
+
+    def enrich(self, ip_address, user_agent, referrer):
+        """Enrichment column values for one click"""
+        device, browser = self.user_agent(user_agent)
+        return {
+            'country': self.country(ip_address),
+            'device': device,
+            'browser': browser,
+            'referrer_domain': referrer_domain(referrer),
+        }
+
+    def run_batch(self, batch_size=1000):
+        """Enrich the oldest `batch_size` pending clicks; returns how many"""
+        rows = db.session.execute(
+            join_lookups(db.select(Click.id, Click.ip_address, UserAgent.value, Referrer.value))
+            .where(Click.enriched_at.is_(None))
+            .order_by(Click.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return 0
+        now = datetime.utcnow()
+        db.session.execute(db.update(Click), [
+            dict(self.enrich(ip_address, user_agent, referrer), id=click_id, enriched_at=now)
+            for click_id, ip_address, user_agent, referrer in rows
+        ])
+        db.session.commit()
+        return len(rows)
+
+    def run(self, batch_size=1000, limit=None, follow=False, interval=5.0):
+        """Enrich pending clicks batch by batch and return the total.
+
+        Stops when none are left or `limit` clicks were enriched; with
+        `follow` it waits `interval` seconds for new clicks instead.
+        """
+        total = 0
+        while limit is None or total < limit:
+            size = batch_size if limit is None else min(batch_size, limit - total)
+            done = self.run_batch(size)
+            total += done
+            if done < size:
+                if not follow:
+                    break
+                time.sleep(interval)
+        return total
+
+    def stats(self):
+        return {
+            f'{name}_cache_{field}': getattr(cache.cache_info(), field)
+            for name, cache in (('country', self.country), ('user_agent', self.user_agent))
+            for field in ('hits', 'misses', 'currsize')
+        }
@@ -0,0 +1,70 @@
+import csv
+import io
+import json
+from models import db, Click
+from interning import click_column, join_lookups
+
+EXPORT_COLUMNS = ['clicked_at', 'ip_address', 'user_agent', 'referrer']
+
+# Leading characters that make spreadsheet applications evaluate a cell
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def csv_cell(value):
+    """Quote a client-supplied value so spreadsheets show it as text, not a formula"""
+    if value and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def click_batches(url_id, start=None, end=None, batch_size=1000):
+    """Yield lists of a Url's click rows in time order.
+
+    Rows are fetched through a server-side cursor `batch_size` at a time
+    (yield_per), so memory use does not grow with the number of clicks.
+    """
+    query = (
+        join_lookups(db.select(*(click_column(column) for column in EXPORT_COLUMNS)))
+        .where(Click.url_id == url_id)
+        .order_by(Click.clicked_at, Click.id)
+        .execution_options(yield_per=batch_size)
+    )
+    if start is not None:
+        query = query.where(Click.clicked_at >= start)
+    if end is not None:
+        query = query.where(Click.clicked_at < end)
+    yield from db.session.execute(query).partitions()
+
+
+def stream_clicks(url_id, fmt='csv', start=None, end=None, batch_size=1000):
+    """Render a click export as chunks of text, one chunk per batch of rows"""
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        # Send the header before running the query so the download starts
+        yield buffer.getvalue()
+        for batch in click_batches(url_id, start, end, batch_size):
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(
+                (clicked_at.isoformat(), csv_cell(ip_address), csv_cell(user_agent), csv_cell(referrer))
+                for clicked_at, ip_address, user_agent, referrer in batch
+            )
+            yield buffer.getvalue()
+    else:
+        for batch in click_batches(url_id, start, end, batch_size):
+            yield ''.join(
+                json.dumps({
+                    'clicked_at': clicked_at.isoformat(),
+                    'ip_address': ip_address,
+                    'user_agent': user_agent,
+                    'referrer': referrer,
+                }) + '\n'
+                for clicked_at, ip_address, user_agent, referrer in batch
+            )
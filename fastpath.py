@@ -0,0 +1,185 @@
+"""WSGI fast path for short code redirects.
+
+RedirectFastPath wraps a WSGI app and answers GET and HEAD requests for
+/<short_code> before any routing happens:
+
+- a known code is redirected with the link's status and Cache-Control
+  policy, using headers prebuilt per target URL and without creating
+  request or response objects,
+- an unknown code, or a path that cannot be a short code, gets a 404 page
+  rendered once and served from memory,
+- everything else goes to the wrapped app, including the single-segment
+  paths of the app's own routes (/login, /pricing, ...).
+
+The cached 404 page is the anonymous one, so requests that carry a session
+cookie are left to the wrapped app, which renders it for the user.
+"""
+import re
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+from werkzeug.urls import iri_to_uri
+from clicks import ClickRecord
+from models import db, Url
+from storage import StorageError
+from utils import client_ip
+
+# One path segment, and what a short code can look like
+SEGMENT = re.compile(r'^/([^/]+)$')
+SHORT_CODE = re.compile(r'^[A-Za-z0-9]{1,%d}$' % Url.short_code.type.length)
+
+STATUS_LINES = {
+    301: '301 Moved Permanently',
+    302: '302 Found',
+    307: '307 Temporary Redirect',
+    308: '308 Permanent Redirect',
+}
+TOO_MANY_REQUESTS = b'Too many requests'
+
+# Longest Cache-Control max-age a link may ask for (one year)
+MAX_CACHE_AGE = 365 * 24 * 3600
+
+
+def resolution_query(short_code):
+    """Select the ResolvedUrl fields of a live link"""
+    return db.select(Url.id, Url.original_url, Url.redirect_status, Url.cache_max_age, Url.edge_cacheable).where(
+        Url.short_code == short_code, Url.deleted_at.is_(None)
+    )
+
+
+def cache_control(max_age, edge_cacheable):
+    """Cache-Control value of a redirect under a link's cache policy"""
+    if not max_age:
+        # Every visit reaches us and is counted
+        return 'no-store'
+    return f'{"public" if edge_cacheable else "private"}, max-age={max_age}'
+
+
+@lru_cache(maxsize=10000)
+def redirect_headers(location, max_age=0, edge_cacheable=False):
+    """Response headers of a redirect to `location`, encoded once per URL and policy"""
+    return (
+        ('Location', iri_to_uri(location)),
+        ('Cache-Control', cache_control(max_age, edge_cacheable)),
+        ('Content-Length', '0'),
+    )
+
+
+def hit_redirect_limits(limiter, limits, environ, endpoint='redirect_url'):
+    """Count a request against `limits`; True once one is exceeded.
+
+    The counters are Flask-Limiter's default limits of `endpoint`, keyed on
+    the peer address as get_remote_address() does, so the fast paths and the
+    Flask routes share them. Forwarded-for headers are
+    set by the client and are not used.
+    """
+    key = environ.get('REMOTE_ADDR') or '127.0.0.1'
+    try:
+        for limit in limits:
+            if not limiter.hit(limit, key, endpoint):
+                return True
+    except StorageError:
+        # Fail open: an unreachable storage must not take redirects down
+        return False
+    return False
+
+
+def click_from(url_id, environ):
+    """ClickRecord of a redirect request"""
+    referrer = environ.get('HTTP_REFERER')
+    return ClickRecord(
+        url_id=url_id,
+        # Click.ip_address is not nullable; ASGI scopes may lack a client
+        ip_address=client_ip(environ) or 'unknown',
+        clicked_at=datetime.utcnow(),
+        user_agent=environ.get('HTTP_USER_AGENT', '')[:500],
+        referrer=referrer[:500] if referrer else None
+    )
+
+
+def reserved_names(url_map):
+    """First path segments that belong to static single-segment routes"""
+    return {
+        rule.rule[1:] for rule in url_map.iter_rules()
+        if not rule.arguments and rule.rule.count('/') == 1 and len(rule.rule) > 1
+    }
+
+
+@contextmanager
+def _unmeasured(environ):
+    yield lambda endpoint, status: None
+
+
+class RedirectFastPath:
+    """WSGI middleware serving /<short_code> redirects ahead of `app`.
+
+    `resolve(short_code)` returns a ResolvedUrl or None, `record(click)`
+    stores a ClickRecord and `rate_limited(environ)` counts the request
+    against the client's limits, returning True once one is exceeded.
+    `status` is used for links without a redirect status of their own.
+    Without `not_found_page` (a function rendering the 404 page as bytes)
+    unknown codes go to `app` too. `measure(environ)` is a context manager
+    for request metrics, see RequestMetrics.measure.
+    """
+
+    def __init__(self, app, resolve, record, rate_limited=None, url_map=None, not_found_page=None,
+                 status=302, session_cookie='session', measure=None):
+        if status not in STATUS_LINES:
+            raise ValueError(f'unsupported redirect status: {status}')
+        self.app = app
+        self.resolve = resolve
+        self.record = record
+        self.rate_limited = rate_limited
+        self.url_map = url_map
+        self.not_found_page = not_found_page
+        self.status = STATUS_LINES[status]
+        self.session_cookie = session_cookie + '='
+        self.measure = measure or _unmeasured
+        self._reserved = None
+        self._not_found = None
+
+    def __call__(self, environ, start_response):
+        if environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+            return self.app(environ, start_response)
+        match = SEGMENT.match(environ.get('PATH_INFO', ''))
+        if match is None or match.group(1) in self.reserved():
+            return self.app(environ, start_response)
+
+        with self.measure(environ) as answered:
+            response = self.respond(match.group(1), environ)
+            if response is not None:
+                endpoint, status, headers, body = response
+                answered(endpoint, int(status[:3]))
+        if response is None:
+            return self.app(environ, start_response)
+        start_response(status, list(headers))
+        return [b''] if environ['REQUEST_METHOD'] == 'HEAD' else [body]
+
+    def respond(self, code, environ):
+        """(endpoint, status, headers, body) for a short code path, or None
+        to leave the request to the wrapped app"""
+        url = self.resolve(code) if SHORT_CODE.match(code) else None
+        if url is None and (self.not_found_page is None or self.session_cookie in environ.get('HTTP_COOKIE', '')):
+            return None
+        if self.rate_limited is not None and self.rate_limited(environ):
+            return ('redirect_url', '429 Too Many Requests',
+                    (('Content-Type', 'text/plain'), ('Content-Length', str(len(TOO_MANY_REQUESTS)))),
+                    TOO_MANY_REQUESTS)
+        if url is None:
+            body = self.not_found()
+            return ('unmatched', '404 Not Found',
+                    (('Content-Type', 'text/html; charset=utf-8'), ('Content-Length', str(len(body)))), body)
+        self.record(click_from(url.id, environ))
+        status = STATUS_LINES[url.redirect_status] if url.redirect_status else self.status
+        return 'redirect_url', status, redirect_headers(url.original_url, url.cache_max_age, url.edge_cacheable), b''
+
+    def reserved(self):
+        # Routes are all registered by the first request
+        if self._reserved is None:
+            self._reserved = reserved_names(self.url_map) if self.url_map is not None else set()
+        return self._reserved
+
+    def not_found(self):
+        if self._not_found is None:
+            self._not_found = self.not_found_page()
+        return self._not_found
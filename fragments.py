@@ -0,0 +1,112 @@
+"""Cached template fragments and prerendered pages.
+
+The links and statistics part of the dashboard only changes when the user's
+links or click rollups do. Each user has a data version in shared storage
+that is bumped after such a change is committed; fragments are cached under
+the version they were rendered at, so a bump makes them unreachable. The
+versions only reach every worker through shared storage, so with memory://
+fragments are rendered on every request instead of cached.
+
+Marketing pages (index, pricing) look the same for every anonymous visitor
+and are rendered once, see PrerenderedPages.
+"""
+from flask import current_app, render_template, session
+from markupsafe import Markup
+from storage import StorageError
+from models import db, Url
+
+
+def _version_key(user_id):
+    return f'user:{user_id}:data'
+
+
+def data_version(user_id):
+    """Current data version of a user, or None if it cannot be read.
+
+    Per-process storage is not trusted: another worker's bump would not be
+    seen, and its cached fragments would hide the change.
+    """
+    storage = current_app.extensions.get('shared_storage')
+    if storage is None or not storage.shared:
+        return None
+    try:
+        value = storage.get(_version_key(user_id))
+    except StorageError:
+        return None
+    return int(value) if value else 0
+
+
+def bump_data_version(user_ids):
+    """Mark the cached fragments of the users as stale after a commit"""
+    storage = current_app.extensions.get('shared_storage')
+    if storage is None:
+        return
+    for user_id in user_ids:
+        try:
+            storage.incr(_version_key(user_id))
+        except StorageError:
+            current_app.logger.warning('Could not bump data version of user %s', user_id)
+
+
+def bump_for_urls(url_ids):
+    """bump_data_version() for the owners of the given Urls"""
+    if not url_ids or current_app.extensions.get('shared_storage') is None:
+        return
+    bump_data_version(db.session.execute(
+        db.select(Url.user_id).where(Url.id.in_(url_ids)).distinct()
+    ).scalars().all())
+
+
+def cached_fragment(cache, key, version, render):
+    """Serve `render()` from `cache` under `key` at the data `version`.
+
+    Without a version (unreadable storage) the fragment is always rendered.
+    """
+    if version is None:
+        return Markup(render())
+    key = key + (version,)
+    fragment = cache.get(key)
+    if fragment is None:
+        fragment = Markup(render())
+        cache.set(key, fragment)
+    return fragment
+
+
+class PrerenderedPages:
+    """Pages rendered once for anonymous visitors.
+
+    A visitor with a session user or pending flashed messages gets the page
+    rendered for them instead, since both show up in the page.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._pages = {}
+        self._templates = {}
+
+    def register(self, endpoint, template, **context):
+        self._templates[endpoint] = (template, context)
+
+    def prerender(self):
+        """Render every registered page, e.g. at startup"""
+        with self.app.test_request_context('/'):
+            for endpoint in self._templates:
+                self._render(endpoint)
+
+    def _render(self, endpoint):
+        template, context = self._templates[endpoint]
+        self._pages[endpoint] = render_template(template, user=None, **context)
+        return self._pages[endpoint]
+
+    def get(self, endpoint):
+        """The prerendered page for this request, or None to render it"""
+        if 'user_id' in session or '_flashes' in session:
+            return None
+        page = self._pages.get(endpoint)
+        if page is None:
+            # Not prerendered at startup; this request renders it for everyone
+            page = self._render(endpoint)
+        return page
+
+    def clear(self):
+        self._pages.clear()
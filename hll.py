@@ -0,0 +1,107 @@
+import hashlib
+import math
+import struct
+
+DEFAULT_PRECISION = 10
+
+# Serialized sketches start with one header byte holding the precision. The
+# high bit marks the sparse format, a list of (uint16 index, uint8 rank)
+# pairs, used while few registers are set; otherwise all registers follow.
+SPARSE_FLAG = 0x80
+SPARSE_ENTRY = struct.Struct('>HB')
+
+
+class HyperLogLog:
+    """HyperLogLog cardinality sketch with 2**p one-byte registers.
+
+    The relative standard error of count() is about 1.04 / sqrt(2**p), i.e.
+    3.25% at the default precision of 10. Sketches of equal precision merge
+    losslessly, so per-bucket sketches can be combined across days or URLs.
+    """
+
+    def __init__(self, p=DEFAULT_PRECISION, registers=None):
+        if not 4 <= p <= 16:
+            raise ValueError('precision must be between 4 and 16')
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.m)
+
+    @property
+    def error(self):
+        return 1.04 / math.sqrt(self.m)
+
+    def add(self, value):
+        if isinstance(value, str):
+            value = value.encode()
+        x = int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), 'big')
+        index = x >> (64 - self.p)
+        rest = x & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+        return self
+
+    def merge(self, other):
+        """Fold another sketch into this one"""
+        if other.p != self.p:
+            raise ValueError('cannot merge sketches of different precision')
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    @classmethod
+    def union(cls, sketches, p=DEFAULT_PRECISION):
+        result = cls(p)
+        for sketch in sketches:
+            result.merge(sketch)
+        return result
+
+    def merge_bytes(self, blob):
+        """Fold a serialized sketch into this one without building it first"""
+        if not blob:
+            return self
+        if blob[0] & ~SPARSE_FLAG != self.p:
+            raise ValueError('cannot merge sketches of different precision')
+        if blob[0] & SPARSE_FLAG:
+            registers = self.registers
+            for i, r in SPARSE_ENTRY.iter_unpack(blob[1:]):
+                if r > registers[i]:
+                    registers[i] = r
+        else:
+            self.registers = bytearray(map(max, self.registers, blob[1:]))
+        return self
+
+    def count(self):
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+    def __len__(self):
+        return self.count()
+
+    def to_bytes(self):
+        nonzero = [(i, r) for i, r in enumerate(self.registers) if r]
+        if len(nonzero) * SPARSE_ENTRY.size < self.m:
+            return bytes([self.p | SPARSE_FLAG]) + b''.join(SPARSE_ENTRY.pack(i, r) for i, r in nonzero)
+        return bytes([self.p]) + bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, blob, p=DEFAULT_PRECISION):
+        """Load a sketch from to_bytes(); an empty or None blob is an empty sketch"""
+        if not blob:
+            return cls(p)
+        header, body = blob[0], blob[1:]
+        sketch = cls(header & ~SPARSE_FLAG)
+        if header & SPARSE_FLAG:
+            for i, r in SPARSE_ENTRY.iter_unpack(body):
+                sketch.registers[i] = r
+        else:
+            sketch.registers = bytearray(body)
+        return sketch
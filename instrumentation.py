@@ -0,0 +1,203 @@
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, request
+from sqlalchemy import event
+
+# Upper bounds (seconds) of the request duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = 0
+        self.duration = 0.0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.sql_statements = 0
+        self.sql_duration = 0.0
+        self.slowest_sql = 0.0
+        self.slowest_statement = ''
+
+
+class RequestMetrics:
+    """Per-request wall time and SQL statistics, aggregated per endpoint.
+
+    SQL statements are timed with SQLAlchemy cursor events and attributed to
+    the request running on the current app context. Requests slower than
+    SLOW_REQUEST_MS (0 disables it) are logged with their slowest statement.
+    """
+
+    def __init__(self, app=None, db=None):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._collectors = {}
+        self._engines = set()
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        app.config.setdefault('SLOW_REQUEST_MS', 0)
+        self.app = app
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        with app.app_context():
+            for engine in db.engines.values():
+                self.watch_engine(engine)
+        app.extensions['request_metrics'] = self
+
+    def watch_engine(self, engine):
+        if engine in self._engines:
+            return
+        self._engines.add(engine)
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def register_stats(self, name, stats):
+        """Export the counters returned by `stats()` under urlshortener_<name>_*"""
+        self._collectors[name] = stats
+
+    def _start_request(self):
+        g._request_metrics = {
+            'start': time.perf_counter(),
+            'sql_statements': 0,
+            'sql_duration': 0.0,
+            'slowest_sql': 0.0,
+            'slowest_statement': '',
+        }
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        current = g.get('_request_metrics') if g else None
+        if current is None:
+            return
+        current['sql_statements'] += 1
+        current['sql_duration'] += elapsed
+        if elapsed > current['slowest_sql']:
+            current['slowest_sql'] = elapsed
+            current['slowest_statement'] = statement
+
+    def _finish_request(self, response):
+        current = g.pop('_request_metrics', None)
+        if current is not None:
+            self._finish(current, request.endpoint or 'unmatched', request.method, request.path, response.status_code)
+        return response
+
+    @contextmanager
+    def measure(self, environ):
+        """Measure a request answered outside Flask routing, in an app context.
+
+        Yields a function to call with the endpoint name and status code
+        once the request was answered; nothing is recorded otherwise.
+        """
+        self._start_request()
+        answered = []
+        try:
+            yield lambda endpoint, status: answered.append((endpoint, status))
+        finally:
+            current = g.pop('_request_metrics', None)
+            if answered and current is not None:
+                endpoint, status = answered[-1]
+                self._finish(current, endpoint, environ['REQUEST_METHOD'], environ.get('PATH_INFO', ''), status)
+
+    def _finish(self, current, endpoint, method, path, status):
+        duration = time.perf_counter() - current['start']
+        self.observe(endpoint, duration, current)
+
+        threshold = self.app.config['SLOW_REQUEST_MS']
+        if threshold and duration * 1000 >= threshold:
+            self.app.logger.warning(
+                'Slow request %s %s -> %s: %.1f ms, %d SQL statements (%.1f ms), slowest %.1f ms: %s',
+                method, path, status, duration * 1000,
+                current['sql_statements'], current['sql_duration'] * 1000,
+                current['slowest_sql'] * 1000, ' '.join(current['slowest_statement'].split())[:500]
+            )
+
+    def observe(self, endpoint, duration, sql=None):
+        """Record one request against `endpoint`"""
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = EndpointStats()
+            stats.requests += 1
+            stats.duration += duration
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    stats.buckets[i] += 1
+            if sql is not None:
+                stats.sql_statements += sql['sql_statements']
+                stats.sql_duration += sql['sql_duration']
+                if sql['slowest_sql'] > stats.slowest_sql:
+                    stats.slowest_sql = sql['slowest_sql']
+                    stats.slowest_statement = ' '.join(sql['slowest_statement'].split())[:200]
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                endpoint: {
+                    'requests': stats.requests,
+                    'duration': stats.duration,
+                    'sql_statements': stats.sql_statements,
+                    'sql_duration': stats.sql_duration,
+                    'slowest_sql': stats.slowest_sql,
+                    'slowest_statement': stats.slowest_statement,
+                }
+                for endpoint, stats in self._endpoints.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+    def render_prometheus(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        lines = []
+
+        def metric(name, kind, help_text):
+            lines.append(f'# HELP urlshortener_{name} {help_text}')
+            lines.append(f'# TYPE urlshortener_{name} {kind}')
+
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+
+            metric('requests_total', 'counter', 'Requests handled per endpoint.')
+            for endpoint, stats in endpoints:
+                lines.append(f'urlshortener_requests_total{{endpoint="{_escape(endpoint)}"}} {stats.requests}')
+
+            metric('request_duration_seconds', 'histogram', 'Request wall time per endpoint.')
+            for endpoint, stats in endpoints:
+                label = f'endpoint="{_escape(endpoint)}"'
+                for bound, count in zip(DURATION_BUCKETS, stats.buckets):
+                    lines.append(f'urlshortener_request_duration_seconds_bucket{{{label},le="{bound}"}} {count}')
+                lines.append(f'urlshortener_request_duration_seconds_bucket{{{label},le="+Inf"}} {stats.requests}')
+                lines.append(f'urlshortener_request_duration_seconds_sum{{{label}}} {stats.duration:.6f}')
+                lines.append(f'urlshortener_request_duration_seconds_count{{{label}}} {stats.requests}')
+
+            metric('sql_statements_total', 'counter', 'SQL statements executed per endpoint.')
+            for endpoint, stats in endpoints:
+                lines.append(f'urlshortener_sql_statements_total{{endpoint="{_escape(endpoint)}"}} {stats.sql_statements}')
+
+            metric('sql_duration_seconds_total', 'counter', 'Time spent in SQL per endpoint.')
+            for endpoint, stats in endpoints:
+                lines.append(f'urlshortener_sql_duration_seconds_total{{endpoint="{_escape(endpoint)}"}} {stats.sql_duration:.6f}')
+
+            metric('sql_slowest_statement_seconds', 'gauge', 'Slowest SQL statement seen per endpoint.')
+            for endpoint, stats in endpoints:
+                # The statement itself is only logged (SLOW_REQUEST_MS), never exported
+                lines.append(
+                    f'urlshortener_sql_slowest_statement_seconds{{endpoint="{_escape(endpoint)}"}} {stats.slowest_sql:.6f}'
+                )
+
+        for name, stats in sorted(self._collectors.items()):
+            for key, value in sorted(stats().items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    metric(f'{name}_{key}', 'gauge', f'{name} {key}.')
+                    lines.append(f'urlshortener_{name}_{key} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,156 @@
+"""Interned (dictionary-encoded) User-Agent and Referer values of clicks.
+
+A few hundred distinct header values make up most clicks, so Click stores
+the integer id of a row in the user_agent and referrer lookup tables
+instead of the string. Referers are stored without their query string and
+fragment, which carry per-visit tracking ids and would make nearly every
+value distinct (see referrer_value()). Interner maps values to ids through an in-process
+LRU cache, so ingesting a batch of clicks normally costs no extra query.
+Values missing from the cache are looked up, and inserted when new, on a
+separate connection that commits at once: a cached id never refers to a row
+of a transaction that was rolled back.
+
+Readers select the values through join_lookups() and click_column().
+"""
+import os
+import threading
+from collections import OrderedDict
+from models import db, Click, UserAgent, Referrer
+
+# Click attributes stored as lookup ids, with the column holding the value
+DECODED = {
+    'user_agent': (Click.user_agent_id, UserAgent),
+    'referrer': (Click.referrer_id, Referrer),
+}
+
+
+class Interner:
+    """Maps the values of a lookup table (UserAgent, Referrer) to their ids"""
+
+    def __init__(self, model, maxsize=10000):
+        self.model = model
+        self.maxsize = maxsize
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def ids(self, values):
+        """Return {value: id} for the given values, creating rows as needed.
+
+        Empty values (None or '') are left out; they are stored as NULL.
+        """
+        result, missing = {}, set()
+        with self._lock:
+            for value in values:
+                if not value or value in result or value in missing:
+                    continue
+                row_id = self._ids.get(value)
+                if row_id is None:
+                    missing.add(value)
+                else:
+                    self._ids.move_to_end(value)
+                    result[value] = row_id
+            self.hits += len(result)
+            self.misses += len(missing)
+        if missing:
+            found = self._load(missing)
+            with self._lock:
+                self._ids.update(found)
+                while len(self._ids) > self.maxsize:
+                    self._ids.popitem(last=False)
+            result.update(found)
+        return result
+
+    def _load(self, values):
+        table = self.model.__table__
+        query = db.select(table.c.value, table.c.id)
+        with db.engine.begin() as conn:
+            found = dict(conn.execute(query.where(table.c.value.in_(values))).all())
+            new = [{'value': value} for value in values if value not in found]
+            if new:
+                dialect = conn.dialect.name
+                if dialect == 'sqlite':
+                    from sqlalchemy.dialects.sqlite import insert
+                elif dialect == 'postgresql':
+                    from sqlalchemy.dialects.postgresql import insert
+                else:
+                    insert = None
+                if insert is not None:
+                    # Another worker may intern the same value concurrently
+                    conn.execute(insert(table).on_conflict_do_nothing(index_elements=['value']), new)
+                else:
+                    conn.execute(db.insert(table), new)
+                found.update(conn.execute(query.where(table.c.value.in_([row['value'] for row in new]))).all())
+        return found
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        return {
+            'size': len(self._ids),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+user_agents = Interner(UserAgent, maxsize=int(os.environ.get('INTERN_CACHE_SIZE', 10000)))
+referrers = Interner(Referrer, maxsize=int(os.environ.get('INTERN_CACHE_SIZE', 10000)))
+
+
+def clear():
+    """Forget all cached ids (the lookup tables were recreated)"""
+    user_agents.clear()
+    referrers.clear()
+
+
+def stats():
+    return {
+        f'{name}_{field}': value
+        for name, interner in (('user_agent', user_agents), ('referrer', referrers))
+        for field, value in interner.stats().items()
+    }
+
+
+def referrer_value(referrer):
+    """The part of a Referer URL that is interned: everything before '?' or '#'"""
+    if not referrer:
+        return None
+    return referrer.split('#', 1)[0].split('?', 1)[0]
+
+
+def click_rows(records):
+    """Click table rows for a list of ClickRecords, with interned headers"""
+    agent_ids = user_agents.ids([record.user_agent for record in records])
+    referrer_values = [referrer_value(record.referrer) for record in records]
+    referrer_ids = referrers.ids(referrer_values)
+    return [
+        {
+            'url_id': record.url_id,
+            'ip_address': record.ip_address,
+            'clicked_at': record.clicked_at,
+            'user_agent_id': agent_ids.get(record.user_agent),
+            'referrer_id': referrer_ids.get(referrer),
+        }
+        for record, referrer in zip(records, referrer_values)
+    ]
+
+
+def join_lookups(query):
+    """Outer-join the lookup tables to a query over Click"""
+    query = query.select_from(Click)
+    for id_column, model in DECODED.values():
+        query = query.outerjoin(model, id_column == model.id)
+    return query
+
+
+def click_column(name):
+    """Click column `name`; the decoded value for user_agent and referrer"""
+    if name in DECODED:
+        return DECODED[name][1].value.label(name)
+    return getattr(Click, name)
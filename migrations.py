@@ -0,0 +1,167 @@
+"""Versioned schema migrations for existing databases.
+
+db.create_all() builds a complete schema for a new database but never alters
+existing tables. Each migration below brings an older database up to date
+and must be idempotent, so a database created by create_all() can run them
+as well. Applied versions are recorded in the schema_version table.
+"""
+from datetime import datetime
+from sqlalchemy import inspect, text
+from models import Url, Click, UserAgent, Referrer
+
+SCHEMA_TABLE = 'schema_version'
+
+
+def create_index(engine, table, name, columns, where=None):
+    """Create an index unless it exists, without blocking writes on PostgreSQL.
+
+    `where` makes it a partial index over the rows matching that SQL condition.
+    """
+    quote = engine.dialect.identifier_preparer.quote
+    concurrently = 'CONCURRENTLY ' if engine.dialect.name == 'postgresql' else ''
+    ddl = text(
+        f'CREATE INDEX {concurrently}IF NOT EXISTS {quote(name)} '
+        f'ON {quote(table)} ({", ".join(quote(column) for column in columns)})'
+        + (f' WHERE {where}' if where else '')
+    )
+    if concurrently:
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.execute(ddl)
+    else:
+        with engine.begin() as conn:
+            conn.execute(ddl)
+
+
+def add_column(engine, column):
+    """Add a model column to its existing table unless it is already there"""
+    table = column.table.name
+    if column.name in {c['name'] for c in inspect(engine).get_columns(table)}:
+        return
+    quote = engine.dialect.identifier_preparer.quote
+    ddl = f'ALTER TABLE {quote(table)} ADD COLUMN {quote(column.name)} {column.type.compile(engine.dialect)}'
+    if column.server_default is not None:
+        # Existing rows get the default, so the column can be NOT NULL
+        default = column.server_default.arg.compile(dialect=engine.dialect, compile_kwargs={'literal_binds': True})
+        ddl += f' DEFAULT {default}' + ('' if column.nullable else ' NOT NULL')
+    with engine.begin() as conn:
+        conn.execute(text(ddl))
+
+
+def add_composite_indexes(engine):
+    create_index(engine, 'url', 'ix_url_user_id_created_at', ['user_id', 'created_at'])
+    create_index(engine, 'click', 'ix_click_url_id_clicked_at', ['url_id', 'clicked_at'])
+
+
+def add_url_tombstones_and_click_time_index(engine):
+    add_column(engine, Url.__table__.c.deleted_at)
+    create_index(engine, 'click', 'ix_click_clicked_at', ['clicked_at'])
+
+
+def add_click_enrichment(engine):
+    for name in ('country', 'device', 'browser', 'referrer_domain', 'enriched_at'):
+        add_column(engine, Click.__table__.c[name])
+    create_index(engine, 'click', 'ix_click_unenriched', ['id'], where='enriched_at IS NULL')
+
+
+def _interned_value(engine, column):
+    """SQL for the part of a click string column that is interned.
+
+    Referrers lose their query string and fragment, as interning.referrer_value()
+    does on ingest.
+    """
+    if not column.endswith('.referrer'):
+        return column
+    if engine.dialect.name == 'postgresql':
+        return f"split_part(split_part({column}, '#', 1), '?', 1)"
+    no_fragment = f"substr({column}, 1, instr({column} || '#', '#') - 1)"
+    return f"substr({no_fragment}, 1, instr({no_fragment} || '?', '?') - 1)"
+
+
+def intern_click_strings(engine, chunk_size=10000):
+    """Move Click.user_agent and Click.referrer into lookup tables.
+
+    Works through the clicks in id ranges of `chunk_size`, one transaction
+    each, so an interrupted run resumes where it stopped. The string columns
+    are dropped at the end; SQLite returns their space to the file system
+    only after a VACUUM.
+    """
+    UserAgent.__table__.create(engine, checkfirst=True)
+    Referrer.__table__.create(engine, checkfirst=True)
+    add_column(engine, Click.__table__.c.user_agent_id)
+    add_column(engine, Click.__table__.c.referrer_id)
+
+    # The lookup tables are named after the columns they replace
+    existing = {c['name'] for c in inspect(engine).get_columns('click')}
+    strings = [name for name in ('user_agent', 'referrer') if name in existing]
+    if not strings:
+        return
+    with engine.connect() as conn:
+        low, high = conn.execute(text('SELECT MIN(id), MAX(id) FROM click')).one()
+    for start in range(low or 0, (high or 0) + 1, chunk_size):
+        bounds = {'start': start, 'end': start + chunk_size}
+        with engine.begin() as conn:
+            for name in strings:
+                value = _interned_value(engine, f'click.{name}')
+                in_chunk = f"click.id >= :start AND click.id < :end AND click.{name} IS NOT NULL AND {value} <> ''"
+                conn.execute(text(
+                    f'INSERT INTO {name} (value) SELECT DISTINCT {value} FROM click '
+                    f'WHERE {in_chunk} AND NOT EXISTS (SELECT 1 FROM {name} WHERE {name}.value = {value})'
+                ), bounds)
+                conn.execute(text(
+                    f'UPDATE click SET {name}_id = (SELECT id FROM {name} WHERE {name}.value = {value}) '
+                    f'WHERE {in_chunk} AND click.{name}_id IS NULL'
+                ), bounds)
+    with engine.begin() as conn:
+        for name in strings:
+            conn.execute(text(f'ALTER TABLE click DROP COLUMN {name}'))
+
+
+def add_url_redirect_policy(engine):
+    for name in ('redirect_status', 'cache_max_age', 'edge_cacheable'):
+        add_column(engine, Url.__table__.c[name])
+
+
+# (version, description, function(engine)) in the order they are applied
+MIGRATIONS = [
+    (1, 'Composite indexes for analytics and dashboard queries', add_composite_indexes),
+    (2, 'Url deletion tombstones and click time index for retention', add_url_tombstones_and_click_time_index),
+    (3, 'Click enrichment columns', add_click_enrichment),
+    (4, 'Interned user agents and referrers for clicks', intern_click_strings),
+    (5, 'Per-link redirect status and cache policy', add_url_redirect_policy),
+]
+
+
+def _ensure_schema_table(engine):
+    with engine.begin() as conn:
+        conn.execute(text(
+            f'CREATE TABLE IF NOT EXISTS {SCHEMA_TABLE} '
+            '(version INTEGER PRIMARY KEY, description VARCHAR(200) NOT NULL, applied_at TIMESTAMP NOT NULL)'
+        ))
+
+
+def applied_versions(engine):
+    _ensure_schema_table(engine)
+    with engine.connect() as conn:
+        return {row[0] for row in conn.execute(text(f'SELECT version FROM {SCHEMA_TABLE}'))}
+
+
+def pending(engine):
+    applied = applied_versions(engine)
+    return [migration for migration in MIGRATIONS if migration[0] not in applied]
+
+
+def upgrade(engine, log=None):
+    """Apply all pending migrations in order and return their versions"""
+    done = []
+    for version, description, migrate in pending(engine):
+        if log:
+            log(f'Applying {version}: {description}')
+        migrate(engine)
+        with engine.begin() as conn:
+            conn.execute(
+                text(f'INSERT INTO {SCHEMA_TABLE} (version, description, applied_at) VALUES (:v, :d, :t)'),
+                {'v': version, 'd': description, 't': datetime.utcnow()}
+            )
+        done.append(version)
+    return done
@@ -1,4 +1,5 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import declared_attr
 from datetime import datetime
 
 db = SQLAlchemy()
@@ -22,13 +23,105 @@ class Url(db.Model):
     short_code = db.Column(db.String(10), unique=True, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Set when the owner deletes the link; the row and its clicks are
+    # removed later by the reclaim job
+    deleted_at = db.Column(db.DateTime, nullable=True)
+    # Redirect policy: the status code (NULL uses REDIRECT_STATUS), how many
+    # seconds clients may cache the redirect (0: not at all), and whether
+    # shared caches such as CDNs may cache it too. Cached redirects are not
+    # counted as clicks.
+    redirect_status = db.Column(db.Integer, nullable=True)
+    cache_max_age = db.Column(db.Integer, nullable=False, default=0, server_default=db.text('0'))
+    edge_cacheable = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
     
     clicks = db.relationship('Click', backref='url', lazy=True, cascade='all, delete-orphan')
+    
+    # Dashboard listing: a user's links, newest first
+    __table_args__ = (db.Index('ix_url_user_id_created_at', 'user_id', 'created_at'),)
+
+class UserAgent(db.Model):
+    """Distinct User-Agent header values, referenced by Click.user_agent_id"""
+    id = db.Column(db.Integer, primary_key=True)
+    value = db.Column(db.String(500), unique=True, nullable=False)
+
+class Referrer(db.Model):
+    """Distinct Referer header values, referenced by Click.referrer_id"""
+    id = db.Column(db.Integer, primary_key=True)
+    value = db.Column(db.String(500), unique=True, nullable=False)
 
 class Click(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     url_id = db.Column(db.Integer, db.ForeignKey('url.id'), nullable=False)
     ip_address = db.Column(db.String(45), nullable=False)
     clicked_at = db.Column(db.DateTime, default=datetime.utcnow)
-    user_agent = db.Column(db.String(500), nullable=True)
-    referrer = db.Column(db.String(500), nullable=True)
\ No newline at end of file
+    # Interned headers (see interning.py); NULL when the header was missing
+    user_agent_id = db.Column(db.Integer, db.ForeignKey('user_agent.id'), nullable=True)
+    referrer_id = db.Column(db.Integer, db.ForeignKey('referrer.id'), nullable=True)
+    # Filled in from the fields above by the enrichment worker
+    # (flask enrich-clicks); NULL until enriched_at is set
+    country = db.Column(db.String(2), nullable=True)
+    device = db.Column(db.String(16), nullable=True)
+    browser = db.Column(db.String(32), nullable=True)
+    referrer_domain = db.Column(db.String(255), nullable=True)
+    enriched_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        # Per-link analytics, exports and rollup backfills over a time range
+        db.Index('ix_click_url_id_clicked_at', 'url_id', 'clicked_at'),
+        # Retention, which works through whole months of clicks
+        db.Index('ix_click_clicked_at', 'clicked_at'),
+        # Clicks still waiting for the enrichment worker
+        db.Index(
+            'ix_click_unenriched', 'id',
+            sqlite_where=db.text('enriched_at IS NULL'),
+            postgresql_where=db.text('enriched_at IS NULL')
+        ),
+    )
+
+class CodeCounter(db.Model):
+    """Shared counter that short code allocators lease ID blocks from"""
+    name = db.Column(db.String(32), primary_key=True)
+    next_value = db.Column(db.BigInteger, nullable=False, default=0)
+
+class ClickRollupMixin:
+    """Click totals for one Url over one time bucket"""
+    id = db.Column(db.Integer, primary_key=True)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    clicks = db.Column(db.Integer, nullable=False, default=0)
+    unique_visitors = db.Column(db.Integer, nullable=False, default=0)
+    visitor_sketch = db.Column(db.LargeBinary, nullable=True)
+
+    @declared_attr
+    def url_id(cls):
+        return db.Column(db.Integer, db.ForeignKey('url.id'), nullable=False)
+
+    @declared_attr
+    def __table_args__(cls):
+        return (db.UniqueConstraint('url_id', 'bucket_start'),)
+
+class ClickRollupHourly(ClickRollupMixin, db.Model):
+    __tablename__ = 'click_rollup_hourly'
+
+class ClickRollupDaily(ClickRollupMixin, db.Model):
+    __tablename__ = 'click_rollup_daily'
+
+class ClickTotal(db.Model):
+    """All-time click totals of one Url"""
+    url_id = db.Column(db.Integer, db.ForeignKey('url.id'), primary_key=True)
+    clicks = db.Column(db.Integer, nullable=False, default=0)
+    unique_visitors = db.Column(db.Integer, nullable=False, default=0)
+    visitor_sketch = db.Column(db.LargeBinary, nullable=True)
+
+# SQLite builds before 3.32 cap a statement at 999 bound parameters
+SQLITE_MAX_VARIABLES = 999
+
+def bulk_insert(model, rows):
+    """Insert rows (a list of dicts) using multi-row INSERT statements"""
+    if not rows:
+        return 0
+    chunk_size = len(rows)
+    if db.session.get_bind().dialect.name == 'sqlite':
+        chunk_size = max(1, SQLITE_MAX_VARIABLES // len(rows[0]))
+    for start in range(0, len(rows), chunk_size):
+        db.session.execute(db.insert(model).values(rows[start:start + chunk_size]))
+    return len(rows)
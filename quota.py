@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+from sqlalchemy import case, false, func, or_
+from models import db, User
+from auth import invalidate_user
+
+QUOTA_PERIOD = timedelta(days=30)
+
+# Quota changes are single conditional UPDATE statements, so concurrent
+# requests cannot overshoot the limit and no row lock is held in between.
+# Each call commits right away: the reservation is visible to other requests
+# and SQLite's write lock is released before short codes are leased.
+
+
+def _ended(now):
+    return User.quota_reset_date <= now
+
+
+def _expired(now):
+    # A missing reset date starts a period without clearing past usage
+    return or_(User.quota_reset_date.is_(None), _ended(now))
+
+
+def _is_premium():
+    return func.coalesce(User.is_premium, false())
+
+
+def _changed(user, result):
+    db.session.commit()
+    if result.rowcount:
+        db.session.expire(user, ['used_quota', 'quota_reset_date'])
+        invalidate_user(user.id)
+    return result.rowcount == 1
+
+
+def rollover(user, now=None):
+    """Start a new quota period if the user's current one has ended"""
+    now = now or datetime.utcnow()
+    if user.quota_reset_date is not None and user.quota_reset_date > now:
+        return False
+    result = db.session.execute(
+        db.update(User)
+        .where(User.id == user.id, _expired(now))
+        .values(
+            used_quota=case((_ended(now), 0), else_=User.used_quota),
+            quota_reset_date=now + QUOTA_PERIOD
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return _changed(user, result)
+
+
+def reserve(user, count=1, now=None):
+    """Take `count` links from the user's quota; False if that would exceed it.
+
+    Premium users always succeed without being charged. An ended period is
+    rolled over by the same statement.
+    """
+    if user.is_premium:
+        return True
+    now = now or datetime.utcnow()
+    used = case((_ended(now), count), else_=User.used_quota + count)
+    result = db.session.execute(
+        db.update(User)
+        .where(User.id == user.id, or_(_is_premium(), used <= User.monthly_quota))
+        .values(
+            used_quota=case((_is_premium(), User.used_quota), else_=used),
+            quota_reset_date=case((_expired(now), now + QUOTA_PERIOD), else_=User.quota_reset_date)
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return _changed(user, result)
+
+
+def release(user, count=1):
+    """Give back links reserved for creations that did not happen"""
+    result = db.session.execute(
+        db.update(User)
+        .where(User.id == user.id, ~_is_premium())
+        .values(used_quota=case((User.used_quota > count, User.used_quota - count), else_=0))
+        .execution_options(synchronize_session=False)
+    )
+    return _changed(user, result)
+
+
+def remaining(user, now=None):
+    """Links the user may still create this period, or None if unlimited"""
+    if user.is_premium:
+        return None
+    now = now or datetime.utcnow()
+    if user.quota_reset_date is not None and user.quota_reset_date <= now:
+        return user.monthly_quota
+    return max(0, user.monthly_quota - user.used_quota)
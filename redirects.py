@@ -0,0 +1,117 @@
+"""Redirect-only WSGI entry point for serverless cold starts.
+
+Serves GET /<short_code> after loading just what resolution needs: the
+models, the resolution cache, the rate limiter storage and the click
+ingestor. Every other request, including unknown short codes, is handed to
+the full Flask app in app.py, which is imported on first use. Stripe,
+Flask-Limiter, the templates and the analytics modules are never loaded for
+a plain redirect.
+
+Configuration is read from the same environment variables as app.py; the
+.env file is not loaded. app.py and the ASGI mode (asgi.py) share the
+storage and resolution cache created here.
+"""
+import os
+import re
+from urllib.parse import urlparse
+from flask import Flask
+from limits import parse_many
+from limits.strategies import FixedWindowRateLimiter
+from models import db
+from cache import ResolutionCache, ResolvedUrl, MISSING
+from clicks import ClickIngestor
+from fastpath import RedirectFastPath, hit_redirect_limits, resolution_query
+from storage import LimiterStorage, backend_from_url
+import engines
+
+DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlite:////tmp/urlshortener.db')
+SECRET_KEY = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
+REDIRECT_STATUS = int(os.environ.get('REDIRECT_STATUS', 302))
+
+REDIRECT_PATH = re.compile(r'^/([^/]+)$')
+
+settings = engines.from_env(os.environ)
+
+# Database access and click ingestion only; this app never routes requests
+core = Flask(__name__)
+core.config.update(settings)
+core.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
+core.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+core.secret_key = SECRET_KEY
+engines.configure(core)
+db.init_app(core)
+engines.init_app(core, db)
+click_ingestor = ClickIngestor(core)
+
+STORAGE_URL = os.environ.get('STORAGE_URL', 'memory://')
+shared_storage = backend_from_url(STORAGE_URL)
+# Click writes bump the dashboard data versions kept in it (fragments.py)
+core.extensions['shared_storage'] = shared_storage
+RESOLUTION_CACHE_TTL = int(os.environ.get('RESOLUTION_CACHE_TTL', 300))
+RESOLUTION_CACHE_NEGATIVE_TTL = int(os.environ.get('RESOLUTION_CACHE_NEGATIVE_TTL', 30))
+# On Vercel app.py and redirects.py run as separate functions, so links
+# deleted or changed through the app only reach this function's cache
+# through a store both of them can reach. Without one, cached links are kept
+# no longer than cached misses and may redirect that long after a change.
+if os.environ.get('VERCEL') and urlparse(STORAGE_URL).scheme != 'redis':
+    core.logger.warning(
+        'STORAGE_URL is not a redis:// URL; changed links may keep redirecting for up to %ds',
+        min(RESOLUTION_CACHE_TTL, RESOLUTION_CACHE_NEGATIVE_TTL)
+    )
+    RESOLUTION_CACHE_TTL = min(RESOLUTION_CACHE_TTL, RESOLUTION_CACHE_NEGATIVE_TTL)
+resolution_cache = ResolutionCache(
+    maxsize=int(os.environ.get('RESOLUTION_CACHE_SIZE', 10000)),
+    ttl=RESOLUTION_CACHE_TTL,
+    negative_ttl=RESOLUTION_CACHE_NEGATIVE_TTL,
+    backend=shared_storage if shared_storage.shared else None
+)
+
+# The Flask app's default_limits, counted in its storage (hit_redirect_limits)
+rate_limiter = FixedWindowRateLimiter(LimiterStorage(backend=shared_storage))
+rate_limits = parse_many(os.environ.get('DEFAULT_RATE_LIMITS', '200 per day;50 per hour'))
+rate_limiting = os.environ.get('RATELIMIT_ENABLED', '1') == '1'
+
+_flask_app = None
+
+
+def flask_app():
+    """The full Flask app, imported on first use"""
+    global _flask_app
+    if _flask_app is None:
+        from app import app
+        _flask_app = app
+    return _flask_app
+
+
+def rate_limited(environ, endpoint='redirect_url'):
+    """Count a request to `endpoint` against the client's limits; True once one is exceeded"""
+    if not rate_limiting:
+        return False
+    return hit_redirect_limits(rate_limiter, rate_limits, environ, endpoint)
+
+
+def resolve_short_code(short_code):
+    """Resolve a short code through the cache, or None if it is not found.
+
+    Misses are not cached here: the Flask app checks the primary database
+    before it caches a missing code.
+    """
+    resolved = resolution_cache.get(short_code)
+    if resolved is None:
+        with core.app_context():
+            row = engines.read_session(db).execute(resolution_query(short_code)).first()
+        if row is None:
+            return None
+        resolved = ResolvedUrl(*row)
+        resolution_cache.set(short_code, resolved)
+    return None if resolved is MISSING else resolved
+
+
+# Unknown codes are left to the Flask app, which checks the primary database
+app = RedirectFastPath(
+    lambda environ, start_response: flask_app()(environ, start_response),
+    resolve=resolve_short_code,
+    record=click_ingestor.record,
+    rate_limited=rate_limited,
+    status=REDIRECT_STATUS
+)
@@ -0,0 +1,123 @@
+"""Click retention, archival and reclaiming of deleted Urls.
+
+Clicks are handled in monthly partitions, ranges of clicked_at served by the
+click time index. Once a whole month is older than the retention period it
+is archived to a gzip CSV file and deleted in chunks. Its hourly rollups are
+compacted away, while the daily rollups and all-time totals keep the
+aggregates, so dashboards and analytics are unaffected.
+"""
+import csv
+import gzip
+import os
+from datetime import datetime, timedelta
+from models import db, Url, Click, ClickRollupHourly
+import rollups
+from interning import click_column, join_lookups
+
+ARCHIVE_COLUMNS = ['id', 'url_id', 'ip_address', 'clicked_at', 'user_agent', 'referrer']
+
+
+def month_start(dt):
+    return datetime(dt.year, dt.month, 1)
+
+
+def next_month(dt):
+    return datetime(dt.year + dt.month // 12, dt.month % 12 + 1, 1)
+
+
+def expired_partitions(retention_days, now=None):
+    """List the (start, end) months whose clicks are all past retention"""
+    now = now or datetime.utcnow()
+    cutoff = month_start(now - timedelta(days=retention_days))
+    oldest = db.session.execute(db.select(db.func.min(Click.clicked_at))).scalar()
+    partitions = []
+    start = month_start(oldest) if oldest is not None else cutoff
+    while start < cutoff:
+        partitions.append((start, next_month(start)))
+        start = next_month(start)
+    return partitions
+
+
+def _in_partition(start, end):
+    return (Click.clicked_at >= start) & (Click.clicked_at < end)
+
+
+def archive_partition(start, end, directory, batch_size=1000):
+    """Write a month of clicks to <directory>/clicks-YYYY-MM.csv.gz.
+
+    The file is written under a temporary name and renamed when complete, so
+    an existing archive always holds the whole month and is not rewritten
+    when a purge is resumed. Returns the number of rows written.
+    """
+    path = os.path.join(directory, f'clicks-{start:%Y-%m}.csv.gz')
+    if os.path.exists(path):
+        return 0
+    os.makedirs(directory, exist_ok=True)
+    rows = db.session.execute(
+        join_lookups(db.select(*(click_column(column) for column in ARCHIVE_COLUMNS)))
+        .where(_in_partition(start, end))
+        .order_by(Click.id)
+        .execution_options(yield_per=batch_size)
+    )
+    written = 0
+    with gzip.open(path + '.tmp', 'wt', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(ARCHIVE_COLUMNS)
+        for row in rows:
+            writer.writerow(row)
+            written += 1
+    os.replace(path + '.tmp', path)
+    return written
+
+
+def delete_in_chunks(condition, batch_size=1000):
+    """Delete the clicks matching `condition`, committing every `batch_size` rows"""
+    deleted = 0
+    while True:
+        ids = db.session.execute(db.select(Click.id).where(condition).limit(batch_size)).scalars().all()
+        if not ids:
+            return deleted
+        db.session.execute(db.delete(Click).where(Click.id.in_(ids)))
+        db.session.commit()
+        deleted += len(ids)
+
+
+def purge_partition(start, end, archive_dir=None, batch_size=1000):
+    """Archive (optionally) and delete one month; returns (archived, deleted)"""
+    archived = archive_partition(start, end, archive_dir, batch_size) if archive_dir else 0
+    deleted = delete_in_chunks(_in_partition(start, end), batch_size)
+    ClickRollupHourly.query.filter(
+        ClickRollupHourly.bucket_start >= start,
+        ClickRollupHourly.bucket_start < end
+    ).delete()
+    db.session.commit()
+    return archived, deleted
+
+
+def enforce_retention(retention_days, archive_dir=None, batch_size=1000, now=None):
+    """Purge every expired month; returns [(month, archived, deleted)]"""
+    if not retention_days:
+        return []
+    return [
+        (f'{start:%Y-%m}', *purge_partition(start, end, archive_dir, batch_size))
+        for start, end in expired_partitions(retention_days, now)
+    ]
+
+
+def reclaim_deleted(batch_size=1000, limit=None):
+    """Remove tombstoned Urls together with their clicks and rollups.
+
+    Clicks go in chunks so no single statement holds the write lock for
+    long. Returns the number of Urls reclaimed.
+    """
+    query = db.select(Url.id).where(Url.deleted_at.is_not(None)).order_by(Url.deleted_at)
+    if limit:
+        query = query.limit(limit)
+    reclaimed = 0
+    for url_id in db.session.execute(query).scalars().all():
+        delete_in_chunks(Click.url_id == url_id, batch_size)
+        rollups.delete_for_url(url_id)
+        db.session.execute(db.delete(Url).where(Url.id == url_id))
+        db.session.commit()
+        reclaimed += 1
+    return reclaimed
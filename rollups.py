@@ -0,0 +1,235 @@
+from collections import defaultdict
+from datetime import timedelta
+from sqlalchemy import and_, func, or_
+from models import db, Url, Click, ClickRollupHourly, ClickRollupDaily, ClickTotal
+from hll import HyperLogLog
+
+HOUR = 'hour'
+DAY = 'day'
+
+ROLLUP_MODELS = {
+    HOUR: ClickRollupHourly,
+    DAY: ClickRollupDaily,
+}
+
+BUCKET_WIDTHS = {
+    HOUR: timedelta(hours=1),
+    DAY: timedelta(days=1),
+}
+
+KEY_COLUMNS = {
+    ClickRollupHourly: ('url_id', 'bucket_start'),
+    ClickRollupDaily: ('url_id', 'bucket_start'),
+    ClickTotal: ('url_id',),
+}
+
+# Keys per upsert statement, keeping SQLite under its bound parameter limit
+KEY_CHUNK = 200
+
+def bucket_start(dt, granularity):
+    """Truncate a datetime to the start of its hourly or daily bucket"""
+    if granularity == HOUR:
+        return dt.replace(minute=0, second=0, microsecond=0)
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def apply_clicks(clicks):
+    """Fold freshly inserted clicks into the hourly, daily and all-time rollups.
+
+    Click totals are incremented with an upsert and each touched row's
+    visitor sketch is merged with a sketch of the batch's IPs, so raw Click
+    rows are never re-read.
+    """
+    for granularity, model in ROLLUP_MODELS.items():
+        _apply(model, clicks, lambda click: (click.url_id, bucket_start(click.clicked_at, granularity)))
+    _apply(ClickTotal, clicks, lambda click: (click.url_id,))
+
+def _apply(model, clicks, key_of):
+    counts = defaultdict(int)
+    sketches = defaultdict(HyperLogLog)
+    for click in clicks:
+        key = key_of(click)
+        counts[key] += 1
+        sketches[key].add(click.ip_address)
+
+    # Workers lock rows in the same (key) order, so overlapping batches wait
+    # for each other on PostgreSQL instead of deadlocking
+    keys = sorted(counts)
+    for start in range(0, len(keys), KEY_CHUNK):
+        chunk = keys[start:start + KEY_CHUNK]
+        _increment(model, {key: counts[key] for key in chunk})
+        _merge_sketches(model, {key: sketches[key] for key in chunk})
+
+def _key_filter(model, keys):
+    columns = [getattr(model, name) for name in KEY_COLUMNS[model]]
+    return or_(*(and_(*(column == value for column, value in zip(columns, key))) for key in keys))
+
+def _increment(model, counts):
+    names = KEY_COLUMNS[model]
+    rows = [
+        dict(zip(names, key), clicks=n, unique_visitors=0)
+        for key, n in counts.items()
+    ]
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        # Imported here: the postgresql dialect module loads all of its
+        # drivers' adapters, which is slow on a cold start
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(model).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(names),
+            set_={'clicks': model.clicks + stmt.excluded.clicks}
+        )
+        db.session.execute(stmt)
+        return
+
+    for key, n in counts.items():
+        updated = db.session.execute(
+            db.update(model)
+            .where(_key_filter(model, [key]))
+            .values(clicks=model.clicks + n)
+        ).rowcount
+        if not updated:
+            db.session.execute(db.insert(model).values(dict(zip(names, key), clicks=n, unique_visitors=0)))
+
+def _merge_sketches(model, sketches):
+    rows = db.session.execute(
+        db.select(model).where(_key_filter(model, sketches))
+        .order_by(*(getattr(model, name) for name in KEY_COLUMNS[model])).with_for_update()
+    ).scalars()
+    for row in rows:
+        key = tuple(getattr(row, name) for name in KEY_COLUMNS[model])
+        merged = HyperLogLog.from_bytes(row.visitor_sketch).merge(sketches[key])
+        row.visitor_sketch = merged.to_bytes()
+        row.unique_visitors = merged.count()
+
+def merged_sketch(rows):
+    """Union the visitor sketches of rollup rows (or raw sketch blobs)"""
+    result = HyperLogLog()
+    for row in rows:
+        result.merge_bytes(getattr(row, 'visitor_sketch', row))
+    return result
+
+def link_page(user_id, per_page, before=None):
+    """Return one page of a user's Urls with their click totals.
+
+    A single query joins each Url to its all-time ClickTotal row. Pages are
+    keyset-paginated on (created_at, id), newest first; `before` is the
+    (created_at, id) of the last Url of the previous page. Returns a list of
+    (url, total_clicks, unique_visitors) rows plus a flag telling whether
+    older Urls exist.
+    """
+    query = (
+        db.select(
+            Url,
+            func.coalesce(ClickTotal.clicks, 0),
+            func.coalesce(ClickTotal.unique_visitors, 0)
+        )
+        .outerjoin(ClickTotal, ClickTotal.url_id == Url.id)
+        .where(Url.user_id == user_id, Url.deleted_at.is_(None))
+        .order_by(Url.created_at.desc(), Url.id.desc())
+        .limit(per_page + 1)
+    )
+    if before is not None:
+        created_at, url_id = before
+        query = query.where(or_(
+            Url.created_at < created_at,
+            and_(Url.created_at == created_at, Url.id < url_id)
+        ))
+    rows = db.session.execute(query).all()
+    return rows[:per_page], len(rows) > per_page
+
+def account_totals(user_id, session=None):
+    """Return (links, total_clicks, unique_visitors) across all of a user's Urls.
+
+    Unique visitors are estimated by merging the per-Url visitor sketches, so
+    a visitor of several links is counted once.
+    """
+    session = session or db.session
+    links, clicks = session.execute(
+        db.select(
+            func.count(Url.id),
+            func.coalesce(func.sum(ClickTotal.clicks), 0)
+        )
+        .select_from(Url)
+        .outerjoin(ClickTotal, ClickTotal.url_id == Url.id)
+        .where(Url.user_id == user_id, Url.deleted_at.is_(None))
+    ).one()
+    sketches = session.execute(
+        db.select(ClickTotal.visitor_sketch)
+        .join(Url, ClickTotal.url_id == Url.id)
+        .where(Url.user_id == user_id, Url.deleted_at.is_(None))
+    ).scalars()
+    return links, clicks, merged_sketch(sketches).count()
+
+def daily_series(url_id, since):
+    """Return the daily rollup rows of a Url starting at `since`"""
+    return ClickRollupDaily.query.filter(
+        ClickRollupDaily.url_id == url_id,
+        ClickRollupDaily.bucket_start >= bucket_start(since, DAY)
+    ).order_by(ClickRollupDaily.bucket_start).all()
+
+def delete_for_url(url_id):
+    for model in KEY_COLUMNS:
+        model.query.filter_by(url_id=url_id).delete()
+
+def backfill(url_ids=None, batch_size=1000, since=None):
+    """Rebuild the rollups of the given Urls (default: all) from Click history.
+
+    Existing rollups of each Url are replaced; with `since`, only buckets
+    from that day on are rebuilt and older ones, whose clicks may have been
+    purged by retention, are kept. The all-time ClickTotal is then derived
+    from the daily rollups. Run it while click ingestion is paused, or clicks
+    arriving during the rebuild can be counted twice. Returns the number of
+    clicks processed.
+    """
+    since = bucket_start(since, DAY) if since is not None else None
+    if url_ids is None:
+        url_ids = [url_id for url_id, in db.session.execute(db.select(Click.url_id).distinct())]
+
+    processed = 0
+    for url_id in url_ids:
+        clicks = {granularity: defaultdict(int) for granularity in ROLLUP_MODELS}
+        visitors = {granularity: defaultdict(HyperLogLog) for granularity in ROLLUP_MODELS}
+        query = db.select(Click.clicked_at, Click.ip_address).where(Click.url_id == url_id)
+        if since is not None:
+            query = query.where(Click.clicked_at >= since)
+        for clicked_at, ip_address in db.session.execute(query.execution_options(yield_per=batch_size)):
+            for granularity in ROLLUP_MODELS:
+                start = bucket_start(clicked_at, granularity)
+                clicks[granularity][start] += 1
+                visitors[granularity][start].add(ip_address)
+            processed += 1
+
+        if since is None:
+            delete_for_url(url_id)
+        else:
+            for model in ROLLUP_MODELS.values():
+                model.query.filter(model.url_id == url_id, model.bucket_start >= since).delete()
+            ClickTotal.query.filter_by(url_id=url_id).delete()
+        for granularity, model in ROLLUP_MODELS.items():
+            if clicks[granularity]:
+                db.session.execute(db.insert(model), [
+                    {
+                        'url_id': url_id,
+                        'bucket_start': start,
+                        'clicks': n,
+                        'unique_visitors': visitors[granularity][start].count(),
+                        'visitor_sketch': visitors[granularity][start].to_bytes()
+                    }
+                    for start, n in clicks[granularity].items()
+                ])
+
+        days = ClickRollupDaily.query.filter_by(url_id=url_id).all()
+        if days:
+            total = merged_sketch(days)
+            db.session.add(ClickTotal(
+                url_id=url_id,
+                clicks=sum(day.clicks for day in days),
+                unique_visitors=total.count(),
+                visitor_sketch=total.to_bytes()
+            ))
+        db.session.commit()
+    return processed
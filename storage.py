@@ -0,0 +1,392 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse, unquote
+from limits.storage import Storage
+
+# Commands sent to Redis in one write by the *_many() methods
+PIPELINE_SIZE = 1000
+
+
+class StorageError(Exception):
+    """Raised when a storage backend cannot complete a command"""
+
+
+class StorageBackend:
+    """Key/value store with expiry shared by the rate limiter and caches.
+
+    Values are bytes; counters created by incr() are stored as their decimal
+    representation. `shared` tells whether other processes see the same data.
+    """
+
+    shared = False
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def set_many(self, items, ttl=None):
+        """set() every (key, value) pair, in as few round trips as the store allows"""
+        for key, value in items:
+            self.set(key, value, ttl)
+
+    def delete_many(self, keys):
+        """delete() every key, in as few round trips as the store allows"""
+        for key in keys:
+            self.delete(key)
+
+    def incr(self, key, amount=1, ttl=None):
+        """Add to a counter, starting a new one that expires in `ttl` seconds"""
+        raise NotImplementedError
+
+    def expires_at(self, key):
+        """Return the key's expiry as a Unix timestamp, or None"""
+        raise NotImplementedError
+
+    def clear(self, prefix=''):
+        raise NotImplementedError
+
+
+def _encode(value):
+    return value.encode() if isinstance(value, str) else bytes(value)
+
+
+class MemoryBackend(StorageBackend):
+    """Per-process dictionary store"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key):
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.time():
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key)
+            return entry[0] if entry else None
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (_encode(value), time.time() + ttl if ttl else None)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key, amount=1, ttl=None):
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                entry = (b'0', time.time() + ttl if ttl else None)
+            value = int(entry[0]) + amount
+            self._data[key] = (str(value).encode(), entry[1])
+            return value
+
+    def expires_at(self, key):
+        with self._lock:
+            entry = self._live(key)
+            return entry[1] if entry else None
+
+    def clear(self, prefix=''):
+        with self._lock:
+            for key in [key for key in self._data if key.startswith(prefix)]:
+                del self._data[key]
+
+
+class SQLiteBackend(StorageBackend):
+    """Store in a local SQLite file, shared by all worker processes on a host"""
+
+    shared = True
+
+    def __init__(self, path, timeout=5.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._execute('CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _execute(self, sql, params=()):
+        try:
+            return self._connection().execute(sql, params)
+        except sqlite3.Error as e:
+            raise StorageError(str(e)) from e
+
+    def get(self, key):
+        row = self._execute(
+            'SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)',
+            (key, time.time())
+        ).fetchone()
+        return bytes(row[0]) if row else None
+
+    def set(self, key, value, ttl=None):
+        self._execute(
+            'INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)',
+            (key, _encode(value), time.time() + ttl if ttl else None)
+        )
+
+    def delete(self, key):
+        self._execute('DELETE FROM kv WHERE key = ?', (key,))
+
+    def set_many(self, items, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        self._execute_many(
+            'INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)',
+            [(key, _encode(value), expires_at) for key, value in items]
+        )
+
+    def delete_many(self, keys):
+        self._execute_many('DELETE FROM kv WHERE key = ?', [(key,) for key in keys])
+
+    def _execute_many(self, sql, rows):
+        # One transaction rather than one commit per row
+        conn = self._connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.executemany(sql, rows)
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            raise StorageError(str(e)) from e
+
+    def incr(self, key, amount=1, ttl=None):
+        now = time.time()
+        conn = self._connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute(
+                    'SELECT value, expires_at FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)',
+                    (key, now)
+                ).fetchone()
+                value = (int(row[0]) if row else 0) + amount
+                expires_at = row[1] if row else (now + ttl if ttl else None)
+                conn.execute(
+                    'INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)',
+                    (key, str(value).encode(), expires_at)
+                )
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            raise StorageError(str(e)) from e
+        return value
+
+    def expires_at(self, key):
+        row = self._execute('SELECT expires_at FROM kv WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def clear(self, prefix=''):
+        self._execute("DELETE FROM kv WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+
+
+class RedisBackend(StorageBackend):
+    """Store in a Redis-protocol (RESP) server, shared by every host"""
+
+    shared = True
+
+    def __init__(self, host='localhost', port=6379, db=0, password=None, timeout=1.0):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            conn = self._local.conn = (sock, sock.makefile('rb'))
+            self._local.pid = os.getpid()
+            if self.password:
+                self._send(conn, 'AUTH', self.password)
+            if self.db:
+                self._send(conn, 'SELECT', self.db)
+        return conn
+
+    def command(self, *args):
+        """Send one command and return its decoded reply"""
+        return self.pipeline([args])[0]
+
+    def pipeline(self, commands):
+        """Send several commands in one write and return their decoded replies"""
+        error = None
+        try:
+            sock, reader = self._connection()
+            sock.sendall(b''.join(self._command(*args) for args in commands))
+            replies = []
+            for _ in commands:
+                # Read every reply, so the connection stays in step after an error
+                try:
+                    replies.append(self._read_reply(reader))
+                except StorageError as e:
+                    error = error or e
+                    replies.append(None)
+        except (OSError, EOFError) as e:
+            # Drop the broken connection so the next command reconnects
+            conn = getattr(self._local, 'conn', None)
+            if conn is not None:
+                conn[0].close()
+            self._local.conn = None
+            raise StorageError(f'redis connection failed: {e}') from e
+        if error is not None:
+            raise error
+        return replies
+
+    def _command(self, *args):
+        parts = [f'*{len(args)}\r\n'.encode()]
+        for arg in args:
+            arg = _encode(str(arg) if isinstance(arg, (int, float)) else arg)
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        return b''.join(parts)
+
+    def _send(self, conn, *args):
+        sock, reader = conn
+        sock.sendall(self._command(*args))
+        return self._read_reply(reader)
+
+    def _read_reply(self, reader):
+        line = reader.readline()
+        if not line:
+            raise EOFError('connection closed')
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode()
+        if kind == b'-':
+            raise StorageError(payload.decode())
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            return reader.read(length + 2)[:-2]
+        if kind == b'*':
+            length = int(payload)
+            return None if length < 0 else [self._read_reply(reader) for _ in range(length)]
+        raise StorageError(f'unexpected reply {line!r}')
+
+    def get(self, key):
+        return self.command('GET', key)
+
+    def set(self, key, value, ttl=None):
+        if ttl:
+            self.command('SET', key, value, 'PX', int(ttl * 1000))
+        else:
+            self.command('SET', key, value)
+
+    def delete(self, key):
+        self.command('DEL', key)
+
+    def set_many(self, items, ttl=None):
+        expiry = ('PX', int(ttl * 1000)) if ttl else ()
+        commands = [('SET', key, value) + expiry for key, value in items]
+        for start in range(0, len(commands), PIPELINE_SIZE):
+            self.pipeline(commands[start:start + PIPELINE_SIZE])
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        for start in range(0, len(keys), PIPELINE_SIZE):
+            self.command('DEL', *keys[start:start + PIPELINE_SIZE])
+
+    def incr(self, key, amount=1, ttl=None):
+        value = self.command('INCRBY', key, amount)
+        if ttl and value == amount:
+            self.command('PEXPIRE', key, int(ttl * 1000))
+        return value
+
+    def expires_at(self, key):
+        remaining = self.command('PTTL', key)
+        return time.time() + remaining / 1000.0 if remaining >= 0 else None
+
+    def clear(self, prefix=''):
+        cursor = '0'
+        while True:
+            cursor, keys = self.command('SCAN', cursor, 'MATCH', prefix + '*', 'COUNT', 500)
+            if keys:
+                self.command('DEL', *keys)
+            cursor = cursor.decode() if isinstance(cursor, bytes) else cursor
+            if cursor == '0':
+                return
+
+
+def backend_from_url(url):
+    """Build a backend from memory://, sqlite:///path or redis://[:password@]host[:port][/db]"""
+    parsed = urlparse(url)
+    if parsed.scheme == 'memory':
+        return MemoryBackend()
+    if parsed.scheme == 'sqlite':
+        return SQLiteBackend(unquote(parsed.path))
+    if parsed.scheme == 'redis':
+        return RedisBackend(
+            host=parsed.hostname or 'localhost',
+            port=parsed.port or 6379,
+            db=int(parsed.path.lstrip('/') or 0),
+            password=unquote(parsed.password) if parsed.password else None
+        )
+    raise ValueError(f'unsupported storage URL: {url}')
+
+
+class LimiterStorage(Storage):
+    """Flask-Limiter storage (fixed window) on top of a StorageBackend.
+
+    Selected with storage_uri='backend://' and the backend instance passed as
+    storage_options={'backend': ...}.
+    """
+
+    STORAGE_SCHEME = ['backend']
+
+    def __init__(self, uri=None, wrap_exceptions=False, backend=None, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.backend = backend or MemoryBackend()
+
+    @property
+    def base_exceptions(self):
+        return StorageError
+
+    def incr(self, key, expiry, elastic_expiry=False, amount=1):
+        return self.backend.incr(key, amount, ttl=expiry)
+
+    def get(self, key):
+        value = self.backend.get(key)
+        return int(value) if value else 0
+
+    def get_expiry(self, key):
+        return self.backend.expires_at(key) or time.time()
+
+    def check(self):
+        try:
+            self.backend.get('LIMITER/ping')
+            return True
+        except StorageError:
+            return False
+
+    def reset(self):
+        self.backend.clear('LIMITER')
+
+    def clear(self, key):
+        self.backend.delete(key)
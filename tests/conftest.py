@@ -0,0 +1,23 @@
+import pytest
+from app import app, db, limiter, resolution_cache, analytics_cache, fragment_cache, click_ingestor, code_allocator
+import interning
+
+@pytest.fixture(autouse=True)
+def reset_app_state():
+    """Give every test an empty database and cold in-process caches"""
+    with app.app_context():
+        db.drop_all()
+    resolution_cache.clear()
+    resolution_cache.reset_stats()
+    analytics_cache.clear()
+    fragment_cache.clear()
+    interning.clear()
+    limiter.reset()
+    code_allocator.reset()
+    config = dict(app.config)
+    # Write clicks inline so tests can assert on them right after a redirect
+    app.config['CLICK_INGEST_ASYNC'] = False
+    yield
+    click_ingestor.stop()
+    app.config.clear()
+    app.config.update(config)
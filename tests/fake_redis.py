@@ -0,0 +1,78 @@
+import socketserver
+import threading
+import time
+from fnmatch import fnmatchcase
+
+
+class FakeRedisServer:
+    """Minimal in-process RESP server implementing the commands RedisBackend uses"""
+
+    def __init__(self):
+        self.data = {}
+        self.expiry = {}
+        self.lock = threading.Lock()
+        fake = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    args = []
+                    for _ in range(int(line[1:])):
+                        length = int(self.rfile.readline()[1:])
+                        args.append(self.rfile.read(length + 2)[:-2])
+                    self.wfile.write(fake.execute(args))
+
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _alive(self, key):
+        if key in self.expiry and self.expiry[key] <= time.time():
+            self.data.pop(key, None)
+            self.expiry.pop(key, None)
+        return key in self.data
+
+    def execute(self, args):
+        command, args = args[0].upper().decode(), args[1:]
+        with self.lock:
+            if command == 'GET':
+                if not self._alive(args[0]):
+                    return b'$-1\r\n'
+                value = self.data[args[0]]
+                return b'$%d\r\n%s\r\n' % (len(value), value)
+            if command == 'SET':
+                self.data[args[0]] = args[1]
+                self.expiry.pop(args[0], None)
+                if len(args) == 4 and args[2].upper() == b'PX':
+                    self.expiry[args[0]] = time.time() + int(args[3]) / 1000.0
+                return b'+OK\r\n'
+            if command == 'DEL':
+                removed = sum(1 for key in args if self.data.pop(key, None) is not None)
+                return b':%d\r\n' % removed
+            if command == 'INCRBY':
+                value = (int(self.data[args[0]]) if self._alive(args[0]) else 0) + int(args[1])
+                self.data[args[0]] = str(value).encode()
+                return b':%d\r\n' % value
+            if command == 'PEXPIRE':
+                self.expiry[args[0]] = time.time() + int(args[1]) / 1000.0
+                return b':1\r\n'
+            if command == 'PTTL':
+                if not self._alive(args[0]):
+                    return b':-2\r\n'
+                if args[0] not in self.expiry:
+                    return b':-1\r\n'
+                return b':%d\r\n' % int((self.expiry[args[0]] - time.time()) * 1000)
+            if command == 'SCAN':
+                pattern = args[args.index(b'MATCH') + 1].decode()
+                keys = [key for key in self.data if fnmatchcase(key.decode(), pattern)]
+                reply = b'*2\r\n$1\r\n0\r\n*%d\r\n' % len(keys)
+                return reply + b''.join(b'$%d\r\n%s\r\n' % (len(key), key) for key in keys)
+            return b'-ERR unknown command\r\n'
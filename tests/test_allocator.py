@@ -0,0 +1,91 @@
+import pytest
+from app import app, db, code_allocator
+from models import User, Url
+from allocator import BlockAllocator, FeistelScrambler, RandomAllocator, base62_encode, base62_decode
+from datetime import datetime, timedelta
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+            user = User(
+                id=1,
+                email='test@example.com',
+                password='hashed_password',
+                is_premium=True,
+                quota_reset_date=datetime.utcnow() + timedelta(days=30)
+            )
+            db.session.add(user)
+            db.session.commit()
+        yield client
+
+def test_base62_round_trip():
+    """Test base62 encoding is fixed width and reversible"""
+    for n in [0, 1, 61, 62, 62 ** 6 - 1]:
+        code = base62_encode(n, 6)
+        assert len(code) == 6
+        assert base62_decode(code) == n
+
+    with pytest.raises(ValueError):
+        base62_encode(62 ** 6, 6)
+
+def test_scrambler_is_a_bijection():
+    """Test the scramble permutes the whole code space"""
+    scrambler = FeistelScrambler('secret')
+    domain = 62 ** 2
+    permuted = [scrambler.permute(n, 2) for n in range(domain)]
+
+    assert sorted(permuted) == list(range(domain))
+    assert permuted[:5] != list(range(5))
+    assert all(scrambler.unpermute(p, 2) == n for n, p in enumerate(permuted))
+
+def test_block_allocators_never_collide(client):
+    """Test workers leasing blocks from one counter get disjoint codes"""
+    workers = [BlockAllocator(block_size=7, scrambler=FeistelScrambler('secret')) for _ in range(3)]
+
+    with app.app_context():
+        codes = []
+        for _ in range(20):
+            for worker in workers:
+                codes.extend(worker.allocate_many(3))
+
+    assert len(codes) == 180
+    assert len(set(codes)) == 180
+    assert all(len(code) == 6 for code in codes)
+
+def test_block_allocator_grows_code_length():
+    """Test codes gain a character once the minimum width is exhausted"""
+    allocator = BlockAllocator(min_length=1)
+
+    assert allocator.encode(61) == '9'
+    assert allocator.encode(62) == 'ba'
+
+def test_random_allocator_skips_taken_codes(client, monkeypatch):
+    """Test the random strategy retries codes that already exist"""
+    with app.app_context():
+        db.session.add(Url(original_url='https://example.com', short_code='taken1', user_id=1))
+        db.session.commit()
+
+        candidates = iter(['taken1', 'fresh1'])
+        monkeypatch.setattr('allocator.generate_short_code', lambda length: next(candidates))
+        assert RandomAllocator().allocate() == 'fresh1'
+
+def test_shorten_retries_on_legacy_collision(client, monkeypatch):
+    """Test a code colliding with a legacy random code is skipped"""
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+
+    with app.app_context():
+        db.session.add(Url(original_url='https://legacy.example', short_code='legacy', user_id=1))
+        db.session.commit()
+
+    codes = iter(['legacy', 'newone'])
+    monkeypatch.setattr(code_allocator, 'allocate', lambda: next(codes))
+    client.post('/shorten', data={'url': 'https://example.com'})
+
+    with app.app_context():
+        url = Url.query.filter_by(original_url='https://example.com').one()
+        assert url.short_code == 'newone'
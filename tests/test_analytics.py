@@ -0,0 +1,183 @@
+import pytest
+import interning
+import rollups
+from app import app, db, analytics_cache
+from models import User, Url, Click
+from clicks import ClickRecord
+from datetime import datetime
+
+CHROME = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36'
+FIREFOX = 'Mozilla/5.0 (X11; Linux x86_64; rv:121.0) Gecko/20100101 Firefox/121.0'
+
+CLICKS = [
+    ('10.0.0.1', datetime(2024, 3, 4, 10, 15), CHROME, 'https://news.example'),
+    ('10.0.0.1', datetime(2024, 3, 4, 10, 45), CHROME, 'https://news.example'),
+    ('10.0.0.2', datetime(2024, 3, 4, 11, 5), FIREFOX, None),
+    ('10.0.0.3', datetime(2024, 3, 6, 9, 0), CHROME, 'https://blog.example'),
+    ('10.0.0.4', datetime(2024, 3, 11, 8, 0), None, 'https://news.example'),
+]
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+            db.session.add(User(id=1, email='test@example.com', password='hashed_password'))
+            db.session.add(Url(
+                id=1,
+                original_url='https://example.com',
+                short_code='abc123',
+                user_id=1,
+                created_at=datetime(2024, 3, 1)
+            ))
+            db.session.commit()
+            records = [
+                ClickRecord(url_id=1, ip_address=ip, clicked_at=at, user_agent=agent, referrer=referrer)
+                for ip, at, agent, referrer in CLICKS
+            ]
+            db.session.add_all(Click(**row) for row in interning.click_rows(records))
+            rollups.apply_clicks(records)
+            db.session.commit()
+        with client.session_transaction() as sess:
+            sess['user_id'] = 1
+        yield client
+
+def test_default_is_last_seven_days(client):
+    """Test the legacy response shape covers the last 7 days"""
+    data = client.get('/api/analytics/1').get_json()
+
+    assert len(data['dates']) == 7
+    assert data['dates'][-1] == datetime.utcnow().strftime('%Y-%m-%d')
+    assert data['counts'] == [0] * 7
+    assert data['total_clicks'] == 0
+    assert data['unique_clicks'] == 0
+
+def test_daily_range(client):
+    """Test a day-aligned range is counted per day"""
+    data = client.get('/api/analytics/1?from=2024-03-04&to=2024-03-06').get_json()
+
+    assert data['dates'] == ['2024-03-04', '2024-03-05', '2024-03-06']
+    assert data['counts'] == [3, 0, 1]
+    assert data['total_clicks'] == 4
+    assert data['unique_clicks'] == 3
+
+def test_daily_range_from_rollups(client):
+    """Test aligned ranges without group_by are answered from the rollups"""
+    with app.app_context():
+        Click.query.delete()
+        db.session.commit()
+
+    data = client.get('/api/analytics/1?from=2024-03-04&to=2024-03-11&granularity=week').get_json()
+
+    assert data['dates'] == ['2024-03-04', '2024-03-11']
+    assert data['counts'] == [4, 1]
+
+def test_hour_and_minute_granularity(client):
+    """Test partial-day ranges are aggregated from raw clicks"""
+    hourly = client.get(
+        '/api/analytics/1?from=2024-03-04T10:00&to=2024-03-04T12:00&granularity=hour'
+    ).get_json()
+    assert hourly['dates'] == ['2024-03-04T10:00', '2024-03-04T11:00']
+    assert hourly['counts'] == [2, 1]
+
+    minutes = client.get(
+        '/api/analytics/1?from=2024-03-04T10:15&to=2024-03-04T10:46&granularity=minute'
+    ).get_json()
+    assert len(minutes['dates']) == 31
+    assert minutes['counts'][0] == 1 and minutes['counts'][30] == 1
+    assert minutes['total_clicks'] == 2
+
+def test_week_granularity_from_clicks(client):
+    """Test weeks start on Monday when counted with SQL"""
+    data = client.get('/api/analytics/1?from=2024-03-05T00:00&to=2024-03-12T00:00&granularity=week').get_json()
+
+    assert data['dates'] == ['2024-03-04', '2024-03-11']
+    assert data['counts'] == [1, 1]
+
+def test_group_by_referrer(client):
+    """Test clicks are split into the top referrers"""
+    data = client.get('/api/analytics/1?from=2024-03-01&to=2024-03-31&group_by=referrer&limit=2').get_json()
+
+    assert [group['key'] for group in data['groups']] == ['https://news.example', '(direct)']
+    news = data['groups'][0]
+    assert news['total_clicks'] == 3
+    assert news['unique_clicks'] == 2
+    assert sum(news['counts']) == 3
+    assert data['total_clicks'] == 5
+
+def test_group_by_user_agent_family(client):
+    """Test user agents are grouped into browser families"""
+    data = client.get('/api/analytics/1?from=2024-03-01&to=2024-03-31&group_by=user_agent_family').get_json()
+
+    totals = {group['key']: group['total_clicks'] for group in data['groups']}
+    assert totals == {'Chrome': 3, 'Firefox': 1, 'Unknown': 1}
+
+def test_invalid_parameters(client):
+    """Test invalid granularity, group_by and ranges are rejected"""
+    assert client.get('/api/analytics/1?granularity=second').status_code == 400
+    assert client.get('/api/analytics/1?group_by=color').status_code == 400
+    assert client.get('/api/analytics/1?from=2024-03-05&to=2024-03-01').status_code == 400
+    assert client.get('/api/analytics/1?from=2020-01-01&to=2024-01-01&granularity=minute').status_code == 400
+
+def test_etag_and_result_cache(client):
+    """Test repeated queries are cached and revalidate with If-None-Match"""
+    url = '/api/analytics/1?from=2024-03-04&to=2024-03-06'
+    first = client.get(url)
+    assert first.headers['ETag']
+    assert 'max-age' in first.headers['Cache-Control']
+
+    second = client.get(url, headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 304
+    assert analytics_cache.stats()['hits'] == 1
+
+def add_account_links():
+    db.session.add(Url(id=2, original_url='https://two.example', short_code='two222', user_id=1))
+    db.session.add(Url(id=3, original_url='https://gone.example', short_code='gon333', user_id=1,
+                       deleted_at=datetime(2024, 3, 20)))
+    db.session.add(User(id=2, email='other@example.com', password='hashed_password'))
+    db.session.add(Url(id=4, original_url='https://other.example', short_code='oth444', user_id=2))
+    records = [
+        ClickRecord(url_id=url_id, ip_address=ip, clicked_at=datetime(2024, 3, 5, 12), user_agent=None, referrer=None)
+        for url_id, ip in [(2, '10.0.0.1'), (2, '10.0.0.9'), (3, '10.0.0.7'), (4, '10.0.0.8')]
+    ]
+    db.session.add_all(Click(**row) for row in interning.click_rows(records))
+    rollups.apply_clicks(records)
+    db.session.commit()
+
+def test_account_summary(client):
+    """Test account analytics sum the user's live links over the window"""
+    with app.app_context():
+        add_account_links()
+
+    data = client.get('/api/analytics/account?from=2024-03-04&to=2024-03-06&limit=1').get_json()
+
+    assert data['dates'] == ['2024-03-04', '2024-03-05', '2024-03-06']
+    assert data['counts'] == [3, 2, 1]
+    assert data['totals'] == {
+        'links': 2,
+        'clicks': 7,
+        'unique_visitors': 5,
+        'window_clicks': 6,
+        'window_unique_visitors': 4,
+    }
+    assert data['top_links'] == [{
+        'id': 1,
+        'short_code': 'abc123',
+        'original_url': 'https://example.com',
+        'clicks': 4,
+        'unique_visitors': 3,
+    }]
+
+def test_account_summary_weekly(client):
+    """Test account series fold daily rollups into weeks"""
+    data = client.get('/api/analytics/account?from=2024-03-04&to=2024-03-17&granularity=week').get_json()
+
+    assert data['dates'] == ['2024-03-04', '2024-03-11']
+    assert data['counts'] == [4, 1]
+
+def test_account_summary_rejects_raw_queries(client):
+    """Test minute buckets and group_by are not offered per account"""
+    assert client.get('/api/analytics/account?granularity=minute').status_code == 400
+    assert client.get('/api/analytics/account?group_by=referrer').status_code == 400
@@ -0,0 +1,147 @@
+import asyncio
+import json
+import pytest
+import asgi
+import redirects
+from limits import parse_many
+from werkzeug.test import Client
+from app import app, db
+from models import User, Url, Click, UserAgent
+from datetime import datetime
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    asgi.resolution_cache.clear()
+    asgi.analytics_cache.clear()
+
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(id=1, email='test@example.com', password='hashed_password'))
+        db.session.add(User(id=2, email='other@example.com', password='hashed_password'))
+        db.session.add(Url(
+            id=1,
+            original_url='https://example.com',
+            short_code='abc123',
+            user_id=1,
+            created_at=datetime.utcnow()
+        ))
+        db.session.commit()
+    yield request
+    asgi.click_ingestor.stop()
+
+def session_cookie(user_id):
+    """A session cookie exactly as the Flask app issues it"""
+    token = app.session_interface.get_signing_serializer(app).dumps({'user_id': user_id})
+    return f'session={token}'
+
+def request(path, query='', headers=()):
+    """Run one GET through the ASGI app and return (status, headers, body)"""
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    async def run():
+        scope = {
+            'type': 'http',
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'root_path': '',
+            'query_string': query.encode(),
+            'headers': [(name.lower().encode(), value.encode()) for name, value in headers],
+            'client': ('10.0.0.1', 50000),
+            'server': ('testserver', 80),
+        }
+        try:
+            await asgi.application(scope, receive, send)
+        finally:
+            await asgi.engine.dispose()
+
+    asyncio.run(run())
+    start = messages[0]
+    body = b''.join(message.get('body', b'') for message in messages[1:])
+    return start['status'], {k.decode(): v.decode() for k, v in start['headers']}, body
+
+def test_redirect(client):
+    """Test short codes are resolved and clicks recorded on the async path"""
+    status, headers, _ = client('/abc123', headers=[('User-Agent', 'pytest')])
+
+    assert status == 302
+    assert headers['location'] == 'https://example.com'
+    asgi.click_ingestor.stop()
+    with app.app_context():
+        click = Click.query.one()
+        assert click.ip_address == '10.0.0.1'
+        assert db.session.get(UserAgent, click.user_agent_id).value == 'pytest'
+
+def test_redirect_location_encoded(client):
+    """Test non-ASCII targets are sent as a percent-encoded Location"""
+    with app.app_context():
+        db.session.add(Url(id=2, original_url='https://example.com/ü', short_code='def456', user_id=1))
+        db.session.commit()
+
+    status, headers, _ = client('/def456')
+    assert status == 302
+    assert headers['location'] == 'https://example.com/%C3%BC'
+    assert headers['cache-control'] == 'no-store'
+
+def test_other_routes_served_by_flask(client):
+    """Test unknown codes and regular pages fall through to the Flask app"""
+    assert client('/nosuch')[0] == 404
+    status, _, body = client('/pricing')
+    assert status == 200
+    assert b'Upgrade' in body or b'Get Started' in body
+
+def test_analytics_matches_flask(client):
+    """Test the async analytics read returns the Flask response"""
+    query = 'from=2024-03-01&to=2024-03-07'
+    status, headers, body = client('/api/analytics/1', query, headers=[('Cookie', session_cookie(1))])
+
+    assert status == 200
+    with app.test_client() as flask_client:
+        with flask_client.session_transaction() as sess:
+            sess['user_id'] = 1
+        assert json.loads(body) == flask_client.get(f'/api/analytics/1?{query}').get_json()
+
+    status, _, _ = client('/api/analytics/1', query, headers=[
+        ('Cookie', session_cookie(1)), ('If-None-Match', headers['etag'])
+    ])
+    assert status == 304
+
+def test_analytics_requires_owner(client):
+    """Test the async analytics read checks the session and ownership"""
+    assert client('/api/analytics/1')[0] == 302
+    assert client('/api/analytics/1', headers=[('Cookie', 'session=forged')])[0] == 302
+    assert client('/api/analytics/1', headers=[('Cookie', session_cookie(2))])[0] == 404
+
+def test_rate_limit(client, monkeypatch):
+    """Test redirects are rate limited per client"""
+    monkeypatch.setattr(redirects, 'rate_limiting', True)
+    monkeypatch.setattr(redirects, 'rate_limits', parse_many('2 per minute'))
+    redirects.rate_limiter.storage.reset()
+
+    assert [client('/abc123')[0] for _ in range(3)] == [302, 302, 429]
+    # Analytics reads are counted separately, as by the Flask route
+    cookie = [('Cookie', session_cookie(1))]
+    assert [client('/api/analytics/1', headers=cookie)[0] for _ in range(3)] == [200, 200, 429]
+
+def test_delete_invalidates_every_entry_point(client):
+    """Test a link deleted through the app stops redirecting on the other entry points"""
+    redirects_client = Client(redirects.app)
+    assert redirects_client.get('/abc123').status_code == 302
+    assert client('/abc123')[0] == 302
+
+    with app.test_client() as flask_client:
+        with flask_client.session_transaction() as sess:
+            sess['user_id'] = 1
+        flask_client.post('/delete-url/1')
+
+    assert redirects_client.get('/abc123').status_code == 404
+    assert client('/abc123')[0] == 404
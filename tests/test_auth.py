@@ -1,5 +1,8 @@
 import pytest
-from app import app, db
+from flask import session
+from sqlalchemy import event
+from app import app, db, request_metrics
+from auth import get_current_user, invalidate_user
 from models import User
 from werkzeug.security import generate_password_hash
 
@@ -99,4 +102,58 @@ def test_password_validation(client):
         'password': 'short'
     }, follow_redirects=True)
     
-    assert b'Password must be at least 8 characters' in response.data 
\ No newline at end of file
+    assert b'Password must be at least 8 characters' in response.data 
+
+
+def test_current_user_loaded_once_per_request(client):
+    """Test repeated get_current_user calls share one query"""
+    with app.app_context():
+        db.session.add(User(id=1, email='test@example.com', password='hashed'))
+        db.session.commit()
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with app.test_request_context():
+        session['user_id'] = 1
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            assert get_current_user() is get_current_user()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+    assert len(statements) == 1
+
+def test_pricing_served_from_session_snapshot(client):
+    """Test read-only pages reuse the session snapshot without queries"""
+    with app.app_context():
+        db.session.add(User(id=1, email='test@example.com', password='hashed'))
+        db.session.commit()
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+
+    client.get('/pricing')
+    request_metrics.reset()
+    response = client.get('/pricing')
+
+    assert b'Upgrade Now' in response.data
+    assert request_metrics.snapshot()['pricing']['sql_statements'] == 0
+
+def test_session_snapshot_invalidated(client):
+    """Test a version bump makes other sessions reload the user"""
+    with app.app_context():
+        db.session.add(User(id=1, email='test@example.com', password='hashed'))
+        db.session.commit()
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+    assert b'Upgrade Now' in client.get('/pricing').data
+
+    with app.test_request_context():
+        user = User.query.get(1)
+        user.is_premium = True
+        db.session.commit()
+        invalidate_user(1)
+
+    assert b'Upgrade Now' not in client.get('/pricing').data
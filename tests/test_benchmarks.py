@@ -0,0 +1,42 @@
+from benchmarks.bench_endpoints import ENDPOINTS, compare, run_size
+
+def make_report(p50, p99, rps):
+    return {'results': {'1:1:1': {'redirect_url': {'p50_ms': p50, 'p99_ms': p99, 'rps': rps}}}}
+
+def test_compare_flags_regressions():
+    """Test slower latency or lower throughput beyond the threshold is flagged"""
+    baseline = make_report(1.0, 5.0, 1000)
+
+    assert compare(make_report(1.1, 5.5, 950), baseline, 0.25) == []
+    regressions = compare(make_report(2.0, 5.0, 500), baseline, 0.25)
+    assert len(regressions) == 2
+    assert 'p50_ms' in regressions[0]
+    assert 'rps' in regressions[1]
+
+def test_compare_ignores_unknown_sizes():
+    """Test sizes missing from the baseline are not compared"""
+    assert compare(make_report(9.0, 9.0, 1), {'results': {}}, 0.25) == []
+
+def test_benchmark_smoke():
+    """Test a tiny benchmark run measures every endpoint"""
+    results = run_size(users=2, urls=10, clicks=50, requests=5)
+
+    assert sorted(results) == sorted(ENDPOINTS)
+    for stats in results.values():
+        assert stats['p50_ms'] <= stats['p99_ms']
+        assert stats['rps'] > 0
+
+def test_parse_importtime():
+    """Test only the entry point and its direct imports are reported"""
+    from benchmarks.bench_startup import parse_importtime
+
+    output = '\n'.join([
+        'import time: self [us] | cumulative | imported package',
+        'import time:        10 |         10 |   encodings',
+        'import time:        20 |         30 | site',
+        'import time:         5 |          5 |     sqlalchemy.util',
+        'import time:       100 |        105 |   models',
+        'import time:        40 |         40 |   cache',
+        'import time:        50 |        195 | redirects',
+    ])
+    assert parse_importtime(output, 'redirects') == {'redirects': 195, 'models': 105, 'cache': 40}
@@ -0,0 +1,83 @@
+import pytest
+import json
+from app import app, db
+from models import User, Url
+from datetime import datetime, timedelta
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+            user = User(
+                id=1,
+                email='test@example.com',
+                password='hashed_password',
+                monthly_quota=5,
+                used_quota=0,
+                quota_reset_date=datetime.utcnow() + timedelta(days=30)
+            )
+            db.session.add(user)
+            db.session.commit()
+        with client.session_transaction() as sess:
+            sess['user_id'] = 1
+        yield client
+
+def make_premium():
+    with app.app_context():
+        db.session.get(User, 1).is_premium = True
+        db.session.commit()
+
+def test_bulk_shorten(client):
+    """Test a batch of URLs is shortened and returned as a code mapping"""
+    response = client.post('/api/shorten/bulk', json={
+        'urls': ['https://example.com/a', 'not-a-url', 'https://example.com/b']
+    })
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert [item['url'] for item in data['created']] == ['https://example.com/a', 'https://example.com/b']
+    assert data['errors'] == [{'index': 1, 'url': 'not-a-url', 'error': 'Invalid URL format'}]
+
+    with app.app_context():
+        assert Url.query.count() == 2
+        assert db.session.get(User, 1).used_quota == 2
+
+    code = data['created'][0]['short_code']
+    assert client.get(f'/{code}').location == 'https://example.com/a'
+
+def test_bulk_quota_applies_to_whole_batch(client):
+    """Test a batch exceeding the remaining quota is rejected as a whole"""
+    response = client.post('/api/shorten/bulk', json={
+        'urls': [f'https://example.com/{i}' for i in range(6)]
+    })
+
+    assert response.status_code == 403
+    assert response.get_json()['remaining'] == 5
+    with app.app_context():
+        assert Url.query.count() == 0
+
+def test_bulk_large_batch_ndjson(client):
+    """Test large batches can be streamed back as NDJSON"""
+    make_premium()
+
+    response = client.post('/api/shorten/bulk?format=ndjson', json={
+        'urls': [f'https://example.com/{i}' for i in range(2000)]
+    })
+
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert len(lines) == 2000
+    assert len({line['short_code'] for line in lines}) == 2000
+    with app.app_context():
+        assert Url.query.count() == 2000
+
+def test_bulk_rejects_bad_payload(client):
+    """Test malformed and oversized batches are rejected"""
+    assert client.post('/api/shorten/bulk', json={'urls': 'x'}).status_code == 400
+
+    app.config['BULK_SHORTEN_MAX'] = 2
+    response = client.post('/api/shorten/bulk', json={'urls': ['https://a.example'] * 3})
+    assert response.status_code == 413
@@ -0,0 +1,154 @@
+import types
+import pytest
+import cache
+import storage
+from app import app, db, resolution_cache
+from models import User, Url, Click
+from cache import ResolutionCache, ResolvedUrl, MISSING
+from storage import MemoryBackend
+from datetime import datetime
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+            user = User(
+                id=1,
+                email='test@example.com',
+                password='hashed_password'
+            )
+            url = Url(
+                id=1,
+                original_url='https://example.com',
+                short_code='abc123',
+                user_id=1,
+                created_at=datetime.utcnow()
+            )
+            db.session.add(user)
+            db.session.add(url)
+            db.session.commit()
+        yield client
+
+def test_lru_eviction():
+    """Test least recently used entries are evicted first"""
+    cache = ResolutionCache(maxsize=2)
+    cache.set('a', ResolvedUrl(1, 'https://a.example'))
+    cache.set('b', ResolvedUrl(2, 'https://b.example'))
+    cache.get('a')
+    cache.set('c', ResolvedUrl(3, 'https://c.example'))
+
+    assert cache.get('b') is None
+    assert cache.get('a').id == 1
+    assert cache.stats()['evictions'] == 1
+
+def test_ttl_expiry():
+    """Test expired entries are treated as misses"""
+    cache = ResolutionCache(ttl=0.01)
+    cache.set('a', ResolvedUrl(1, 'https://a.example'))
+
+    import time
+    time.sleep(0.02)
+
+    assert cache.get('a') is None
+    assert cache.stats()['expirations'] == 1
+
+def test_invalidate_reaches_other_workers():
+    """Test an invalidation on one worker drops the local copies of the others"""
+    backend = MemoryBackend()
+    first = ResolutionCache(backend=backend)
+    second = ResolutionCache(backend=backend)
+
+    first.set('abc123', ResolvedUrl(1, 'https://example.com'))
+    first.set('nope', MISSING)
+    assert second.get('abc123') == ResolvedUrl(1, 'https://example.com')
+    assert second.get('nope') is MISSING
+    assert second.get('abc123') == ResolvedUrl(1, 'https://example.com')
+    assert second.stats()['hits'] == 1
+
+    first.invalidate('abc123')
+    first.invalidate('nope')
+    assert second.get('abc123') is None
+    assert second.get('nope') is None
+    assert second.stats()['invalidations'] == 2
+
+    # Values cached after the invalidation are served locally again
+    second.set('abc123', ResolvedUrl(1, 'https://example.org'))
+    assert first.get('abc123') == ResolvedUrl(1, 'https://example.org')
+    assert second.get('abc123') == ResolvedUrl(1, 'https://example.org')
+
+def test_invalidate_many_batches_backend_calls():
+    """Test invalidating several codes writes and deletes them in one call each"""
+    backend = MemoryBackend()
+    calls = []
+    set_many, delete_many = backend.set_many, backend.delete_many
+    backend.set_many = lambda items, ttl=None: calls.append('set_many') or set_many(items, ttl)
+    backend.delete_many = lambda keys: calls.append('delete_many') or delete_many(keys)
+    first = ResolutionCache(backend=backend)
+    second = ResolutionCache(backend=backend)
+    for code in ('a1', 'b2', 'c3'):
+        second.set(code, MISSING)
+
+    first.invalidate_many(['a1', 'b2', 'c3'])
+    assert calls == ['set_many', 'delete_many']
+    assert [second.get(code) for code in ('a1', 'b2', 'c3')] == [None, None, None]
+
+def test_invalidation_after_version_expiry(monkeypatch):
+    """Test an invalidation made after the version key expired still reaches other workers"""
+    clock = types.SimpleNamespace(now=1000.0)
+    fake_time = types.SimpleNamespace(time=lambda: clock.now, monotonic=lambda: clock.now)
+    monkeypatch.setattr(storage, 'time', fake_time)
+    monkeypatch.setattr(cache, 'time', fake_time)
+    backend = MemoryBackend()
+    first = ResolutionCache(ttl=300, backend=backend)
+    second = ResolutionCache(ttl=300, backend=backend)
+
+    first.invalidate('abc123')
+    clock.now = 1100.0
+    assert second.get('abc123') is None
+    second.set('abc123', ResolvedUrl(1, 'https://example.com'))
+
+    clock.now = 1350.0
+    first.invalidate('abc123')
+    assert second.get('abc123') is None
+
+def test_redirect_served_from_cache(client):
+    """Test repeated redirects resolve the short code once"""
+    client.get('/abc123')
+    response = client.get('/abc123')
+
+    assert response.status_code == 302
+    assert response.location == 'https://example.com'
+    stats = resolution_cache.stats()
+    assert stats['misses'] == 1
+    assert stats['hits'] == 1
+
+def test_unknown_code_negative_cached(client):
+    """Test 404s for unknown codes are cached"""
+    assert client.get('/nope42').status_code == 404
+    assert client.get('/nope42').status_code == 404
+    assert resolution_cache.get('nope42') is MISSING
+    assert resolution_cache.stats()['negative_hits'] >= 1
+
+def test_delete_invalidates_cache(client):
+    """Test deleting a URL stops it from redirecting"""
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+
+    assert client.get('/abc123').status_code == 302
+    client.post('/delete-url/1')
+
+    assert client.get('/abc123').status_code == 404
+
+def test_cache_stats_endpoint(client):
+    """Test cache counters are exposed to logged in users"""
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+
+    client.get('/abc123')
+    response = client.get('/api/stats/cache')
+
+    assert response.status_code == 200
+    assert response.get_json()['misses'] == 1
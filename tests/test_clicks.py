@@ -0,0 +1,136 @@
+import pytest
+import queue
+import time
+import interning
+from sqlalchemy.exc import IntegrityError, OperationalError
+from app import app, db, click_ingestor
+from models import User, Url, Click
+from clicks import ClickIngestor, ClickRecord
+from datetime import datetime
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+            user = User(
+                id=1,
+                email='test@example.com',
+                password='hashed_password'
+            )
+            url = Url(
+                id=1,
+                original_url='https://example.com',
+                short_code='abc123',
+                user_id=1,
+                created_at=datetime.utcnow()
+            )
+            db.session.add(user)
+            db.session.add(url)
+            db.session.commit()
+        yield client
+
+def make_ingestor(maxsize):
+    """Build an ingestor with its own queue that is not registered on the app"""
+    ingestor = ClickIngestor()
+    ingestor.app = app
+    ingestor._queue = queue.Queue(maxsize=maxsize)
+    return ingestor
+
+def make_record(i=0):
+    return ClickRecord(1, f'10.0.0.{i % 250}', datetime.utcnow(), 'pytest', None)
+
+def count_clicks():
+    with app.app_context():
+        return Click.query.count()
+
+def test_redirect_enqueues_click(client):
+    """Test the redirect returns before the click is written"""
+    app.config['CLICK_INGEST_ASYNC'] = True
+    app.config['CLICK_FLUSH_INTERVAL'] = 60
+
+    response = client.get('/abc123')
+    assert response.status_code == 302
+    assert count_clicks() == 0
+
+    click_ingestor.stop()
+    assert count_clicks() == 1
+
+def test_background_writer_flushes_on_interval(client):
+    """Test the background writer flushes on the time trigger"""
+    app.config['CLICK_INGEST_ASYNC'] = True
+    app.config['CLICK_FLUSH_INTERVAL'] = 0.05
+
+    for i in range(3):
+        client.get('/abc123')
+
+    deadline = time.time() + 5
+    while count_clicks() < 3 and time.time() < deadline:
+        time.sleep(0.05)
+    assert count_clicks() == 3
+
+def test_batches_are_bulk_inserted(client):
+    """Test queued clicks are written in batches of CLICK_BATCH_SIZE"""
+    ingestor = make_ingestor(1000)
+    app.config['CLICK_INGEST_ASYNC'] = True
+    app.config['CLICK_BATCH_SIZE'] = 250
+
+    for i in range(600):
+        ingestor._queue.put_nowait(make_record(i))
+    assert ingestor.flush() == 600
+
+    assert ingestor.stats()['batches'] == 3
+    assert count_clicks() == 600
+
+def test_full_queue_drops_clicks(client):
+    """Test clicks are dropped and counted when the queue is full"""
+    ingestor = make_ingestor(2)
+    app.config['CLICK_INGEST_ASYNC'] = True
+    app.config['CLICK_FLUSH_INTERVAL'] = 60
+    ingestor._ensure_worker = lambda: None
+
+    results = [ingestor.record(make_record(i)) for i in range(5)]
+
+    assert results == [True, True, False, False, False]
+    assert ingestor.stats()['dropped'] == 3
+    ingestor.stop()
+    assert count_clicks() == 2
+
+def test_bad_record_does_not_drop_batch(client, monkeypatch):
+    """Test a failing batch is retried in parts and only the bad click is lost"""
+    ingestor = make_ingestor(100)
+    app.config['CLICK_BATCH_SIZE'] = 10
+    click_rows = interning.click_rows
+
+    def rows(batch):
+        if any(record.ip_address == 'bad' for record in batch):
+            raise IntegrityError('INSERT INTO click', {}, ValueError('bad record'))
+        return click_rows(batch)
+
+    monkeypatch.setattr(interning, 'click_rows', rows)
+    for i in range(10):
+        ingestor._queue.put_nowait(make_record(i)._replace(ip_address='bad') if i == 3 else make_record(i))
+
+    assert ingestor.flush() == 9
+    assert (ingestor.stats()['written'], ingestor.stats()['failed']) == (9, 1)
+    assert count_clicks() == 9
+
+def test_database_errors_fail_batch_once(client, monkeypatch):
+    """Test a batch failing for other reasons than its data is not split and retried"""
+    ingestor = make_ingestor(100)
+    app.config['CLICK_BATCH_SIZE'] = 10
+    calls = []
+
+    def rows(batch):
+        calls.append(len(batch))
+        raise OperationalError('INSERT INTO click', {}, Exception('database is locked'))
+
+    monkeypatch.setattr(interning, 'click_rows', rows)
+    for i in range(10):
+        ingestor._queue.put_nowait(make_record(i))
+
+    assert ingestor.flush() == 0
+    assert calls == [10]
+    assert ingestor.stats()['failed'] == 10
@@ -0,0 +1,82 @@
+import pytest
+import re
+from app import app, db
+from models import User, Url, ClickTotal
+from datetime import datetime, timedelta
+from sqlalchemy import event
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+            user = User(
+                id=1,
+                email='test@example.com',
+                password='hashed_password',
+                quota_reset_date=datetime.utcnow() + timedelta(days=30)
+            )
+            db.session.add(user)
+            created_at = datetime(2024, 1, 1)
+            for i in range(1, 8):
+                db.session.add(Url(
+                    id=i,
+                    original_url=f'https://example.com/{i}',
+                    short_code=f'code{i}',
+                    user_id=1,
+                    created_at=created_at + timedelta(days=i)
+                ))
+                db.session.add(ClickTotal(url_id=i, clicks=2 * i, unique_visitors=1))
+            db.session.commit()
+        with client.session_transaction() as sess:
+            sess['user_id'] = 1
+        yield client
+
+def listed_codes(response):
+    return re.findall(rb'/(code\d+)"', response.data)
+
+def test_dashboard_query_count_is_constant(client):
+    """Test the dashboard does not issue one query per URL"""
+    statements = []
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        response = client.get('/dashboard?per_page=100')
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+
+    assert response.status_code == 200
+    assert len(listed_codes(response)) == 7
+    assert len(statements) <= 4
+
+def test_dashboard_keyset_pagination(client):
+    """Test pages are ordered newest first and linked with a cursor"""
+    response = client.get('/dashboard?per_page=3')
+    assert listed_codes(response) == [b'code7', b'code6', b'code5']
+
+    cursor = re.search(rb'before=([^"&]+)', response.data).group(1).decode()
+    response = client.get(f'/dashboard?per_page=3&before={cursor}')
+    assert listed_codes(response) == [b'code4', b'code3', b'code2']
+
+    cursor = re.search(rb'before=([^"&]+)', response.data).group(1).decode()
+    response = client.get(f'/dashboard?per_page=3&before={cursor}')
+    assert listed_codes(response) == [b'code1']
+    assert b'before=' not in response.data
+
+def test_dashboard_totals_cover_all_links(client):
+    """Test header stats include links outside the current page"""
+    response = client.get('/dashboard?per_page=2')
+    # 7 links with 2 * (1 + 2 + ... + 7) clicks
+    assert re.search(rb'<h3 class="mb-0">7</h3>', response.data)
+    assert re.search(rb'<h3 class="mb-0">56</h3>', response.data)
+
+def test_dashboard_ignores_malformed_cursor(client):
+    """Test a malformed cursor falls back to the first page"""
+    response = client.get('/dashboard?per_page=3&before=garbage')
+    assert listed_codes(response) == [b'code7', b'code6', b'code5']
@@ -0,0 +1,82 @@
+import pytest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import text
+from app import app, db
+from models import User, Url
+import engines
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+            db.session.add(User(id=1, email='test@example.com', password='hashed_password'))
+            db.session.add(Url(original_url='https://example.com/new', short_code='fresh1', user_id=1))
+            db.session.commit()
+        yield client
+
+def test_sqlite_profile_pragmas():
+    """Test app connections run in WAL mode with a busy timeout"""
+    with app.app_context():
+        db.create_all()
+        assert db.session.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+        assert db.session.execute(text('PRAGMA synchronous')).scalar() == 1  # NORMAL
+        assert db.session.execute(text('PRAGMA busy_timeout')).scalar() == 5000
+
+def test_profile_selection():
+    """Test the profile follows the database URL unless named"""
+    assert engines.profile_for('sqlite:////tmp/a.db') == 'sqlite'
+    assert engines.profile_for('postgresql+psycopg2://db/app') == 'postgres'
+    assert engines.profile_for('postgres://db/app') == 'postgres'
+    assert engines.profile_for('mysql://db/app') == 'none'
+    assert engines.profile_for('sqlite:////tmp/a.db', 'none') == 'none'
+    with pytest.raises(ValueError):
+        engines.profile_for('sqlite:////tmp/a.db', 'oracle')
+
+def test_postgres_pool_options():
+    """Test the postgres profile sizes, recycles and pre-pings the pool"""
+    settings = engines.from_env({'DB_POOL_SIZE': '5', 'DB_POOL_PRE_PING': '0'})
+
+    assert engines.engine_options('postgres', settings) == {
+        'pool_size': 5,
+        'max_overflow': 20,
+        'pool_recycle': 1800,
+        'pool_pre_ping': False,
+    }
+    assert engines.engine_options('sqlite', settings) == {}
+
+def test_read_session_uses_replica(tmp_path):
+    """Test lag-tolerant reads go to the replica bind when configured"""
+    replica = Flask(__name__)
+    replica.config.update(
+        engines.from_env({'DATABASE_REPLICA_URL': f"sqlite:///{tmp_path / 'replica.db'}"}),
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'primary.db'}",
+    )
+    replica_db = SQLAlchemy()
+    engines.configure(replica)
+    replica_db.init_app(replica)
+    engines.init_app(replica, replica_db)
+
+    with replica.app_context():
+        session = engines.read_session(replica_db)
+        assert session is not replica_db.session
+        assert session is engines.read_session(replica_db)
+        assert str(session.get_bind().url).endswith('replica.db')
+    with app.app_context():
+        assert engines.read_session(db) is db.session
+
+def test_redirect_falls_back_to_primary(client, monkeypatch):
+    """Test a link missing on the replica is looked up on the primary"""
+    class EmptyReplica:
+        def execute(self, query):
+            return db.session.execute(query.where(Url.id == -1))
+
+    monkeypatch.setattr(engines, 'has_replica', lambda db: True)
+    monkeypatch.setattr(engines, 'read_session', lambda db: EmptyReplica())
+
+    response = client.get('/fresh1')
+    assert response.status_code == 302
+    assert response.location == 'https://example.com/new'
@@ -0,0 +1,136 @@
+import pytest
+import enrichment
+import interning
+from app import app, db
+from models import User, Url, Click, bulk_insert
+from clicks import ClickRecord
+from datetime import datetime
+
+CHROME_DESKTOP = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0 Safari/537.36'
+SAFARI_IPHONE = 'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) Version/17.0 Mobile/15E148 Safari/604.1'
+CHROME_TABLET = 'Mozilla/5.0 (Linux; Android 13; SM-X700) AppleWebKit/537.36 Chrome/120.0 Safari/537.36'
+GOOGLEBOT = 'Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)'
+
+RANGES = """# start,end,country
+203.0.113.0,203.0.113.255,au
+198.51.100.0,198.51.100.127,DE
+2001:db8::,2001:db8::ffff,NL
+"""
+
+class CountingResolver:
+    def __init__(self, countries):
+        self.countries = countries
+        self.lookups = 0
+
+    def country(self, ip_address):
+        self.lookups += 1
+        return self.countries.get(ip_address)
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+            db.session.add(User(id=1, email='test@example.com', password='hashed_password'))
+            db.session.add(Url(id=1, original_url='https://example.com', short_code='abc123', user_id=1))
+            db.session.commit()
+            bulk_insert(Click, interning.click_rows([
+                ClickRecord(url_id=1, ip_address=ip, clicked_at=datetime(2024, 3, 4, 12, i), user_agent=agent,
+                            referrer=referrer)
+                for i, (ip, agent, referrer) in enumerate([
+                    ('8.8.8.8', CHROME_DESKTOP, 'https://www.news.example/story?id=1'),
+                    ('8.8.8.8', CHROME_DESKTOP, None),
+                    ('1.1.1.1', SAFARI_IPHONE, 'https://social.example/'),
+                    ('10.0.0.1', GOOGLEBOT, None),
+                    ('1.1.1.1', '', 'not a url'),
+                ])
+            ]))
+            db.session.commit()
+        with client.session_transaction() as sess:
+            sess['user_id'] = 1
+        yield client
+
+def test_parse_user_agent():
+    """Test User-Agent strings map to a device type and browser family"""
+    assert enrichment.parse_user_agent(CHROME_DESKTOP) == ('desktop', 'Chrome')
+    assert enrichment.parse_user_agent(SAFARI_IPHONE) == ('mobile', 'Safari')
+    assert enrichment.parse_user_agent(CHROME_TABLET) == ('tablet', 'Chrome')
+    assert enrichment.parse_user_agent(GOOGLEBOT) == ('bot', 'Bot')
+    assert enrichment.parse_user_agent('curl/8.4.0') == ('other', 'curl')
+    assert enrichment.parse_user_agent('') == (None, 'Unknown')
+
+def test_referrer_domain():
+    """Test referrers are reduced to their host name"""
+    assert enrichment.referrer_domain('https://www.News.example/a?b=c') == 'news.example'
+    assert enrichment.referrer_domain('android-app://com.example.app/') == 'com.example.app'
+    assert enrichment.referrer_domain('not a url') is None
+    assert enrichment.referrer_domain(None) is None
+
+def test_range_file_resolver(tmp_path):
+    """Test countries are looked up in a local IP range file"""
+    path = tmp_path / 'ranges.csv'
+    path.write_text(RANGES)
+    resolver = enrichment.resolver_from_url(f'file://{path}')
+
+    assert resolver.country('203.0.113.77') == 'AU'
+    assert resolver.country('198.51.100.127') == 'DE'
+    assert resolver.country('198.51.100.128') is None
+    assert resolver.country('2001:db8::42') == 'NL'
+    assert resolver.country('1.2.3.4') is None
+    assert isinstance(enrichment.resolver_from_url('stub://'), enrichment.StubResolver)
+    with pytest.raises(ValueError):
+        enrichment.resolver_from_url('maxmind://')
+
+def test_enrich_pending_clicks(client):
+    """Test pending clicks get normalized columns with one lookup per IP"""
+    resolver = CountingResolver({'8.8.8.8': 'US', '1.1.1.1': 'AU'})
+    enricher = enrichment.Enricher(resolver)
+
+    with app.app_context():
+        assert enricher.run(batch_size=2) == 5
+        assert enricher.run() == 0
+        rows = db.session.execute(
+            db.select(Click.country, Click.device, Click.browser, Click.referrer_domain).order_by(Click.id)
+        ).all()
+
+    assert rows == [
+        ('US', 'desktop', 'Chrome', 'news.example'),
+        ('US', 'desktop', 'Chrome', None),
+        ('AU', 'mobile', 'Safari', 'social.example'),
+        (None, 'bot', 'Bot', None),
+        ('AU', None, 'Unknown', None),
+    ]
+    # Private addresses are never looked up; repeats are served by the cache
+    assert resolver.lookups == 2
+    assert enricher.stats()['user_agent_cache_hits'] == 1
+
+def test_enrich_limit(client):
+    """Test --limit caps the number of clicks enriched"""
+    enricher = enrichment.Enricher(enrichment.StubResolver())
+
+    with app.app_context():
+        assert enricher.run(batch_size=2, limit=3) == 3
+        assert Click.query.filter(Click.enriched_at.is_(None)).count() == 2
+
+def test_enrich_clicks_command(client):
+    """Test the CLI enriches every pending click"""
+    result = app.test_cli_runner().invoke(args=['enrich-clicks', '--batch-size', '2'])
+
+    assert 'Enriched 5 clicks' in result.output
+    with app.app_context():
+        assert Click.query.filter(Click.enriched_at.is_(None)).count() == 0
+
+def test_group_by_enriched_columns(client):
+    """Test analytics groups by the enriched columns"""
+    with app.app_context():
+        enrichment.Enricher(CountingResolver({'8.8.8.8': 'US', '1.1.1.1': 'AU'})).run()
+
+    data = client.get('/api/analytics/1?from=2024-03-01&to=2024-03-31&group_by=country').get_json()
+    assert {group['key']: group['total_clicks'] for group in data['groups']} == {'US': 2, 'AU': 2, '(unknown)': 1}
+
+    data = client.get('/api/analytics/1?from=2024-03-01&to=2024-03-31&group_by=referrer_domain').get_json()
+    assert {group['key']: group['total_clicks'] for group in data['groups']} == {
+        '(direct)': 3, 'news.example': 1, 'social.example': 1
+    }
@@ -0,0 +1,101 @@
+import csv
+import io
+import json
+import pytest
+from app import app, db
+import interning
+from models import User, Url, Click, bulk_insert
+from clicks import ClickRecord
+from datetime import datetime
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+            db.session.add(User(id=1, email='test@example.com', password='hashed_password'))
+            db.session.add(Url(
+                id=1,
+                original_url='https://example.com',
+                short_code='abc123',
+                user_id=1,
+                created_at=datetime.utcnow()
+            ))
+            db.session.commit()
+            bulk_insert(Click, interning.click_rows([
+                ClickRecord(
+                    url_id=1,
+                    ip_address=f'10.0.0.{day}',
+                    clicked_at=datetime(2024, 3, day, 12, 0),
+                    user_agent='Mozilla/5.0',
+                    referrer='https://news.example'
+                )
+                for day in range(1, 6)
+            ]))
+            db.session.commit()
+        with client.session_transaction() as sess:
+            sess['user_id'] = 1
+        yield client
+
+def test_export_csv(client):
+    """Test clicks are exported as CSV in time order"""
+    response = client.get('/api/analytics/1/export')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    assert response.is_streamed
+    assert 'clicks-abc123.csv' in response.headers['Content-Disposition']
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [row['ip_address'] for row in rows] == [f'10.0.0.{day}' for day in range(1, 6)]
+    assert rows[0]['clicked_at'] == '2024-03-01T12:00:00'
+
+def test_export_csv_formulas_escaped(client):
+    """Test client-supplied values cannot run as spreadsheet formulas in the CSV export"""
+    user_agent = '=HYPERLINK("https://evil.example","click")'
+    with app.app_context():
+        bulk_insert(Click, interning.click_rows([
+            ClickRecord(1, '10.0.0.9', datetime(2024, 3, 9, 12, 0), user_agent, '@SUM(1+1)')
+        ]))
+        db.session.commit()
+
+    rows = list(csv.DictReader(io.StringIO(client.get('/api/analytics/1/export').get_data(as_text=True))))
+    assert (rows[-1]['user_agent'], rows[-1]['referrer']) == ("'" + user_agent, "'@SUM(1+1)")
+    assert rows[0]['user_agent'] == 'Mozilla/5.0'
+
+    response = client.get('/api/analytics/1/export?format=ndjson')
+    assert json.loads(response.get_data(as_text=True).splitlines()[-1])['user_agent'] == user_agent
+
+def test_export_ndjson_date_range(client):
+    """Test NDJSON export honours from and an inclusive date-only to"""
+    response = client.get('/api/analytics/1/export?format=ndjson&from=2024-03-02&to=2024-03-04')
+
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [line['ip_address'] for line in lines] == ['10.0.0.2', '10.0.0.3', '10.0.0.4']
+    assert lines[0]['referrer'] == 'https://news.example'
+
+def test_export_in_batches(client):
+    """Test rows are emitted one chunk per fetched batch"""
+    import exports
+    with app.test_request_context():
+        chunks = list(exports.stream_clicks(1, batch_size=2))
+
+    assert len(chunks) == 4
+    assert chunks[0] == 'clicked_at,ip_address,user_agent,referrer\r\n'
+
+def test_export_rejects_bad_input(client):
+    """Test unknown formats and malformed dates are rejected"""
+    assert client.get('/api/analytics/1/export?format=xml').status_code == 400
+    assert client.get('/api/analytics/1/export?from=yesterday').status_code == 400
+    assert client.get('/api/analytics/1/export?from=2024-03-05&to=2024-03-01').status_code == 400
+
+def test_export_requires_owner(client):
+    """Test other users cannot export a link's clicks"""
+    with app.app_context():
+        db.session.add(User(id=2, email='other@example.com', password='hashed_password'))
+        db.session.commit()
+    with client.session_transaction() as sess:
+        sess['user_id'] = 2
+
+    assert client.get('/api/analytics/1/export').status_code == 404
@@ -0,0 +1,97 @@
+import pytest
+from limits import parse_many
+from werkzeug.test import Client
+import app as app_module
+from app import app, db
+from cache import ResolvedUrl
+from fastpath import RedirectFastPath, click_from
+from models import User, Url, Click
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+            db.session.add(User(id=1, email='test@example.com', password='hashed_password'))
+            db.session.add(Url(id=1, original_url='https://example.com', short_code='abc123', user_id=1))
+            db.session.commit()
+        yield client
+
+def fallback(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [b'fallback']
+
+def test_redirect_headers(client):
+    """Test redirects are served with an empty body and record the click"""
+    response = client.get('/abc123')
+    assert response.status_code == 302
+    assert response.headers['Location'] == 'https://example.com'
+    assert response.headers['Content-Length'] == '0'
+
+    response = client.head('/abc123')
+    assert response.status_code == 302
+    assert response.data == b''
+    with app.app_context():
+        assert Click.query.count() == 2
+
+def test_cached_not_found_page(client, monkeypatch):
+    """Test unknown and malformed codes get the 404 page rendered once"""
+    renders = []
+    page = app_module.render_not_found()
+    monkeypatch.setattr(app.wsgi_app, 'not_found_page', lambda: renders.append(1) or page)
+    monkeypatch.setattr(app.wsgi_app, '_not_found', None)
+
+    for path in ('/nope42', '/wp-login.php', '/nope42'):
+        response = client.get(path)
+        assert response.status_code == 404
+        assert response.data == page
+    assert renders == [1]
+
+def test_routes_fall_through(client):
+    """Test the app's own pages and other methods are left to Flask"""
+    assert client.get('/pricing').status_code == 200
+    assert client.get('/login').status_code == 200
+    assert client.post('/abc123').status_code == 405
+    assert client.get('/api/analytics/1').status_code == 302
+
+def test_signed_in_not_found(client):
+    """Test signed-in users get the 404 page rendered for them"""
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+
+    response = client.get('/nope42')
+    assert response.status_code == 404
+    assert b'Dashboard' in response.data
+
+def test_rate_limit_shared_with_flask(client, monkeypatch):
+    """Test fast-path redirects count against the redirect_url limits"""
+    app.config['RATELIMIT_ENABLED'] = True
+    monkeypatch.setattr(app_module, 'redirect_limits', parse_many('2 per minute'))
+
+    assert [client.get('/abc123').status_code for _ in range(3)] == [302, 302, 429]
+
+def test_permanent_redirects():
+    """Test the redirect status is configurable and unknown codes fall through without a 404 page"""
+    clicks = []
+    fast_path = RedirectFastPath(
+        fallback,
+        resolve={'abc': ResolvedUrl(1, 'https://example.com/ü')}.get,
+        record=clicks.append,
+        status=301
+    )
+    client = Client(fast_path)
+
+    response = client.get('/abc')
+    assert response.status_code == 301
+    assert response.headers['Location'] == 'https://example.com/%C3%BC'
+    assert client.get('/other').get_data() == b'fallback'
+    assert len(clicks) == 1
+    with pytest.raises(ValueError):
+        RedirectFastPath(fallback, resolve=dict().get, record=clicks.append, status=303)
+
+def test_click_without_client_address():
+    """Test clicks from requests without a client address are still written"""
+    assert click_from(1, {}).ip_address == 'unknown'
+    assert click_from(1, {'REMOTE_ADDR': '10.0.0.1'}).ip_address == '10.0.0.1'
@@ -0,0 +1,107 @@
+import pytest
+import fragments
+import rollups
+import app as app_module
+from app import app, db, fragment_cache, static_pages
+from models import User, Url
+from storage import MemoryBackend
+
+@pytest.fixture
+def client(monkeypatch):
+    app.config['TESTING'] = True
+    # Fragments are only cached with storage every worker shares
+    storage = MemoryBackend()
+    storage.shared = True
+    monkeypatch.setitem(app.extensions, 'shared_storage', storage)
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+            db.session.add(User(id=1, email='test@example.com', password='hashed_password', is_premium=True))
+            db.session.add(Url(id=1, original_url='https://example.com', short_code='abc123', user_id=1))
+            db.session.commit()
+        yield client
+
+@pytest.fixture
+def link_pages(monkeypatch):
+    """Count the dashboard's link page queries"""
+    calls = []
+    link_page = rollups.link_page
+    monkeypatch.setattr(rollups, 'link_page', lambda *args, **kwargs: calls.append(args) or link_page(*args, **kwargs))
+    return calls
+
+def sign_in(client):
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+
+def test_dashboard_fragment_cached(client, link_pages):
+    """Test repeated dashboard loads reuse the rendered links"""
+    sign_in(client)
+
+    first = client.get('/dashboard').data
+    assert client.get('/dashboard').data == first
+    assert len(link_pages) == 1
+    assert b'abc123' in first
+
+    # Other pages are cached separately
+    client.get('/dashboard?per_page=1')
+    assert len(link_pages) == 2
+
+def test_link_changes_bump_version(client, link_pages):
+    """Test creating and deleting links re-renders the dashboard"""
+    sign_in(client)
+    client.get('/dashboard')
+
+    client.post('/shorten', data={'url': 'https://example.org/new'})
+    assert b'https://example.org/new' in client.get('/dashboard').data
+
+    client.post('/delete-url/1')
+    assert b'abc123' not in client.get('/dashboard').data
+    assert len(link_pages) == 3
+
+def test_clicks_bump_version(client):
+    """Test written clicks show up in the dashboard totals"""
+    sign_in(client)
+    assert b'<h3 class="mb-0">0</h3>' in client.get('/dashboard').data
+
+    client.get('/abc123')
+    client.get('/abc123')
+    assert b'<h3 class="mb-0">2</h3>' in client.get('/dashboard').data
+
+def test_unversioned_fragments_not_cached(client, link_pages, monkeypatch):
+    """Test fragments are rendered every time when the version is unknown"""
+    sign_in(client)
+    monkeypatch.setattr(fragments, 'data_version', lambda user_id: None)
+
+    client.get('/dashboard')
+    client.get('/dashboard')
+    assert len(link_pages) == 2
+    assert fragment_cache.stats()['size'] == 0
+
+def test_unshared_storage_not_cached(client, link_pages, monkeypatch):
+    """Test per-process storage renders fragments every time, since other workers' bumps are not seen"""
+    sign_in(client)
+    monkeypatch.setitem(app.extensions, 'shared_storage', MemoryBackend())
+
+    client.get('/dashboard')
+    client.get('/dashboard')
+    assert len(link_pages) == 2
+    assert fragment_cache.stats()['size'] == 0
+
+def test_prerendered_pages(client, monkeypatch):
+    """Test anonymous visitors get the prerendered marketing pages"""
+    static_pages.prerender()
+    monkeypatch.setattr(app_module, 'render_template', lambda *args, **kwargs: pytest.fail('rendered'))
+
+    assert b'Get Started' in client.get('/pricing').data
+    assert client.get('/').status_code == 200
+
+def test_personal_pages_rendered(client):
+    """Test signed-in users and pending flashes bypass the prerendered pages"""
+    with client.session_transaction() as sess:
+        sess['_flashes'] = [('info', 'Logged out successfully')]
+    assert b'Logged out successfully' in client.get('/pricing').data
+    assert b'Logged out successfully' not in client.get('/pricing').data
+
+    sign_in(client)
+    assert b'View Dashboard' in client.get('/pricing').data
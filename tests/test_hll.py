@@ -0,0 +1,95 @@
+import pytest
+from app import app, db
+from models import User, Url, ClickRollupDaily, ClickTotal
+from hll import HyperLogLog
+from datetime import datetime, timedelta
+import rollups
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+            user = User(
+                id=1,
+                email='test@example.com',
+                password='hashed_password',
+                quota_reset_date=datetime.utcnow() + timedelta(days=30)
+            )
+            db.session.add(user)
+            for i in (1, 2):
+                db.session.add(Url(
+                    id=i,
+                    original_url=f'https://example.com/{i}',
+                    short_code=f'code{i}',
+                    user_id=1,
+                    created_at=datetime.utcnow()
+                ))
+            db.session.commit()
+        yield client
+
+@pytest.mark.parametrize('n', [10, 100, 1000, 10000, 50000])
+def test_estimate_within_error_bound(n):
+    """Test estimates stay within three standard errors of the exact count"""
+    sketch = HyperLogLog().update(f'192.168.{i // 256}.{i % 256}-{i}' for i in range(n))
+    assert abs(sketch.count() - n) <= 3 * sketch.error * n + 1
+
+def test_merge_equals_union():
+    """Test merged sketches estimate the union of their inputs"""
+    a = HyperLogLog().update(str(i) for i in range(0, 6000))
+    b = HyperLogLog().update(str(i) for i in range(4000, 10000))
+    exact = HyperLogLog().update(str(i) for i in range(0, 10000))
+
+    merged = HyperLogLog.union([a, b])
+    assert merged.registers == exact.registers
+    assert abs(merged.count() - 10000) <= 3 * merged.error * 10000
+
+def test_serialization_round_trip():
+    """Test sparse and dense encodings round-trip"""
+    small = HyperLogLog().update(str(i) for i in range(20))
+    large = HyperLogLog().update(str(i) for i in range(5000))
+
+    assert len(small.to_bytes()) < 100
+    assert len(large.to_bytes()) == 1 + large.m
+    for sketch in (small, large):
+        assert HyperLogLog.from_bytes(sketch.to_bytes()).registers == sketch.registers
+    assert HyperLogLog.from_bytes(None).count() == 0
+
+def test_rollup_sketches_merge_across_days_and_urls(client):
+    """Test unique visitors merge across days and across a user's URLs"""
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+
+    # The same visitor clicks both links twice today...
+    for code in ('code1', 'code1', 'code2', 'code2'):
+        client.get(f'/{code}', environ_base={'REMOTE_ADDR': '10.0.0.1'})
+
+    # ...and was also seen on the first link yesterday
+    with app.app_context():
+        yesterday = rollups.bucket_start(datetime.utcnow() - timedelta(days=1), rollups.DAY)
+        db.session.add(ClickRollupDaily(
+            url_id=1, bucket_start=yesterday, clicks=1, unique_visitors=1,
+            visitor_sketch=HyperLogLog().update(['10.0.0.1']).to_bytes()
+        ))
+        db.session.commit()
+
+        assert ClickTotal.query.filter_by(url_id=1).one().unique_visitors == 1
+        assert rollups.account_totals(1) == (2, 4, 1)
+
+    data = client.get('/api/analytics/1').get_json()
+    assert data['total_clicks'] == 3
+    assert data['unique_clicks'] == 1
+
+def test_merge_bytes_matches_merge():
+    """Test folding serialized sketches equals merging loaded ones"""
+    sparse = HyperLogLog().update(f'a{i}' for i in range(20))
+    dense = HyperLogLog().update(f'b{i}' for i in range(5000))
+
+    folded = HyperLogLog().merge_bytes(sparse.to_bytes()).merge_bytes(dense.to_bytes()).merge_bytes(None)
+    merged = HyperLogLog().merge(sparse).merge(dense)
+
+    assert folded.registers == merged.registers
+    with pytest.raises(ValueError):
+        HyperLogLog(p=12).merge_bytes(sparse.to_bytes())
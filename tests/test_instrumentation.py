@@ -0,0 +1,79 @@
+import logging
+import pytest
+from app import app, db, request_metrics
+from models import User, Url
+from datetime import datetime
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    request_metrics.reset()
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+            db.session.add(User(id=1, email='test@example.com', password='hashed_password'))
+            db.session.add(Url(
+                id=1,
+                original_url='https://example.com',
+                short_code='abc123',
+                user_id=1,
+                created_at=datetime.utcnow()
+            ))
+            db.session.commit()
+        yield client
+
+def test_request_and_sql_counted_per_endpoint(client):
+    """Test each request records its wall time and SQL statements"""
+    client.get('/abc123')
+
+    stats = request_metrics.snapshot()['redirect_url']
+    assert stats['requests'] == 1
+    assert stats['duration'] > 0
+    assert stats['sql_statements'] >= 1
+    assert stats['slowest_statement'].startswith('SELECT url.id')
+    assert 'FROM url' in stats['slowest_statement']
+
+def test_sql_outside_requests_not_counted(client):
+    """Test statements run outside a request are not attributed to one"""
+    with app.app_context():
+        Url.query.count()
+
+    assert request_metrics.snapshot() == {}
+
+def test_metrics_endpoint(client, monkeypatch):
+    """Test /metrics serves Prometheus text including cache statistics"""
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', 'secret')
+    client.get('/abc123')
+    response = client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    body = response.get_data(as_text=True)
+    assert 'urlshortener_requests_total{endpoint="redirect_url"} 1' in body
+    assert 'urlshortener_request_duration_seconds_count{endpoint="redirect_url"} 1' in body
+    assert '# TYPE urlshortener_sql_statements_total counter' in body
+    assert 'urlshortener_resolution_cache_misses 1' in body
+    # SQL text stays out of the exported labels
+    assert 'urlshortener_sql_slowest_statement_seconds{endpoint="redirect_url"}' in body
+    assert 'SELECT' not in body
+
+def test_metrics_token(client, monkeypatch):
+    """Test /metrics requires the bearer token and is not served without one"""
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', None)
+    assert client.get('/metrics').status_code == 404
+
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', 'secret')
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    response = client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+
+def test_slow_request_logged(client, caplog):
+    """Test requests over SLOW_REQUEST_MS are logged"""
+    app.config['SLOW_REQUEST_MS'] = 0.001
+
+    with caplog.at_level(logging.WARNING, logger=app.logger.name):
+        client.get('/abc123')
+
+    assert any('Slow request GET /abc123' in record.getMessage() for record in caplog.records)
@@ -0,0 +1,88 @@
+import pytest
+import interning
+from sqlalchemy import event
+from app import app, db
+from models import User, Url, Click, UserAgent, Referrer
+from clicks import ClickRecord
+from datetime import datetime
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+            db.session.add(User(id=1, email='test@example.com', password='hashed_password'))
+            db.session.add(Url(id=1, original_url='https://example.com', short_code='abc123', user_id=1))
+            db.session.commit()
+        yield client
+
+def test_ids_are_cached(client):
+    """Test values are stored once and later resolved without a query"""
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with app.app_context():
+        first = interning.user_agents.ids(['Firefox', 'Chrome', 'Firefox', '', None])
+        assert sorted(first) == ['Chrome', 'Firefox']
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            assert interning.user_agents.ids(['Chrome', 'Firefox']) == first
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        assert statements == []
+        assert UserAgent.query.count() == 2
+
+def test_ids_reuse_existing_rows(client):
+    """Test values already in the table are found after the cache is cleared"""
+    with app.app_context():
+        first = interning.referrers.ids(['https://news.example'])
+        interning.clear()
+
+        assert interning.referrers.ids(['https://news.example', 'https://blog.example'])['https://news.example'] \
+            == first['https://news.example']
+        assert Referrer.query.count() == 2
+        assert interning.referrers.stats()['misses'] == 2
+
+def test_cache_is_bounded(client):
+    """Test the least recently used values are evicted"""
+    interner = interning.Interner(UserAgent, maxsize=2)
+    with app.app_context():
+        interner.ids(['a', 'b'])
+        interner.ids(['a'])
+        interner.ids(['c'])
+
+        assert interner.stats()['size'] == 2
+        assert list(interner._ids) == ['a', 'c']
+
+def test_click_rows_survive_rollback(client):
+    """Test ids cached during a rolled back ingest still point at real rows"""
+    record = ClickRecord(url_id=1, ip_address='10.0.0.1', clicked_at=datetime(2024, 3, 1),
+                         user_agent='Firefox', referrer='https://news.example')
+    with app.app_context():
+        db.session.add_all(Click(**row) for row in interning.click_rows([record]))
+        db.session.rollback()
+
+        db.session.add_all(Click(**row) for row in interning.click_rows([record]))
+        db.session.commit()
+        click = Click.query.one()
+        assert db.session.get(UserAgent, click.user_agent_id).value == 'Firefox'
+        assert db.session.get(Referrer, click.referrer_id).value == 'https://news.example'
+
+def test_referrer_query_not_interned(client):
+    """Test referrers differing only in query string or fragment share one row"""
+    records = [
+        ClickRecord(url_id=1, ip_address='10.0.0.1', clicked_at=datetime(2024, 3, 1), user_agent='Firefox',
+                    referrer=referrer)
+        for referrer in ('https://news.example/story?utm_source=a', 'https://news.example/story?utm_source=b#top',
+                         'https://news.example/story')
+    ]
+    with app.app_context():
+        rows = interning.click_rows(records)
+
+        assert len({row['referrer_id'] for row in rows}) == 1
+        assert Referrer.query.one().value == 'https://news.example/story'
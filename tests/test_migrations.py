@@ -0,0 +1,139 @@
+import pytest
+import migrations
+from datetime import datetime
+from sqlalchemy import create_engine, inspect, select, text
+from models import db, Url, Click
+
+@pytest.fixture
+def engine(tmp_path):
+    """A database created before any migration existed"""
+    engine = create_engine(f'sqlite:///{tmp_path}/old.db')
+    new_tables = {'click', 'user_agent', 'referrer'}
+    db.metadata.create_all(engine, tables=[t for t in db.metadata.sorted_tables if t.name not in new_tables])
+    with engine.begin() as conn:
+        conn.execute(text('DROP INDEX ix_url_user_id_created_at'))
+        for column in ('deleted_at', 'redirect_status', 'cache_max_age', 'edge_cacheable'):
+            conn.execute(text(f'ALTER TABLE url DROP COLUMN {column}'))
+        conn.execute(text(
+            'CREATE TABLE click (id INTEGER PRIMARY KEY, url_id INTEGER NOT NULL REFERENCES url (id), '
+            'ip_address VARCHAR(45) NOT NULL, clicked_at DATETIME, user_agent VARCHAR(500), referrer VARCHAR(500))'
+        ))
+    yield engine
+    engine.dispose()
+
+def index_names(engine, table):
+    return {index['name'] for index in inspect(engine).get_indexes(table)}
+
+def query_plan(engine, statement):
+    compiled = statement.compile(engine, compile_kwargs={'literal_binds': True})
+    with engine.connect() as conn:
+        return ' '.join(row[-1] for row in conn.execute(text(f'EXPLAIN QUERY PLAN {compiled}')))
+
+def test_upgrade_existing_database(engine):
+    """Test pending migrations update the schema and are recorded"""
+    assert [version for version, _, _ in migrations.pending(engine)] == [1, 2, 3, 4, 5]
+
+    assert migrations.upgrade(engine) == [1, 2, 3, 4, 5]
+
+    assert 'ix_url_user_id_created_at' in index_names(engine, 'url')
+    assert 'ix_click_url_id_clicked_at' in index_names(engine, 'click')
+    assert 'ix_click_clicked_at' in index_names(engine, 'click')
+    assert 'deleted_at' in {column['name'] for column in inspect(engine).get_columns('url')}
+    assert 'ix_click_unenriched' in index_names(engine, 'click')
+    assert {'country', 'device', 'browser', 'referrer_domain', 'enriched_at'} <= {
+        column['name'] for column in inspect(engine).get_columns('click')
+    }
+    assert migrations.pending(engine) == []
+    assert migrations.upgrade(engine) == []
+
+def test_redirect_policy_defaults(engine):
+    """Test existing links keep uncached redirects with the default status"""
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO user (id, email, password) VALUES (1, 'a@example.com', 'x')"))
+        conn.execute(text(
+            "INSERT INTO url (id, original_url, short_code, user_id) VALUES (1, 'https://example.com', 'abc', 1)"
+        ))
+
+    migrations.upgrade(engine)
+
+    with engine.connect() as conn:
+        policy = conn.execute(select(Url.redirect_status, Url.cache_max_age, Url.edge_cacheable)).one()
+    assert tuple(policy) == (None, 0, False)
+
+def test_upgrade_on_current_schema(tmp_path):
+    """Test migrations are no-ops on a database built by create_all"""
+    engine = create_engine(f'sqlite:///{tmp_path}/new.db')
+    db.metadata.create_all(engine)
+
+    assert migrations.upgrade(engine) == [1, 2, 3, 4, 5]
+    engine.dispose()
+
+def test_click_range_query_uses_index(engine):
+    """Test per-link click range scans use (url_id, clicked_at)"""
+    migrations.upgrade(engine)
+    statement = select(Click).where(Click.url_id == 1, Click.clicked_at >= datetime(2024, 1, 1))
+
+    assert 'USING INDEX ix_click_url_id_clicked_at (url_id=? AND clicked_at>?)' in query_plan(engine, statement)
+
+def test_dashboard_listing_uses_index(engine):
+    """Test a user's newest links are read in index order without sorting"""
+    migrations.upgrade(engine)
+    statement = select(Url).where(Url.user_id == 1).order_by(Url.created_at.desc()).limit(25)
+
+    plan = query_plan(engine, statement)
+    assert 'USING INDEX ix_url_user_id_created_at (user_id=?)' in plan
+    assert 'TEMP B-TREE' not in plan
+
+def test_pending_enrichment_uses_partial_index(engine):
+    """Test the enrichment worker finds pending clicks through the partial index"""
+    migrations.upgrade(engine)
+    statement = select(Click.id).where(Click.enriched_at.is_(None)).order_by(Click.id).limit(1000)
+
+    plan = query_plan(engine, statement)
+    assert 'ix_click_unenriched' in plan
+    assert 'TEMP B-TREE' not in plan
+
+def test_intern_click_strings_in_chunks(engine):
+    """Test existing user agents and referrers move to lookup tables"""
+    referrers = ('https://news.example/?utm_source=a', 'https://news.example/#top')
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO user (id, email, password) VALUES (1, 'a@example.com', 'x')"
+        ))
+        conn.execute(text(
+            "INSERT INTO url (id, original_url, short_code, user_id) VALUES (1, 'https://example.com', 'abc123', 1)"
+        ))
+        for i in range(1, 8):
+            conn.execute(text(
+                'INSERT INTO click (id, url_id, ip_address, clicked_at, user_agent, referrer) '
+                'VALUES (:id, 1, :ip, :at, :agent, :referrer)'
+            ), {
+                'id': i, 'ip': f'10.0.0.{i}', 'at': datetime(2024, 3, 1),
+                'agent': ['Firefox', 'Chrome', ''][i % 3],
+                'referrer': referrers[i % 4 // 2] if i % 2 else None,
+            })
+
+    migrations.intern_click_strings(engine, chunk_size=3)
+    assert migrations.upgrade(engine) == [1, 2, 3, 4, 5]  # 4 is a no-op by now
+
+    columns = {column['name'] for column in inspect(engine).get_columns('click')}
+    assert {'user_agent_id', 'referrer_id'} <= columns
+    assert not {'user_agent', 'referrer'} & columns
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            'SELECT user_agent.value, referrer.value FROM click '
+            'LEFT JOIN user_agent ON user_agent.id = click.user_agent_id '
+            'LEFT JOIN referrer ON referrer.id = click.referrer_id ORDER BY click.id'
+        )).all()
+        assert conn.execute(text('SELECT COUNT(*) FROM user_agent')).scalar() == 2
+        # Query strings and fragments are not interned, as on ingest
+        assert conn.execute(text('SELECT COUNT(*) FROM referrer')).scalar() == 1
+    assert rows == [
+        ('Chrome', 'https://news.example/'),
+        (None, None),
+        ('Firefox', 'https://news.example/'),
+        ('Chrome', None),
+        (None, 'https://news.example/'),
+        ('Firefox', None),
+        ('Chrome', 'https://news.example/'),
+    ]
@@ -0,0 +1,93 @@
+import threading
+import pytest
+import quota
+from app import app, db
+from models import User
+from datetime import datetime, timedelta
+
+@pytest.fixture
+def user():
+    app.config['TESTING'] = True
+    with app.test_request_context():
+        db.create_all()
+        db.session.add(User(
+            id=1,
+            email='test@example.com',
+            password='hashed_password',
+            monthly_quota=5,
+            used_quota=0,
+            quota_reset_date=datetime.utcnow() + timedelta(days=30)
+        ))
+        db.session.commit()
+        yield User.query.get(1)
+
+def test_reserve_until_exhausted(user):
+    """Test reservations succeed up to the monthly quota"""
+    results = [quota.reserve(user) for _ in range(6)]
+
+    assert results == [True] * 5 + [False]
+    assert user.used_quota == 5
+    assert quota.remaining(user) == 0
+
+def test_batch_reservation_is_all_or_nothing(user):
+    """Test a batch larger than the remaining quota reserves nothing"""
+    assert quota.reserve(user, 3)
+    assert not quota.reserve(user, 3)
+    assert user.used_quota == 3
+    assert quota.reserve(user, 2)
+
+def test_release(user):
+    """Test released reservations are returned to the quota"""
+    quota.reserve(user, 4)
+    quota.release(user, 2)
+    assert user.used_quota == 2
+    quota.release(user, 10)
+    assert user.used_quota == 0
+
+def test_premium_not_charged(user):
+    """Test premium users are never limited or charged"""
+    user.is_premium = True
+    db.session.commit()
+
+    assert all(quota.reserve(user, 5) for _ in range(3))
+    assert user.used_quota == 0
+    assert quota.remaining(user) is None
+
+def test_reserve_rolls_over_ended_period(user):
+    """Test a reservation after the reset date starts a new period"""
+    user.used_quota = 5
+    user.quota_reset_date = datetime.utcnow() - timedelta(days=1)
+    db.session.commit()
+
+    assert quota.reserve(user, 2)
+    assert user.used_quota == 2
+    assert user.quota_reset_date > datetime.utcnow() + timedelta(days=29)
+
+def test_rollover_without_reset_date_keeps_usage(user):
+    """Test a missing reset date starts a period without clearing usage"""
+    user.used_quota = 3
+    user.quota_reset_date = None
+    db.session.commit()
+
+    assert quota.rollover(user)
+    assert user.used_quota == 3
+    assert user.quota_reset_date is not None
+    assert not quota.rollover(user)
+
+def test_concurrent_reservations_do_not_overshoot(user):
+    """Test parallel reservations never exceed the quota"""
+    results = []
+
+    def reserve():
+        with app.test_request_context():
+            results.append(quota.reserve(User.query.get(1)))
+
+    threads = [threading.Thread(target=reserve) for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results.count(True) == 5
+    db.session.expire_all()
+    assert User.query.get(1).used_quota == 5
@@ -0,0 +1,85 @@
+import pytest
+from werkzeug.test import Client
+from app import app, db
+from models import User, Url, Click
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+            db.session.add(User(id=1, email='test@example.com', password='hashed_password'))
+            db.session.add(User(id=2, email='other@example.com', password='hashed_password'))
+            db.session.add(Url(id=1, original_url='https://example.com', short_code='abc123', user_id=1))
+            db.session.add(Url(id=2, original_url='https://example.org', short_code='def456', user_id=2))
+            db.session.commit()
+        with client.session_transaction() as sess:
+            sess['user_id'] = 1
+        yield client
+
+def test_default_policy(client):
+    """Test links redirect with the default status and are not cached"""
+    response = client.get('/abc123')
+
+    assert response.status_code == 302
+    assert response.headers['Cache-Control'] == 'no-store'
+
+def test_update_policy_api(client):
+    """Test PATCH /api/urls/<id> changes how the link redirects"""
+    client.get('/abc123')
+    response = client.patch('/api/urls/1', json={'redirect_status': 308, 'cache_max_age': 3600, 'edge_cacheable': True})
+
+    assert response.status_code == 200
+    assert response.get_json() == {
+        'id': 1, 'short_code': 'abc123', 'redirect_status': 308, 'cache_max_age': 3600, 'edge_cacheable': True
+    }
+    # The cached resolution was invalidated
+    response = client.get('/abc123')
+    assert response.status_code == 308
+    assert response.headers['Cache-Control'] == 'public, max-age=3600'
+
+    response = client.patch('/api/urls/1', json={'redirect_status': None, 'edge_cacheable': False})
+    assert response.get_json()['cache_max_age'] == 3600
+    response = client.get('/abc123')
+    assert response.status_code == 302
+    assert response.headers['Cache-Control'] == 'private, max-age=3600'
+
+def test_update_policy_validation(client):
+    """Test invalid policies are rejected and leave the link unchanged"""
+    for payload in ({'redirect_status': 303}, {'cache_max_age': -1}, {'cache_max_age': 'soon'},
+                    {'edge_cacheable': 'yes please'}, {'edge_cacheable': True}):
+        response = client.patch('/api/urls/1', json=payload)
+        assert response.status_code == 400
+        assert 'error' in response.get_json()
+    assert client.patch('/api/urls/1', data='[]', content_type='application/json').status_code == 400
+    assert client.patch('/api/urls/2', json={'cache_max_age': 60}).status_code == 404
+
+    with app.app_context():
+        url = db.session.get(Url, 1)
+        assert (url.redirect_status, url.cache_max_age, url.edge_cacheable) == (None, 0, False)
+
+def test_dashboard_policy_form(client):
+    """Test the dashboard form saves the policy and an unchecked box clears edge caching"""
+    assert b'policyModal-1' in client.get('/dashboard').data
+
+    client.post('/url-policy/1', data={'redirect_status': '301', 'cache_max_age': '600', 'edge_cacheable': 'on'})
+    with app.app_context():
+        url = db.session.get(Url, 1)
+        assert (url.redirect_status, url.cache_max_age, url.edge_cacheable) == (301, 600, True)
+
+    client.post('/url-policy/1', data={'redirect_status': '', 'cache_max_age': '600'})
+    with app.app_context():
+        url = db.session.get(Url, 1)
+        assert (url.redirect_status, url.cache_max_age, url.edge_cacheable) == (None, 600, False)
+
+def test_routed_redirect_policy(client):
+    """Test the Flask route applies the policy when the fast path is off"""
+    client.patch('/api/urls/1', json={'redirect_status': 307, 'cache_max_age': 60})
+
+    response = Client(app.wsgi_app.app).get('/abc123', environ_base={'REMOTE_ADDR': '10.0.0.1'})
+    assert response.status_code == 307
+    assert response.headers['Cache-Control'] == 'private, max-age=60'
+    with app.app_context():
+        assert Click.query.count() == 1
@@ -0,0 +1,75 @@
+import os
+import subprocess
+import sys
+import pytest
+from limits import parse_many
+from werkzeug.test import Client
+import redirects
+from app import app, db, limiter
+from models import User, Url, Click, UserAgent
+
+@pytest.fixture
+def client(monkeypatch):
+    app.config['TESTING'] = True
+    redirects.resolution_cache.clear()
+    # Write clicks inline so tests can assert on them right after a redirect
+    monkeypatch.setitem(redirects.core.config, 'CLICK_INGEST_ASYNC', False)
+
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(id=1, email='test@example.com', password='hashed_password'))
+        db.session.add(Url(id=1, original_url='https://example.com/ü', short_code='abc123', user_id=1))
+        db.session.commit()
+    yield Client(redirects.app)
+
+def test_redirect(client):
+    """Test the redirect-only entry point redirects and records the click"""
+    response = client.get('/abc123', headers={'User-Agent': 'test', 'X-Forwarded-For': '203.0.113.9'})
+
+    assert response.status_code == 302
+    assert response.headers['Location'] == 'https://example.com/%C3%BC'
+    with app.app_context():
+        click = Click.query.one()
+        assert (click.url_id, click.ip_address) == (1, '203.0.113.9')
+        assert db.session.get(UserAgent, click.user_agent_id).value == 'test'
+
+def test_falls_back_to_flask(client):
+    """Test unknown codes and other pages are served by the full app"""
+    assert client.get('/missing').status_code == 404
+    assert client.get('/pricing').status_code == 200
+    assert client.post('/abc123').status_code == 405
+
+def test_rate_limit(client, monkeypatch):
+    """Test redirects are rate limited per client"""
+    monkeypatch.setattr(redirects, 'rate_limiting', True)
+    monkeypatch.setattr(redirects, 'rate_limits', parse_many('2 per minute'))
+    redirects.rate_limiter.storage.reset()
+
+    # Forwarded-for headers are the client's own and do not reset the count
+    statuses = [client.get('/abc123', headers={'X-Forwarded-For': f'203.0.113.{i}'}).status_code for i in range(3)]
+    assert statuses == [302, 302, 429]
+    # The counters are those of the Flask app's redirect_url limits
+    assert not limiter.limiter.test(redirects.rate_limits[0], '127.0.0.1', 'redirect_url')
+
+def test_cold_start_imports():
+    """Test the entry points do not load Stripe, and redirects not Flask-Limiter"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = (
+        'import sys, app, redirects; '
+        'print(*(name for name in ("stripe", "requests") if name in sys.modules)); '
+    )
+    assert subprocess.run([sys.executable, '-c', script], cwd=root, capture_output=True, text=True,
+                          check=True).stdout.strip() == ''
+    script = 'import sys, redirects; print("flask_limiter" in sys.modules, "app" in sys.modules)'
+    assert subprocess.run([sys.executable, '-c', script], cwd=root, capture_output=True, text=True,
+                          check=True).stdout.strip() == 'False False'
+
+def test_split_deployment_without_shared_storage():
+    """Test the app still starts on Vercel without a shared store, with short-lived cached links"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, VERCEL='1', STORAGE_URL='memory://', RESOLUTION_CACHE_TTL='300',
+               RESOLUTION_CACHE_NEGATIVE_TTL='30')
+    result = subprocess.run([sys.executable, '-c', 'import app, redirects; print(redirects.resolution_cache.ttl)'],
+                            cwd=root, env=env, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == '30'
+    assert 'STORAGE_URL is not a redis:// URL' in result.stderr
@@ -0,0 +1,100 @@
+import csv
+import gzip
+import pytest
+import interning
+import rollups
+import retention
+from app import app, db
+from models import User, Url, Click, ClickRollupHourly, ClickRollupDaily, ClickTotal
+from clicks import ClickRecord
+from datetime import datetime, timedelta
+
+NOW = datetime(2024, 6, 15, 12, 0)
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+            db.session.add(User(
+                id=1,
+                email='test@example.com',
+                password='hashed_password',
+                quota_reset_date=datetime.utcnow() + timedelta(days=30)
+            ))
+            db.session.add(Url(
+                id=1,
+                original_url='https://example.com',
+                short_code='abc123',
+                user_id=1,
+                created_at=datetime(2024, 1, 1)
+            ))
+            db.session.commit()
+        yield client
+
+def add_clicks(*times):
+    records = [
+        ClickRecord(url_id=1, ip_address=f'10.0.0.{i}', clicked_at=clicked_at, user_agent=None, referrer=None)
+        for i, clicked_at in enumerate(times)
+    ]
+    db.session.add_all(Click(**row) for row in interning.click_rows(records))
+    rollups.apply_clicks(records)
+    db.session.commit()
+
+def test_expired_partitions(client):
+    """Test only whole months past the retention period expire"""
+    with app.app_context():
+        add_clicks(datetime(2024, 2, 10), datetime(2024, 4, 20), datetime(2024, 6, 1))
+
+        assert retention.expired_partitions(60, now=NOW) == [
+            (datetime(2024, 2, 1), datetime(2024, 3, 1)),
+            (datetime(2024, 3, 1), datetime(2024, 4, 1)),
+        ]
+
+def test_retention_archives_and_keeps_aggregates(client, tmp_path):
+    """Test purged months are archived while daily rollups and totals remain"""
+    with app.app_context():
+        add_clicks(datetime(2024, 2, 10), datetime(2024, 2, 11), datetime(2024, 6, 1))
+
+        purged = retention.enforce_retention(60, archive_dir=str(tmp_path), batch_size=1, now=NOW)
+
+        assert purged == [('2024-02', 2, 2), ('2024-03', 0, 0)]
+        assert Click.query.count() == 1
+        assert ClickRollupHourly.query.count() == 1
+        assert ClickRollupDaily.query.count() == 3
+        assert ClickTotal.query.get(1).clicks == 3
+
+    with gzip.open(tmp_path / 'clicks-2024-02.csv.gz', 'rt') as f:
+        rows = list(csv.DictReader(f))
+    assert [row['ip_address'] for row in rows] == ['10.0.0.0', '10.0.0.1']
+
+def test_backfill_since_keeps_purged_history(client):
+    """Test a partial backfill rebuilds recent buckets only"""
+    with app.app_context():
+        add_clicks(datetime(2024, 2, 10), datetime(2024, 6, 1))
+        retention.enforce_retention(60, now=NOW)
+
+        rollups.backfill(since=datetime(2024, 4, 1))
+
+        assert ClickRollupDaily.query.count() == 2
+        assert ClickTotal.query.get(1).clicks == 2
+
+def test_deleted_url_hidden_until_reclaimed(client):
+    """Test tombstoned links stop resolving and are reclaimed in chunks"""
+    with app.app_context():
+        add_clicks(*(datetime(2024, 6, 1) for _ in range(5)))
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+
+    client.post('/delete-url/1')
+
+    assert client.get('/abc123').status_code == 404
+    assert b'abc123' not in client.get('/dashboard').data
+    with app.app_context():
+        assert Click.query.count() == 5
+        assert retention.reclaim_deleted(batch_size=2) == 1
+        assert Click.query.count() == 0
+        assert ClickTotal.query.count() == 0
+        assert Url.query.count() == 0
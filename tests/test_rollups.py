@@ -0,0 +1,123 @@
+import pytest
+from app import app, db
+from models import User, Url, Click, ClickRollupHourly, ClickRollupDaily, ClickTotal
+from datetime import datetime, timedelta
+import rollups
+from clicks import ClickRecord
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+            user = User(
+                id=1,
+                email='test@example.com',
+                password='hashed_password',
+                quota_reset_date=datetime.utcnow() + timedelta(days=30)
+            )
+            url = Url(
+                id=1,
+                original_url='https://example.com',
+                short_code='abc123',
+                user_id=1,
+                created_at=datetime.utcnow()
+            )
+            db.session.add(user)
+            db.session.add(url)
+            db.session.commit()
+        yield client
+
+def test_clicks_update_rollups(client):
+    """Test ingested clicks are counted in hourly and daily rollups"""
+    client.get('/abc123', environ_base={'REMOTE_ADDR': '10.0.0.1'})
+    client.get('/abc123', environ_base={'REMOTE_ADDR': '10.0.0.1'})
+    client.get('/abc123', environ_base={'REMOTE_ADDR': '10.0.0.2'})
+
+    with app.app_context():
+        for model in (ClickRollupHourly, ClickRollupDaily, ClickTotal):
+            bucket = model.query.filter_by(url_id=1).one()
+            assert bucket.clicks == 3
+            assert bucket.unique_visitors == 2
+
+def test_rollup_keys_upserted_in_order(client, monkeypatch):
+    """Test rollup rows are written in key order whatever order clicks arrive in"""
+    written = []
+    increment = rollups._increment
+
+    def record(model, counts):
+        written.append(list(counts))
+        increment(model, counts)
+
+    monkeypatch.setattr(rollups, 'KEY_CHUNK', 2)
+    monkeypatch.setattr(rollups, '_increment', record)
+    clicks = [
+        ClickRecord(url_id, '10.0.0.1', datetime(2024, 3, 1, hour), 'pytest', None)
+        for url_id, hour in [(3, 5), (1, 9), (2, 1), (1, 2)]
+    ]
+
+    with app.app_context():
+        rollups.apply_clicks(clicks)
+        db.session.rollback()
+
+    hourly = [key for chunk in written[:2] for key in chunk]
+    assert hourly == sorted(hourly)
+    assert written[-2:] == [[(1,), (2,)], [(3,)]]
+
+def test_analytics_reads_rollups(client):
+    """Test the analytics API is served from the daily rollups"""
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+
+    client.get('/abc123', environ_base={'REMOTE_ADDR': '10.0.0.1'})
+    client.get('/abc123', environ_base={'REMOTE_ADDR': '10.0.0.2'})
+
+    # Raw clicks are not consulted once they are rolled up
+    with app.app_context():
+        Click.query.delete()
+        db.session.commit()
+
+    data = client.get('/api/analytics/1').get_json()
+    assert data['counts'][-1] == 2
+    assert data['total_clicks'] == 2
+    assert data['unique_clicks'] == 2
+
+def test_dashboard_reads_rollups(client):
+    """Test dashboard click counts come from the rollups"""
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+
+    with app.app_context():
+        db.session.add(ClickTotal(url_id=1, clicks=41, unique_visitors=7))
+        db.session.commit()
+
+    response = client.get('/dashboard')
+    assert b'>41<' in response.data
+
+def test_backfill_from_click_history(client):
+    """Test backfill rebuilds rollups from existing clicks"""
+    start = datetime(2024, 1, 1, 10, 0)
+    with app.app_context():
+        for i, minutes in enumerate([0, 5, 70, 60 * 24]):
+            db.session.add(Click(url_id=1, ip_address=f'10.0.0.{i % 2}', clicked_at=start + timedelta(minutes=minutes)))
+        db.session.commit()
+
+        assert rollups.backfill() == 4
+
+        hourly = ClickRollupHourly.query.order_by(ClickRollupHourly.bucket_start).all()
+        assert [(b.clicks, b.unique_visitors) for b in hourly] == [(2, 2), (1, 1), (1, 1)]
+        daily = ClickRollupDaily.query.order_by(ClickRollupDaily.bucket_start).all()
+        assert [(b.clicks, b.unique_visitors) for b in daily] == [(3, 2), (1, 1)]
+        total = ClickTotal.query.one()
+        assert (total.clicks, total.unique_visitors) == (4, 2)
+
+def test_backfill_command(client):
+    """Test the backfill CLI command"""
+    with app.app_context():
+        db.session.add(Click(url_id=1, ip_address='10.0.0.1', clicked_at=datetime.utcnow()))
+        db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['backfill-rollups'])
+    assert 'Rolled up 1 clicks' in result.output
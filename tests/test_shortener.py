@@ -1,5 +1,6 @@
 import pytest
 from app import app, db
+import retention
 from models import User, Url, Click
 from utils import generate_short_code, is_valid_url
 from datetime import datetime
@@ -148,7 +149,11 @@ def test_delete_url(client):
     
     response = client.post('/delete-url/1', follow_redirects=True)
     assert response.status_code == 200
+    assert client.get('/abc123').status_code == 404
     
+    # Deletion leaves a tombstone until the reclaim job runs
     with app.app_context():
         url = Url.query.get(1)
-        assert url is None
\ No newline at end of file
+        assert url.deleted_at is not None
+        assert retention.reclaim_deleted() == 1
+        assert Url.query.get(1) is None
\ No newline at end of file
@@ -0,0 +1,124 @@
+import pytest
+import time
+from cache import ResolutionCache, ResolvedUrl, MISSING
+from storage import MemoryBackend, SQLiteBackend, RedisBackend, backend_from_url
+from fake_redis import FakeRedisServer
+from flask import Flask
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
+
+@pytest.fixture
+def redis_server():
+    server = FakeRedisServer()
+    yield server
+    server.close()
+
+@pytest.fixture(params=['memory', 'sqlite', 'redis'])
+def backend(request, tmp_path):
+    if request.param == 'memory':
+        yield MemoryBackend()
+    elif request.param == 'sqlite':
+        yield SQLiteBackend(str(tmp_path / 'storage.db'))
+    else:
+        server = FakeRedisServer()
+        yield RedisBackend(port=server.port)
+        server.close()
+
+def test_get_set_delete(backend):
+    """Test basic key/value operations"""
+    assert backend.get('key') is None
+    backend.set('key', 'value')
+    assert backend.get('key') == b'value'
+    backend.delete('key')
+    assert backend.get('key') is None
+
+def test_set_and_delete_many(backend):
+    """Test the batched operations match their single-key versions"""
+    backend.set_many([('a', '1'), ('b', '2')], ttl=10)
+    assert (backend.get('a'), backend.get('b')) == (b'1', b'2')
+    assert backend.expires_at('a') - time.time() <= 10
+    backend.delete_many(['a', 'b', 'missing'])
+    assert (backend.get('a'), backend.get('b')) == (None, None)
+    backend.set_many([])
+    backend.delete_many([])
+
+def test_expiry(backend):
+    """Test keys expire after their TTL"""
+    backend.set('key', 'value', ttl=0.05)
+    assert backend.get('key') == b'value'
+    time.sleep(0.1)
+    assert backend.get('key') is None
+
+def test_incr_keeps_first_expiry(backend):
+    """Test counters start at the increment and expire as one window"""
+    assert backend.incr('hits', ttl=10) == 1
+    assert backend.incr('hits', 2, ttl=10) == 3
+    assert backend.expires_at('hits') - time.time() <= 10
+
+def test_clear_prefix(backend):
+    """Test clearing only removes keys with the prefix"""
+    backend.set('LIMITER/a', '1')
+    backend.set('other', '1')
+    backend.clear('LIMITER')
+    assert backend.get('LIMITER/a') is None
+    assert backend.get('other') == b'1'
+
+def test_sqlite_backend_is_shared(tmp_path):
+    """Test two backends on one file see each other's counters"""
+    path = str(tmp_path / 'shared.db')
+    first, second = SQLiteBackend(path), SQLiteBackend(path)
+
+    first.incr('hits', ttl=60)
+    assert second.incr('hits', ttl=60) == 2
+
+def test_backend_from_url(tmp_path, redis_server):
+    """Test storage URLs select the backend"""
+    assert isinstance(backend_from_url('memory://'), MemoryBackend)
+    assert isinstance(backend_from_url(f'sqlite:///{tmp_path}/kv.db'), SQLiteBackend)
+    redis = backend_from_url(f'redis://127.0.0.1:{redis_server.port}/0')
+    assert isinstance(redis, RedisBackend)
+    assert redis.port == redis_server.port
+
+def test_rate_limit_shared_between_apps(redis_server):
+    """Test two app instances enforce one shared limit"""
+    def make_app():
+        limited = Flask(__name__)
+        limiter = Limiter(
+            app=limited,
+            key_func=get_remote_address,
+            storage_uri='backend://',
+            storage_options={'backend': RedisBackend(port=redis_server.port)}
+        )
+
+        @limited.route('/')
+        @limiter.limit('3 per minute')
+        def index():
+            return 'ok'
+        return limited
+
+    workers = [make_app().test_client(), make_app().test_client()]
+    statuses = [workers[i % 2].get('/').status_code for i in range(5)]
+    assert statuses == [200, 200, 200, 429, 429]
+
+def test_resolution_cache_shared_tier(redis_server):
+    """Test a code cached by one worker is served to another"""
+    first = ResolutionCache(backend=RedisBackend(port=redis_server.port))
+    second = ResolutionCache(backend=RedisBackend(port=redis_server.port))
+
+    first.set('abc123', ResolvedUrl(1, 'https://example.com'))
+    first.set('nope', MISSING)
+    assert second.get('abc123') == ResolvedUrl(1, 'https://example.com')
+    assert second.get('nope') is MISSING
+    assert second.stats()['shared_hits'] == 2
+
+    first.invalidate('abc123')
+    assert second.get('abc123') is None
+
+def test_resolution_cache_survives_backend_outage():
+    """Test an unreachable backend degrades to cache misses"""
+    cache = ResolutionCache(backend=RedisBackend(port=1, timeout=0.1))
+    cache.set('abc123', ResolvedUrl(1, 'https://example.com'))
+
+    assert cache.get('abc123') == ResolvedUrl(1, 'https://example.com')
+    assert cache.get('other') is None
+    assert cache.stats()['backend_errors'] >= 2
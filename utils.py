@@ -1,7 +1,7 @@
 import string
 import random
-import requests
 import os
+from datetime import datetime, timedelta
 from urllib.parse import urlparse
 from flask import request
 
@@ -18,14 +18,54 @@ def is_valid_url(url):
     except:
         return False
 
+def encode_cursor(created_at, row_id):
+    """Encode a (created_at, id) keyset pagination position"""
+    return f'{created_at.isoformat()}_{row_id}'
+
+def decode_cursor(cursor):
+    """Decode a cursor from encode_cursor, returning None if it is malformed"""
+    try:
+        created_at, row_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (AttributeError, ValueError):
+        return None
+
+def parse_time_range(start, end):
+    """Parse ISO 8601 `from`/`to` query values into a half-open [start, end) range.
+
+    Either bound may be missing (None). A date-only `to` includes that whole
+    day. Raises ValueError for malformed values or an empty range.
+    """
+    def parse(value):
+        value = value.strip()
+        parsed = datetime.fromisoformat(value[:-1] if value.endswith('Z') else value)
+        if parsed.tzinfo is not None:
+            parsed = parsed.replace(tzinfo=None) - parsed.utcoffset()
+        return parsed, 'T' not in value and ' ' not in value
+
+    start = parse(start)[0] if start else None
+    if end:
+        end, date_only = parse(end)
+        if date_only:
+            end += timedelta(days=1)
+    else:
+        end = None
+    if start is not None and end is not None and start >= end:
+        raise ValueError('"from" must be before "to"')
+    return start, end
+
 def get_client_ip():
     """Get client's IP address, considering proxies"""
-    if request.environ.get('HTTP_X_FORWARDED_FOR'):
-        return request.environ['HTTP_X_FORWARDED_FOR'].split(',')[0]
-    elif request.environ.get('HTTP_X_REAL_IP'):
-        return request.environ.get('HTTP_X_REAL_IP')
+    return client_ip(request.environ)
+
+def client_ip(environ):
+    """Client IP address from a WSGI-style environ mapping"""
+    if environ.get('HTTP_X_FORWARDED_FOR'):
+        return environ['HTTP_X_FORWARDED_FOR'].split(',')[0]
+    elif environ.get('HTTP_X_REAL_IP'):
+        return environ.get('HTTP_X_REAL_IP')
     else:
-        return request.environ.get('REMOTE_ADDR')
+        return environ.get('REMOTE_ADDR')
 
 def get_ip_location(ip_address):
     """Get geolocation for IP address"""
@@ -33,6 +73,8 @@ def get_ip_location(ip_address):
     if not api_key:
         return None
     
+    # Imported here so the redirect path does not pay for it on cold start
+    import requests
     try:
         response = requests.get(
             f'https://ipapi.co/{ip_address}/json/',